@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Benchmarks for the prediction pipeline
+
+Run from the repository root, e.g. python bin/benchmark.py routing
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import httpx
+import networkx as nx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrolinkTimes import api  # noqa: E402
+from metrolinkTimes.api import GraphUpdater  # noqa: E402
+from metrolinkTimes.tramGraph import TramGraph  # noqa: E402
+from metrolinkTimes.tramMatching import TramBuckets  # noqa: E402
+from metrolinkTimes.tramRecords import Tram  # noqa: E402
+from tests.replay import NetworkSimulator  # noqa: E402
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        if (best is None) or elapsed < best:
+            best = elapsed
+    return best
+
+
+def report(name, baseline, optimised):
+    print(f"{name}")
+    print(f"  before: {baseline * 1000:10.2f} ms")
+    print(f"  after:  {optimised * 1000:10.2f} ms")
+    print(f"  speedup: {baseline / optimised:9.1f}x")
+
+
+def benchmarkRouting(args):
+    """Per-tram A* against the precomputed routing table"""
+    start = time.perf_counter()
+    graph = TramGraph()
+    print(f"Building the routing table took {time.perf_counter() - start:.2f}s")
+
+    nodes = list(nx.nodes(graph.DG))
+    stations = sorted(graph.getStations())
+    pairs = [
+        (nodes[i % len(nodes)], stations[i * 7 % len(stations)])
+        for i in range(args.trams)
+    ]
+
+    def astarDestPlatform(startPlatform, dest):
+        closestPlatform = None
+        distance = None
+        for platformID in nx.nodes(graph.DG):
+            if graph.DG.nodes[platformID]["stationName"] != dest:
+                continue
+            try:
+                length = nx.astar_path_length(
+                    graph.DG, source=startPlatform, target=platformID
+                )
+                if (distance is None) or length < distance:
+                    closestPlatform = platformID
+                    distance = length
+            except nx.NetworkXNoPath:
+                pass
+        return closestPlatform
+
+    def astar():
+        for startPlatform, dest in pairs:
+            destPlatform = astarDestPlatform(startPlatform, dest)
+            if destPlatform is not None:
+                nx.astar_path(graph.DG, source=startPlatform, target=destPlatform)
+
+    def table():
+        for startPlatform, dest in pairs:
+            destPlatform = graph.getDestPlatform(startPlatform, dest)
+            if destPlatform is not None:
+                graph.getRoute(startPlatform, destPlatform)
+
+    report(
+        f"Routing {len(pairs)} trams",
+        timed(astar, args.repeat),
+        timed(table, args.repeat),
+    )
+
+
+def replayCycles(bodies, **kwargs):
+    """Replay bodies through a new graph, returning it and the ms per cycle
+
+    The first cycle has nothing to match against, so it isn't timed.
+    """
+    updater = GraphUpdater(TramGraph(**kwargs))
+    updater.process_raw(bodies[0])
+    start = time.perf_counter()
+    for body in bodies[1:]:
+        updater.process_raw(body)
+    elapsed = time.perf_counter() - start
+    updater.executor.shutdown()
+    return updater.graph, elapsed / (len(bodies) - 1) * 1000
+
+
+def benchmarkCycle(args):
+    """Full pipeline cycles over replayed snapshots"""
+    bodies = list(NetworkSimulator(waves=args.waves).payloads(args.cycles))
+
+    for incremental in [True, False]:
+        _, perCycle = replayCycles(bodies, incremental=incremental)
+        mode = "incremental" if incremental else "full"
+        print(f"{mode:12} {len(bodies) - 1} cycles: {perCycle:8.2f} ms/cycle")
+
+
+def benchmarkMatching(args):
+    """Matching due trams against a busy platform's predicted arrivals"""
+    dests = ["Altrincham", "Bury", "Eccles", "Piccadilly", "Rochdale Town Centre"]
+    carriages = ["Single", "Double"]
+    trams = [
+        Tram(dests[i % len(dests)], None, carriages[i // 7 % 2], wait=i)
+        for i in range(args.trams)
+    ]
+    # Every due tram has to be checked against the matches so far, and
+    # trams starting here have nothing to match at all
+    due = [
+        Tram(dests[i % len(dests)], None, carriages[i % 3 // 2])
+        for i in range(args.trams // 10)
+    ] + [Tram("Ashton-Under-Lyne", None, "Double")] * 5
+
+    def scan():
+        matched = []
+        for tram in due:
+            for pTram in trams:
+                if pTram in matched:
+                    continue
+                if (tram.dest == pTram.dest) and (tram.carriages == pTram.carriages):
+                    matched.append(pTram)
+                    break
+
+    def buckets():
+        pTrams = TramBuckets(trams)
+        for tram in due:
+            pTrams.take(tram)
+
+    report(
+        f"Matching {len(due)} due trams against {len(trams)} predictions",
+        timed(scan, args.repeat),
+        timed(buckets, args.repeat),
+    )
+
+
+def benchmarkRequests(args):
+    """Request latency of the read endpoints in polling mode"""
+    bodies = list(NetworkSimulator(waves=args.waves).payloads(args.cycles))
+    graph, _ = replayCycles(bodies)
+
+    # Serve from the replayed graph without starting the update loop
+    os.environ["METROLINK_MODE"] = "polling"
+    api.graph = graph
+    api.graph_updater = GraphUpdater(graph)
+
+    station = "Piccadilly"
+    platform = graph.getStationPlatforms(station)[0]
+    paths = [
+        "/",
+        f"/station/{station}/",
+        f"/station/{station}/?include_departed=true",
+        f"/station/{station}/{platform}/?meta=true&departed=true",
+        f"/homeassistant/station/{station}/",
+        f"/homeassistant/station/{station}/outgoing/",
+        "/debug/",
+    ]
+
+    async def run():
+        # In process, so the timings are the app's and not the network's
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://b") as c:
+            for path in paths:
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    for _ in range(100):
+                        response = await c.get(path)
+                        assert response.status_code == 200, response.text
+                    elapsed = time.perf_counter() - start
+                    if (best is None) or elapsed < best:
+                        best = elapsed
+                print(f"{path:60} {best / 100 * 1000:8.3f} ms/request")
+
+    asyncio.run(run())
+    api.graph_updater.executor.shutdown()
+
+
+BENCHMARKS = {
+    "cycle": benchmarkCycle,
+    "matching": benchmarkMatching,
+    "requests": benchmarkRequests,
+    "routing": benchmarkRouting,
+}
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--trams", type=int, default=400)
+    parser.add_argument("--cycles", type=int, default=60)
+    parser.add_argument("--waves", type=int, default=3)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
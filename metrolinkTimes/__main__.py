@@ -1,16 +1,25 @@
 """Main entry point for the Metrolink Times FastAPI application."""
 
+import asyncio
 import json
 import logging
+import multiprocessing
+import os
+import threading
 from pathlib import Path
 from typing import Any
 
 import uvicorn
 
+from metrolinkTimes import api
 from metrolinkTimes.api import app
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait before starting the poller again after it exits, so one
+# that fails as it starts doesn't spin
+POLLER_RESTART_DELAY = 5
+
 
 def load_config() -> dict[str, Any]:
     """Load configuration from file with fallback to defaults."""
@@ -26,6 +35,7 @@ def load_config() -> dict[str, Any]:
         "port": 5050,
         "host": "0.0.0.0",
         "Access-Control-Allow-Origin": "*",
+        "workers": 1,
     }
 
     for config_path in config_paths:
@@ -47,6 +57,38 @@ def load_config() -> dict[str, Any]:
     return default_config
 
 
+def run_poller() -> None:
+    """Poll TfGM and publish each cycle's snapshot for the serving workers."""
+    # Forked from the process that starts the workers, so told apart here
+    os.environ["METROLINK_MODE"] = "poller"
+    _, updater = api.get_graph()
+    updater.store = api.get_snapshot_store()
+    updater.checkpoints = api.get_checkpoint_file()
+    asyncio.run(updater.update_loop())
+
+
+def supervise_poller(stopping: threading.Event) -> None:
+    """Run the poller, starting it again whenever it exits, until stopping."""
+    # Forked, so it has the graph this process imported before it became a
+    # worker, and needn't import it again
+    context = multiprocessing.get_context("fork")
+    while not stopping.is_set():
+        poller = context.Process(target=run_poller, name="poller", daemon=True)
+        poller.start()
+        while poller.is_alive() and not stopping.is_set():
+            poller.join(timeout=1)
+        if poller.is_alive():
+            poller.terminate()
+            poller.join()
+            return
+
+        logger.error(
+            f"Poller exited with code {poller.exitcode}, "
+            f"restarting in {POLLER_RESTART_DELAY}s"
+        )
+        stopping.wait(POLLER_RESTART_DELAY)
+
+
 def main() -> None:
     """Main entry point for the FastAPI application."""
     # Setup basic logging
@@ -60,10 +102,41 @@ def main() -> None:
 
     logger.info(f"Starting Metrolink Times API on {config['host']}:{config['port']}")
 
-    # Run the FastAPI app with uvicorn
-    uvicorn.run(
-        app, host=config["host"], port=config["port"], log_level="info", access_log=True
+    workers = config["workers"]
+    if workers == 1 or not api.should_use_polling_mode():
+        # Run the FastAPI app with uvicorn
+        uvicorn.run(
+            app,
+            host=config["host"],
+            port=config["port"],
+            log_level="info",
+            access_log=True,
+        )
+        return
+
+    # One process polls TfGM and runs the graph, and the workers serve what
+    # it publishes, so there's one set of predictions however many serve them
+    logger.info(f"Starting a poller and {workers} serving workers")
+    os.environ["METROLINK_MODE"] = "worker"
+    # Without the poller the workers would go on serving its last snapshot
+    # with nothing to replace it, so it's started again if it ever exits
+    stopping = threading.Event()
+    supervisor = threading.Thread(
+        target=supervise_poller, args=(stopping,), name="poller-supervisor"
     )
+    supervisor.start()
+    try:
+        uvicorn.run(
+            "metrolinkTimes.api:app",
+            host=config["host"],
+            port=config["port"],
+            workers=workers,
+            log_level="info",
+            access_log=True,
+        )
+    finally:
+        stopping.set()
+        supervisor.join()
 
 
 if __name__ == "__main__":
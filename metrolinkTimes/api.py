@@ -1,18 +1,29 @@
 #!/usr/bin/python3
 import asyncio
+import hashlib
 import json
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Any
 
-from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
-from metrolinkTimes.tfgmMetrolinksAPI import TFGMMetrolinksAPI
+from metrolinkTimes.checkpointFile import CheckpointFile
+from metrolinkTimes.graphReader import PublishedGraph
+from metrolinkTimes.responseCache import SELF_LINK, ResponseCache, encode
+from metrolinkTimes.snapshotStore import DEFAULT_SNAPSHOT_FILE, SNAPSHOT_STORES
+from metrolinkTimes.streamHub import StreamHub
+from metrolinkTimes.tfgmCache import TfGMCache
+from metrolinkTimes.tfgmMetrolinksAPI import NOT_MODIFIED, TFGMMetrolinksAPI
+from metrolinkTimes.tfgmSnapshot import TfGMSnapshot
 
 # Configure logging
 logFormat = "%(asctime)s %(levelname)s %(pathname)s %(lineno)s %(message)s"
@@ -24,6 +35,12 @@ if Path(logFile).parent.exists():
 else:
     logging.basicConfig(format=logFormat, level=logLevel)
 
+# Seconds a response may be cached for when the next update can't be
+# estimated, overridden by the cache_max_age config key
+DEFAULT_MAX_AGE = 5
+# Seconds between serving workers checking for a new snapshot
+FOLLOW_INTERVAL = 0.25
+
 
 # Pydantic models for API responses
 class TramPrediction(BaseModel):
@@ -59,6 +76,7 @@ class DebugInfo(BaseModel):
     missingAverages: dict[str, list[Any]]  # edges are tuples, platforms are strings
     trams: dict[str, dict[str, list[dict[str, Any]]]]
     stations: dict[str, dict[str, dict[str, Any]]] | None = None
+    cycles: dict[str, Any] | None = None
 
 
 # GraphUpdater class - only available in polling mode
@@ -67,145 +85,159 @@ TramGraph = None
 
 # Try to import TramGraph - only available when not in Lambda mode
 try:
+    # Lambda and the workers behind a poller never build a graph, so needn't
+    # pay for importing networkx
+    if "AWS_LAMBDA_FUNCTION_NAME" in os.environ:
+        raise ImportError("TramGraph isn't used on Lambda")
+    if os.getenv("METROLINK_MODE", "").lower() == "worker":
+        raise ImportError("TramGraph isn't used by workers")
     from metrolinkTimes.tramGraph import TramGraph
 
     class GraphUpdater:
         def __init__(self, graph):  # Removed type annotation to avoid NameError
-            self.api = TFGMMetrolinksAPI()
+            self.api = TFGMMetrolinksAPI(config)
             self.graph = graph
-            self.stationMappings = {
-                "Ashton-under-Lyne": "Ashton-Under-Lyne",
-                "Deansgate Castlefield": "Deansgate - Castlefield",
-                "Deansgate": "Deansgate - Castlefield",
-                "Ashton": "Ashton-Under-Lyne",
-                "MCUK": "MediaCityUK",
-                "Newton Heath": "Newton Heath and Moston",
-                "Victoria Millgate Siding": "Victoria",
-                "Rochdale Stn": "Rochdale Railway Station",
-                "Trafford Centre": "The Trafford Centre",
-                "intu Trafford Centre": "The Trafford Centre",
-                "Wythen. Town": "Wythenshawe Town Centre",
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="graph-updater"
+            )
+            self.fingerprint = None
+            # Validators of the last body the graph processed, for
+            # conditional fetches
+            self.validators = None
+            self.cycleStats = {
+                "polls": 0,
+                "processed": 0,
+                "unchanged": 0,
+                "notModified": 0,
+                "failed": 0,
+                "lastProcessTime": None,
+                "cycleInterval": None,
             }
+            self.lastCycleAt = None
+            # ETags carry the epoch of whichever process ran the cycles
+            self.epoch = ETAG_EPOCH
+            # Where the poller publishes snapshots for the serving workers
+            self.store = None
+            # Where what the graph has learned is kept across restarts
+            self.checkpoints = None
+            self.stationNames = frozenset(self.graph.getStations())
+
+        async def update_async(self):
+            # Only the network wait happens on the event loop. Decoding and
+            # the graph pipeline run on the updater's own worker thread so
+            # requests keep being served while a cycle is processed
+            self.cycleStats["polls"] += 1
+            fetched = await self.api.fetchRawAsync(self.validators)
+
+            if fetched is None:
+                self.cycleStats["failed"] += 1
+                return
 
-        def update(self):
-            data = self.api.getData()
+            # TfGM only refreshes every few seconds, so most polls return the
+            # same snapshot and the whole pipeline can be skipped
+            if fetched is NOT_MODIFIED:
+                self.cycleStats["notModified"] += 1
+                logging.info("TfGM data not modified, skipping cycle")
+                return
 
-            if data is None:
+            body, validators = fetched
+            fingerprint = hashlib.blake2b(body, digest_size=16).digest()
+            if fingerprint == self.fingerprint:
+                self.validators = validators
+                self.cycleStats["unchanged"] += 1
+                logging.info("TfGM data unchanged, skipping cycle")
                 return
 
-            tramsVia = []
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(self.executor, self.process_raw, body)
+            except Exception:
+                # The cycle may have stopped after some platforms took the
+                # new PID data, so have the next one go over every platform
+                self.cycleStats["failed"] += 1
+                self.graph.dirtyNodes.update(self.graph.state)
+                raise
+            streams.publish(self.graph.getSnapshot())
+            # Only once the graph has the body, so a failed cycle is fetched
+            # in full next time rather than answered with a 304
+            self.validators = validators
+            self.fingerprint = fingerprint
+            self.cycleStats["processed"] += 1
+            self.cycleStats["lastProcessTime"] = time.perf_counter() - start
+
+            # Smoothed time between cycles, to tell clients when to expect
+            # the next one
+            if self.lastCycleAt is not None:
+                interval = start - self.lastCycleAt
+                cycleInterval = self.cycleStats["cycleInterval"]
+                if cycleInterval is None:
+                    cycleInterval = interval
+                self.cycleStats["cycleInterval"] = (3 * cycleInterval + interval) / 4
+            self.lastCycleAt = start
+
+            if self.store is not None:
+                await loop.run_in_executor(self.executor, self.publish)
+
+            if (self.checkpoints is not None) and self.checkpoints.due():
+                await loop.run_in_executor(self.executor, self.saveCheckpoint)
+
+        def publish(self):
+            """Write the latest snapshot for the serving workers to read"""
+            self.store.write(
+                {
+                    "epoch": self.epoch,
+                    "snapshot": self.graph.getSnapshot(),
+                    "cycleStats": dict(self.cycleStats),
+                    "topology": self.graph.topology,
+                }
+            )
 
-            for station in data:
-                for platform in data[station]:
-                    nodeID = f"{station}_{platform}"
-                    if nodeID not in self.graph.getNodes():
-                        logging.error(f"ERROR: Unknown platform {nodeID}")
-                        continue
+        def saveCheckpoint(self):
+            self.checkpoints.save(self.graph.getCheckpoint())
 
-                    pidTramData = []
-                    message = None
-                    updateTime = None
+        def restoreCheckpoint(self):
+            """Carry on from the last checkpoint, if it's recent enough"""
+            checkpoint = self.checkpoints.load()
+            if checkpoint is not None:
+                self.graph.restoreCheckpoint(checkpoint)
+                logging.info(f"Restored graph from {self.checkpoints.path}")
 
-                    apiPID = data[station][platform][0]
-                    if not (
-                        apiPID["MessageBoard"].startswith("^F0")
-                        or (apiPID["MessageBoard"] == "<no message>")
-                    ):
-                        message = apiPID["MessageBoard"]
+        def maxAge(self, snapshot):
+            return cycle_max_age(self.cycleStats, snapshot)
 
-                    if message is not None:
-                        message = message.replace("^$", "")
+        def process_raw(self, body):
+            self.process(self.api.parseData(body))
 
-                    updateTime = datetime.strptime(
-                        apiPID["LastUpdated"], "%Y-%m-%dT%H:%M:%SZ"
-                    )
+        def process(self, data):
+            tfgm = TfGMSnapshot(data, self.stationNames)
 
-                    if self.graph.getLastUpdateTime(nodeID) == updateTime:
-                        return
-
-                    for i in range(4):
-                        if apiPID[f"Dest{i}"] != "":
-                            stationName = apiPID[f"Dest{i}"]
-                            validDests = list(self.graph.getStations()) + [
-                                "Terminates Here",
-                                "See Tram Front",
-                                "Not in Service",
-                            ]
-                            viaName = None
-
-                            if " via " in stationName:
-                                splitName = stationName.split(" via ")
-                                stationName = splitName[0]
-                                viaName = splitName[1]
-
-                            if stationName in self.stationMappings:
-                                stationName = self.stationMappings[stationName]
-                            if viaName in self.stationMappings:
-                                viaName = self.stationMappings[viaName]
-                                if viaName not in tramsVia:
-                                    tramsVia.append(viaName)
-
-                            if stationName not in validDests:
-                                logging.error(f"Unknown station {stationName}")
-                                continue
-                            if (viaName is not None) and (viaName not in validDests):
-                                logging.error(f"Unknown station {viaName}")
-                                viaName = None
-
-                            pidTramData.append(
-                                {
-                                    "dest": stationName,
-                                    "via": viaName,
-                                    "carriages": apiPID[f"Carriages{i}"],
-                                    "status": apiPID[f"Status{i}"],
-                                    "wait": int(apiPID[f"Wait{i}"]),
-                                }
-                            )
+            for station, platforms in tfgm.stations.items():
+                for platform, pid in platforms.items():
+                    nodeID = self.graph.getNode(station, platform)
+                    if nodeID is None:
+                        logging.error(f"ERROR: Unknown platform {station}_{platform}")
+                        continue
 
                     self.graph.updatePlatformPID(
-                        nodeID, pidTramData, message, updateTime
+                        nodeID, list(pid.pidTrams), pid.message, pid.updateTime
                     )
 
-            self.graph.decodePIDs()
-            self.graph.clearOldDeparted()
-            self.graph.locateDepartingTrams()
-            self.graph.locateTramsAt()
-            self.graph.clearNodePredictions()
-
-            self.graph.predictTramTimes(["tramsHere", "tramsDeparted"])
-            self.graph.debounceNew()
-            self.graph.gatherTramPredictions(["tramsHere", "tramsDeparted"])
-            self.graph.locateApproachingTrams()
-            self.graph.predictTramTimes(["tramsApproaching"])
-            self.graph.gatherTramPredictions(["tramsApproaching"])
-            self.graph.locateApproachingTrams()
-            self.graph.clearNodePredictions()
-            self.graph.gatherTramPredictions(
-                ["tramsHere", "tramsDeparted", "tramsApproaching"]
-            )
-            self.graph.finalisePredictions()
-            self.graph.setLocalUpdateTime(datetime.now())
+            self.graph.processCycle()
+            # Re-render what was being asked for before requests come in
+            responses.warm(self.graph.getSnapshot())
 
             # Logging stats
-            tramsAts = self.graph.getTramsHeres()
-            tramsAt = sum(len(tramsAts[node]) for node in tramsAts)
-
-            tramsDeparteds = self.graph.getTramsDeparteds()
-            tramsDeparted = sum(len(tramsDeparteds[node]) for node in tramsDeparteds)
-
-            tramsStartings = self.graph.getTramsStarting()
-            tramsStarting = sum(len(tramsStartings[node]) for node in tramsStartings)
-            platformsStarting = sum(
-                1 for node in tramsStartings if len(tramsStartings[node])
-            )
-            stationsStarting = {
-                self.graph.DG.nodes[node]["stationName"]
-                for node in tramsStartings
-                if len(tramsStartings[node])
-            }
-
-            logging.info(f"Nodes without average: {len(self.graph.nodesNoAvDwell())}")
-            logging.info(f"Edges without average: {len(self.graph.edgesNoAvTrans())}")
+            snapshot = self.graph.getSnapshot()
+            platforms = snapshot.platforms.values()
+            tramsAt = sum(len(p.tramsHere) for p in platforms)
+            tramsDeparted = sum(len(p.tramsDeparted) for p in platforms)
+            tramsStarting = sum(len(p.tramsApproaching) for p in platforms)
+            platformsStarting = sum(1 for p in platforms if p.tramsApproaching)
+            stationsStarting = {p.stationName for p in platforms if p.tramsApproaching}
+
+            logging.info(f"Nodes without average: {len(snapshot.nodesNoAvDwell())}")
+            logging.info(f"Edges without average: {len(snapshot.edgesNoAvTrans())}")
             logging.info(f"Trams at stations: {tramsAt}")
             logging.info(f"Trams departed stations: {tramsDeparted}")
             logging.info(f"Trams yet to start: {tramsStarting}")
@@ -215,51 +247,171 @@ try:
             logging.info(
                 f"Stations with trams starting ({len(stationsStarting)}/{len(self.graph.getStations())}): {stationsStarting}"
             )
-            logging.info(f"Trams are going via {tramsVia}")
+            tramsVia = {
+                tram.via
+                for platforms in tfgm.stations.values()
+                for pid in platforms.values()
+                for tram in pid.pidTrams
+                if tram.via is not None
+            }
+            logging.info(f"Trams are going via {sorted(tramsVia)}")
 
         async def update_loop(self):
-            while True:
-                try:
-                    logging.info("Starting TfGM API poll cycle")
-                    self.update()
-                    logging.info("Completed TfGM API poll cycle")
-                except Exception as e:
-                    logging.error(f"Error in update loop: {e}")
-                await asyncio.sleep(1)
+            try:
+                if self.checkpoints is not None:
+                    loop = asyncio.get_running_loop()
+                    await loop.run_in_executor(self.executor, self.restoreCheckpoint)
+
+                while True:
+                    try:
+                        logging.info("Starting TfGM API poll cycle")
+                        await self.update_async()
+                        logging.info("Completed TfGM API poll cycle")
+                    except Exception as e:
+                        logging.error(f"Error in update loop: {e}")
+                    await asyncio.sleep(1)
+            finally:
+                await self.api.aclose()
 
 except ImportError:
-    # In Lambda mode, TramGraph is not available
-    logging.info("TramGraph not available - running in Lambda mode")
+    # In Lambda mode and workers, TramGraph is not available
+    logging.info("TramGraph not available - not running a graph")
     GraphUpdater = None
     pass
 
 
+def cycle_max_age(cycle_stats, snapshot):
+    """Whole seconds until the cycle after snapshot is expected"""
+    cycleInterval = cycle_stats.get("cycleInterval")
+    if cycleInterval is None:
+        return config.get("cache_max_age", DEFAULT_MAX_AGE)
+    age = (datetime.now() - snapshot.localUpdateTime).total_seconds()
+    return max(0, int(cycleInterval - age))
+
+
+class SnapshotFollower:
+    """Serves the snapshots a GraphUpdater in another process publishes
+
+    Workers behind a poller check the store in the background, and on-demand
+    instances as requests come in. Neither networkx nor TfGM is needed, as
+    the graph's topology is published along with its snapshots.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.graph = None
+        self.epoch = ETAG_EPOCH
+        self.cycleStats = {}
+        self.background = False
+        self.lastChecked = None
+
+    def follow(self):
+        """Serve the store's newest snapshot, returning it if it's new"""
+        published = self.store.read()
+        if published is None:
+            return None
+
+        if published["epoch"] != self.epoch:
+            # The poller has restarted, and its versions with it
+            responses.restart()
+            self.epoch = published["epoch"]
+        if self.graph is None:
+            self.graph = PublishedGraph(published["topology"])
+        self.cycleStats = published["cycleStats"]
+        snapshot = published["snapshot"]
+        self.graph.setSnapshot(snapshot)
+        responses.warm(snapshot)
+        return snapshot
+
+    def refresh(self):
+        """Check for a newer snapshot as a request comes in
+
+        Only done without the background loop, and at most every
+        FOLLOW_INTERVAL seconds.
+        """
+        if self.background:
+            return
+        now = time.monotonic()
+        if (self.lastChecked is not None) and now - self.lastChecked < FOLLOW_INTERVAL:
+            return
+        self.lastChecked = now
+        self.follow()
+
+    async def follow_loop(self):
+        self.background = True
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                snapshot = await loop.run_in_executor(None, self.follow)
+                if snapshot is not None:
+                    streams.publish(snapshot)
+            except Exception as e:
+                logging.error(f"Error reading published snapshot: {e}")
+            await asyncio.sleep(FOLLOW_INTERVAL)
+
+    def maxAge(self, snapshot):
+        return cycle_max_age(self.cycleStats, snapshot)
+
+
 # Global instances - initialized lazily
 graph = None
 graph_updater = None
+tfgm_cache = None
 
 
 def get_graph():
-    """Get or create the global graph instance"""
+    """Get or create the global graph instance
+
+    When serving another process's snapshots the graph is None until the
+    first one has been read.
+    """
     global graph, graph_updater
-    if graph is None:
-        if TramGraph is None:
-            raise RuntimeError("TramGraph not available in Lambda mode")
-        graph = TramGraph()
-        graph_updater = GraphUpdater(graph)
+    if graph_updater is None:
+        if reads_snapshot_store():
+            graph_updater = SnapshotFollower(get_snapshot_store())
+        else:
+            if TramGraph is None:
+                raise RuntimeError("TramGraph not available in Lambda mode")
+            graph = TramGraph(
+                statsWindow=config.get("stats_window", 5),
+                changeHistory=config.get("change_history", 60),
+            )
+            graph_updater = GraphUpdater(graph)
+    if isinstance(graph_updater, SnapshotFollower):
+        return graph_updater.graph, graph_updater
     return graph, graph_updater
 
 
+def get_tfgm_cache():
+    """Get or create the TfGM data cache shared by on-demand requests"""
+    global tfgm_cache
+    if tfgm_cache is None:
+        tfgm_cache = TfGMCache(
+            TFGMMetrolinksAPI(config),
+            ttl=config.get("ondemand_ttl", 5),
+            staleWhileRevalidate=config.get("ondemand_stale_while_revalidate", 15),
+            prepare=TfGMSnapshot,
+        )
+    return tfgm_cache
+
+
 def should_use_polling_mode():
-    """Check if we should run in polling mode or on-demand mode"""
+    """Check if we should serve a graph's snapshots or fetch on demand"""
+    return reads_snapshot_store() or runs_graph()
+
+
+def runs_graph():
+    """Check if this process polls TfGM and runs its own graph"""
     # If TramGraph is not available, we must use on-demand mode
     if TramGraph is None:
         return False
 
     # Check environment variable first
     mode = os.getenv("METROLINK_MODE", "").lower()
-    if mode in ["polling", "container"]:
+    if mode in ["polling", "container", "poller"]:
         return True
+    elif mode == "worker":
+        return False
     elif mode in ["ondemand", "lambda"]:
         return False
 
@@ -268,6 +420,41 @@ def should_use_polling_mode():
     return polling_enabled
 
 
+def is_serving_worker():
+    """Whether this process serves snapshots published by a separate poller"""
+    return os.getenv("METROLINK_MODE", "").lower() == "worker"
+
+
+def reads_snapshot_store():
+    """Whether this process serves snapshots from the snapshot store
+
+    Workers always do. On-demand instances do when a store is configured,
+    instead of fetching from TfGM.
+    """
+    if is_serving_worker():
+        return True
+    return ("snapshot_backend" in config) and not runs_graph()
+
+
+def get_checkpoint_file():
+    """Where the graph is checkpointed, or None if checkpoint_file isn't set"""
+    path = config.get("checkpoint_file")
+    if path is None:
+        return None
+    return CheckpointFile(
+        path,
+        interval=config.get("checkpoint_interval", 30),
+        maxAge=config.get("checkpoint_max_age", 300),
+    )
+
+
+def get_snapshot_store():
+    backend = config.get("snapshot_backend", "file")
+    if backend not in SNAPSHOT_STORES:
+        raise ValueError(f"Unknown snapshot backend {backend}")
+    return SNAPSHOT_STORES[backend](config.get("snapshot_file", DEFAULT_SNAPSHOT_FILE))
+
+
 # Load CORS configuration
 def load_config():
     # Look for config file in multiple locations (local first, then system)
@@ -303,9 +490,19 @@ async def lifespan(app: FastAPI):
     # Startup
     task = None
     try:
-        if should_use_polling_mode():
+        if is_serving_worker():
+            logging.info("Starting as a worker serving the poller's snapshots")
+            _, updater = get_graph()
+            task = asyncio.create_task(updater.follow_loop())
+        elif runs_graph():
             logging.info("Starting in polling mode (continuous updates)")
             _, updater = get_graph()
+            if (
+                os.getenv("METROLINK_MODE", "").lower() == "poller"
+                or "snapshot_backend" in config
+            ):
+                updater.store = get_snapshot_store()
+            updater.checkpoints = get_checkpoint_file()
             task = asyncio.create_task(updater.update_loop())
         else:
             logging.info("Starting in on-demand mode (Lambda/serverless)")
@@ -323,6 +520,9 @@ async def lifespan(app: FastAPI):
                 await task
             except asyncio.CancelledError:
                 pass
+        # On-demand fetches keep a connection open to TfGM
+        if tfgm_cache is not None:
+            await tfgm_cache.api.aclose()
 
 
 # Create FastAPI app
@@ -346,7 +546,17 @@ app.add_middleware(
 @app.get("/", response_model=dict[str, list[str]])
 async def root():
     """Get available API paths"""
-    return {"paths": ["debug/", "health/", "station/", "homeassistant/"]}
+    return {
+        "paths": [
+            "debug/",
+            "health/",
+            "network/",
+            "changes/",
+            "station/",
+            "stream/",
+            "homeassistant/",
+        ]
+    }
 
 
 async def ensure_fresh_data():
@@ -358,6 +568,11 @@ async def ensure_fresh_data():
 
     # Polling mode: use graph-based approach
     tram_graph, updater = get_graph()
+    if isinstance(updater, SnapshotFollower):
+        updater.refresh()
+        tram_graph = updater.graph
+        if tram_graph is None:
+            raise HTTPException(status_code=503, detail="Service not yet initialized")
 
     # Check if data is fresh
     now = datetime.now()
@@ -371,6 +586,331 @@ async def ensure_fresh_data():
         raise HTTPException(status_code=503, detail="Service not updating")
 
 
+# Snapshot versions start again when the process does, so ETags carry when
+# it started too
+ETAG_EPOCH = f"{time.time_ns():x}"
+
+
+def etag_matches(request, etag):
+    """Whether the client's If-None-Match already has etag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def cache_headers(etag, max_age):
+    return {"ETag": etag, "Cache-Control": f"max-age={max_age}"}
+
+
+def snapshot_cache_headers(snapshot, *extra):
+    """Caching headers for a response built from a polling-mode snapshot
+
+    The response can be cached until the next cycle is expected.
+    """
+    _, updater = get_graph()
+    tag = "-".join([updater.epoch, str(snapshot.version), *map(str, extra)])
+    return cache_headers(f'"{tag}"', updater.maxAge(snapshot))
+
+
+def tfgm_cache_headers(tfgm):
+    """Caching headers for a response built from TfGM data in on-demand mode
+
+    Weak, as on-demand responses can include the time they were made.
+    """
+    return cache_headers(
+        f'W/"{tfgm.digest}"', config.get("cache_max_age", DEFAULT_MAX_AGE)
+    )
+
+
+def tfgm_tram(tram):
+    """A tram on a PID as on-demand responses show it"""
+    return {
+        "destination": tram.dest,
+        "via": tram.via,
+        "carriages": tram.carriages,
+        "status": tram.status,
+        "wait": tram.wait,
+    }
+
+
+def check_etag(request, response, headers):
+    """Tag the response, or return a 304 if the client already has it"""
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+# Polling-mode responses only change once per cycle, so they are rendered
+# from the snapshot and kept as encoded JSON until the next one
+responses = ResponseCache()
+
+
+def cached_response(request, name, *args, selfLink=None):
+    """Serve a rendered response from the latest snapshot"""
+    tram_graph, _ = get_graph()
+    snapshot = tram_graph.getSnapshot()
+    headers = snapshot_cache_headers(snapshot)
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    content = responses.get(snapshot, name, *args, selfLink=selfLink)
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+def render_station(snapshot, station_name, include_predictions, include_departed):
+    station = snapshot.getStation(station_name)
+    ret = {
+        "station": station_name,
+        "platforms": {},
+        "last_updated": snapshot.localUpdateTime.isoformat(),
+        "_links": {
+            "self": SELF_LINK,
+            "platforms": [
+                f"/station/{station_name}/{platform}/" for platform in station
+            ],
+        },
+    }
+
+    for platID, platform in station.items():
+        platform_data = {
+            "platform": platID,
+            "message": platform.message,
+            "last_updated": (
+                platform.updateTime.isoformat() if platform.updateTime else None
+            ),
+            "_links": {"self": f"/station/{station_name}/{platID}/"},
+        }
+
+        nodeID = f"{station_name}_{platID}"
+        if include_predictions:
+            platform_data["trams"] = snapshot.getTramsStartingAt(nodeID)
+
+        if include_departed:
+            platform_data["departed"] = snapshot.getTramsDepartedAt(nodeID)
+
+        ret["platforms"][platID] = platform_data
+
+    return ret
+
+
+def render_platform(
+    snapshot, nodeID, predictions, tram_predictions, message, meta, departed
+):
+    tram_graph, _ = get_graph()
+    platform = snapshot.platforms[nodeID]
+    ret = {"updateTime": platform.updateTime}
+
+    if predictions:
+        ret["predictions"] = snapshot.getPredictionsAt(nodeID, tram_predictions)
+        ret["here"] = snapshot.getTramsHereAt(nodeID)
+
+    if message:
+        ret["message"] = platform.message
+
+    if meta:
+        dwellTimes = snapshot.getDwellTimesAt(nodeID)
+        averageDwell = timedelta()
+        for dwellTime in dwellTimes:
+            averageDwell = averageDwell + dwellTime
+        if len(dwellTimes) > 0:
+            averageDwell = averageDwell / len(dwellTimes)
+        else:
+            averageDwell = None
+
+        pred = {}
+        for pNodeID in tram_graph.getNodePreds(nodeID):
+            pred[pNodeID] = {
+                "transitTimes": snapshot.getTransit(pNodeID, nodeID),
+                "averageTransitTime": snapshot.getAverageTransit(pNodeID, nodeID)[0],
+            }
+
+        ret.update(
+            {
+                "mapPos": {
+                    "x": tram_graph.getMapPos(nodeID)[0],
+                    "y": tram_graph.getMapPos(nodeID)[1],
+                },
+                "dwellTimes": dwellTimes,
+                "averageDwellTime": averageDwell,
+                "predecessors": pred,
+            }
+        )
+
+    if departed:
+        ret["departed"] = snapshot.getTramsDepartedAt(nodeID)
+
+    return ret
+
+
+def render_homeassistant_station(snapshot, station_name):
+    station = snapshot.getStation(station_name)
+    stationTrams = snapshot.getStationTramsStarting(station_name)
+    platforms = {}
+    total_trams = 0
+
+    for platID, platform in station.items():
+        trams = stationTrams[platID]
+        total_trams += len(trams)
+
+        platforms[platID] = {
+            "trams": trams,
+            "message": platform.message,
+            "last_updated": (
+                platform.updateTime.isoformat() if platform.updateTime else None
+            ),
+        }
+
+    return {
+        "state": total_trams,
+        "attributes": {
+            "station_name": station_name,
+            "platforms": platforms,
+            "last_updated": snapshot.localUpdateTime.isoformat(),
+            "unit_of_measurement": "trams",
+            "friendly_name": f"Metrolink {station_name}",
+            "icon": "mdi:train",
+        },
+    }
+
+
+def homeassistant_direction(station_name, direction, trams, last_updated, message):
+    """A station's trams one way, as a Home Assistant sensor"""
+    attributes = {
+        "station_name": station_name,
+        "direction": direction,
+        "last_updated": last_updated,
+        "message": message,
+        "friendly_name": f"Metrolink {station_name} {direction.capitalize()}",
+        "icon": "mdi:train-variant",
+    }
+
+    # Add first 4 trams as individual attributes
+    for i, tram in enumerate(trams[:4]):
+        attributes[f"dest{i}"] = tram.get("dest", "")
+        attributes[f"status{i}"] = tram.get("status", "")
+        attributes[f"wait{i}"] = tram.get("wait", "")
+        attributes[f"carriages{i}"] = tram.get("carriages", "")
+
+    return {"state": len(trams), "attributes": attributes}
+
+
+def render_homeassistant_direction(snapshot, station_name, direction):
+    # In polling mode, we don't have direction info readily available
+    # This is a limitation of the current graph structure, so both
+    # directions list every platform's trams
+    all_trams = []
+    message = None
+
+    for platID, trams in snapshot.getStationTramsStarting(station_name).items():
+        all_trams.extend(trams)
+
+        # Extract message from any platform that has one
+        if not message:
+            platform_message = snapshot.platforms[f"{station_name}_{platID}"].message
+            if platform_message:
+                message = platform_message
+
+    return homeassistant_direction(
+        station_name,
+        direction,
+        all_trams,
+        snapshot.localUpdateTime.isoformat(),
+        message,
+    )
+
+
+def render_tfgm_direction(station, station_name, direction):
+    # TfGM doesn't always say which way a platform's trams go, so as in
+    # polling mode both directions list every platform's trams
+    all_trams = []
+    last_updated = None
+    message = None
+
+    for pid in station.values():
+        all_trams.extend(tram.toDict() for tram in pid.pidTrams)
+
+        if not last_updated:
+            last_updated = pid.lastUpdated
+
+        if not message:
+            message = pid.message
+
+    return homeassistant_direction(
+        station_name, direction, all_trams, last_updated, message
+    )
+
+
+# Per-platform fields /network/ can return, and those it returns by default
+NETWORK_FIELDS = ("updateTime", "message", "predictions", "here", "departed")
+DEFAULT_NETWORK_FIELDS = "updateTime,message,predictions,here"
+
+
+def render_network(snapshot, fields, stations, lines, nodes=None):
+    tram_graph, updater = get_graph()
+    ret = {
+        "epoch": updater.epoch,
+        "version": snapshot.version,
+        "last_updated": snapshot.localUpdateTime.isoformat(),
+        "stations": {},
+    }
+
+    for nodeID, platform in snapshot.platforms.items():
+        if (nodes is not None) and nodeID not in nodes:
+            continue
+        if stations and platform.stationName not in stations:
+            continue
+        line = tram_graph.getLine(nodeID)
+        if lines and line not in lines:
+            continue
+
+        platform_data = {"line": line}
+        platform_data.update(render_platform_fields(snapshot, nodeID, fields))
+
+        station = ret["stations"].setdefault(platform.stationName, {})
+        station[platform.platformID] = platform_data
+
+    return ret
+
+
+def render_changes(snapshot, since, fields, stations, lines):
+    changed = None if since is None else snapshot.changedSince(since)
+    ret = render_network(snapshot, fields, stations, lines, changed)
+    # When since has aged out every platform is returned, to resync from
+    ret["since"] = since
+    ret["resync"] = changed is None
+    return ret
+
+
+def render_platform_fields(snapshot, node_id, fields):
+    platform = snapshot.platforms[node_id]
+    platform_data = {}
+    if "updateTime" in fields:
+        platform_data["updateTime"] = platform.updateTime
+    if "message" in fields:
+        platform_data["message"] = platform.message
+    if "predictions" in fields:
+        platform_data["predictions"] = snapshot.getPredictionsAt(node_id)
+    if "here" in fields:
+        platform_data["here"] = snapshot.getTramsHereAt(node_id)
+    if "departed" in fields:
+        platform_data["departed"] = snapshot.getTramsDepartedAt(node_id)
+    return platform_data
+
+
+# The Home Assistant endpoints have no response model, so FastAPI would have
+# encoded their timedeltas as seconds
+responses.register("network", render_network)
+responses.register("changes", render_changes)
+responses.register("station", render_station)
+responses.register("platform", render_platform)
+responses.register("homeassistant_station", render_homeassistant_station, "float")
+responses.register("homeassistant_direction", render_homeassistant_direction, "float")
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -384,7 +924,11 @@ async def health_check():
 
 
 @app.get("/debug/", response_model=DebugInfo)
-async def debug_info(meta: bool = Query(False, description="Include station metadata")):
+async def debug_info(
+    request: Request,
+    response: Response,
+    meta: bool = Query(False, description="Include station metadata"),
+):
     """Get debug information about the network state"""
     if not should_use_polling_mode():
         # Debug endpoint is not available in Lambda mode
@@ -393,21 +937,39 @@ async def debug_info(meta: bool = Query(False, description="Include station meta
         )
 
     await ensure_fresh_data()
-    tram_graph, _ = get_graph()
-    here = tram_graph.getTramsHeres()
-    dep = tram_graph.getTramsDeparteds()
-    start = tram_graph.getTramsStarting()
+    tram_graph, updater = get_graph()
+    snapshot = tram_graph.getSnapshot()
+    platforms = snapshot.platforms
+
+    # Cycle stats change with every poll, not just every cycle
+    headers = snapshot_cache_headers(snapshot, updater.cycleStats["polls"])
+    not_modified = check_etag(request, response, headers)
+    if not_modified is not None:
+        return not_modified
 
     ret = DebugInfo(
         missingAverages={
-            "platforms": tram_graph.nodesNoAvDwell(),
-            "edges": tram_graph.edgesNoAvTrans(),
+            "platforms": snapshot.nodesNoAvDwell(),
+            "edges": snapshot.edgesNoAvTrans(),
         },
         trams={
-            "here": {k: here[k] for k in here if here[k] != []},
-            "departed": {k: dep[k] for k in dep if dep[k] != []},
-            "starting": {k: start[k] for k in start if start[k] != []},
+            "here": {
+                k: snapshot.getTramsHereAt(k)
+                for k in platforms
+                if platforms[k].tramsHere
+            },
+            "departed": {
+                k: snapshot.getTramsDepartedAt(k)
+                for k in platforms
+                if platforms[k].tramsDeparted
+            },
+            "starting": {
+                k: snapshot.getTramsStartingAt(k)
+                for k in platforms
+                if platforms[k].tramsApproaching
+            },
         },
+        cycles=updater.cycleStats,
     )
 
     if meta:
@@ -419,12 +981,10 @@ async def debug_info(meta: bool = Query(False, description="Include station meta
                 stations[stationName][platID] = {
                     "x": tram_graph.getMapPos(nodeID)[0],
                     "y": tram_graph.getMapPos(nodeID)[1],
-                    "averageDwellTime": tram_graph.getAverageDwell(nodeID),
+                    "averageDwellTime": snapshot.getAverageDwell(nodeID),
                     "predecessors": {
                         pNode: {
-                            "averageTransit": tram_graph.getAverageTransit(
-                                pNode, nodeID
-                            )
+                            "averageTransit": snapshot.getAverageTransit(pNode, nodeID)
                         }
                         for pNode in tram_graph.getNodePreds(nodeID)
                     },
@@ -435,21 +995,26 @@ async def debug_info(meta: bool = Query(False, description="Include station meta
 
 
 @app.get("/station/", response_model=StationList)
-async def list_stations():
+async def list_stations(request: Request, response: Response):
     """Get list of all stations"""
     if not should_use_polling_mode():
         # Lambda mode: get stations from TfGM API directly
         try:
-            api = TFGMMetrolinksAPI()
-            data = api.getData()
-            if data is None:
+            tfgm = await get_tfgm_cache().get()
+            if tfgm is None:
                 raise HTTPException(
                     status_code=503,
                     detail="TfGM API returned no data - check API key configuration",
                 )
 
-            stations = [f"{station}/" for station in sorted(data.keys())]
+            not_modified = check_etag(request, response, tfgm_cache_headers(tfgm))
+            if not_modified is not None:
+                return not_modified
+
+            stations = [f"{station}/" for station in sorted(tfgm.stations)]
             return StationList(stations=stations)
+        except HTTPException:
+            raise
         except Exception as e:
             logging.error(f"Error fetching data from TfGM API: {e}")
             raise HTTPException(
@@ -459,14 +1024,204 @@ async def list_stations():
     # Polling mode: use graph-based approach
     await ensure_fresh_data()
     tram_graph, _ = get_graph()
+    headers = snapshot_cache_headers(tram_graph.getSnapshot())
+    not_modified = check_etag(request, response, headers)
+    if not_modified is not None:
+        return not_modified
     stations = [f"{station}/" for station in tram_graph.getStations()]
     return StationList(stations=stations)
 
 
+def split_list(value):
+    """The distinct items of a comma separated query parameter"""
+    if not value:
+        return ()
+    return tuple(sorted({item.strip() for item in value.split(",") if item.strip()}))
+
+
+def split_fields(value):
+    """The platform fields asked for, raising a 400 for unknown ones"""
+    fields = split_list(value)
+    unknown = set(fields) - set(NETWORK_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+        )
+    return fields
+
+
+@app.get("/network/", response_model=dict[str, Any])
+async def get_network(
+    request: Request,
+    fields: str = Query(
+        DEFAULT_NETWORK_FIELDS,
+        description=f"Comma separated platform fields, from {', '.join(NETWORK_FIELDS)}",
+    ),
+    stations: str | None = Query(None, description="Comma separated station names"),
+    lines: str | None = Query(None, description="Comma separated line names"),
+):
+    """Get every platform in the network in one response"""
+    if not should_use_polling_mode():
+        raise HTTPException(
+            status_code=404, detail="Network endpoint is only available in polling mode"
+        )
+
+    await ensure_fresh_data()
+    tram_graph, _ = get_graph()
+
+    fields = split_fields(fields)
+    stations = split_list(stations)
+    if not set(stations) <= set(tram_graph.getStations()):
+        raise HTTPException(status_code=404, detail="Station not found")
+
+    lines = split_list(lines)
+    if not set(lines) <= set(tram_graph.getLines()):
+        raise HTTPException(status_code=404, detail="Line not found")
+
+    return cached_response(request, "network", fields, stations, lines)
+
+
+@app.get("/changes/", response_model=dict[str, Any])
+async def get_changes(
+    request: Request,
+    since: int = Query(..., description="Version of the last response seen"),
+    epoch: str = Query(..., description="Epoch of the last response seen"),
+    fields: str = Query(
+        DEFAULT_NETWORK_FIELDS,
+        description=f"Comma separated platform fields, from {', '.join(NETWORK_FIELDS)}",
+    ),
+    stations: str | None = Query(None, description="Comma separated station names"),
+    lines: str | None = Query(None, description="Comma separated line names"),
+):
+    """Get the platforms that changed after a version of /network/"""
+    if not should_use_polling_mode():
+        raise HTTPException(
+            status_code=404, detail="Changes endpoint is only available in polling mode"
+        )
+
+    await ensure_fresh_data()
+    tram_graph, updater = get_graph()
+
+    fields = split_fields(fields)
+    stations = split_list(stations)
+    if not set(stations) <= set(tram_graph.getStations()):
+        raise HTTPException(status_code=404, detail="Station not found")
+
+    lines = split_list(lines)
+    if not set(lines) <= set(tram_graph.getLines()):
+        raise HTTPException(status_code=404, detail="Line not found")
+
+    snapshot = tram_graph.getSnapshot()
+    # Versions start again when the poller restarts, so one from another
+    # epoch says nothing about what the client has
+    if epoch != updater.epoch or snapshot.changedSince(since) is None:
+        # Every version that can't be diffed from gets the same response, so
+        # it's cached once rather than once per version clients hold
+        return cached_response(request, "changes", None, fields, stations, lines)
+
+    # Clients each poll with their own version, so diffs aren't cached
+    headers = snapshot_cache_headers(snapshot)
+    if etag_matches(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    content = encode(render_changes(snapshot, since, fields, stations, lines))
+    return Response(content=content, media_type="application/json", headers=headers)
+
+
+# Seconds between comments sent to an idle stream, so proxies don't close it
+STREAM_KEEPALIVE = 15
+
+streams = StreamHub()
+
+
+def stream_event(snapshot, nodes, fields):
+    stations = {}
+    for nodeID in sorted(nodes):
+        platform = snapshot.platforms[nodeID]
+        station = stations.setdefault(platform.stationName, {})
+        station[platform.platformID] = render_platform_fields(snapshot, nodeID, fields)
+
+    data = encode(
+        {
+            "version": snapshot.version,
+            "last_updated": snapshot.localUpdateTime.isoformat(),
+            "stations": stations,
+        }
+    )
+    return b"id: %d\nevent: platforms\ndata: %b\n\n" % (snapshot.version, data)
+
+
+@app.get("/stream/")
+async def stream_platforms(
+    fields: str = Query(
+        DEFAULT_NETWORK_FIELDS,
+        description=f"Comma separated platform fields, from {', '.join(NETWORK_FIELDS)}",
+    ),
+    stations: str | None = Query(None, description="Comma separated station names"),
+    platforms: str | None = Query(
+        None, description="Comma separated platform ATCO codes"
+    ),
+):
+    """Stream platforms as Server-Sent Events whenever a cycle changes them
+
+    The first event has every platform subscribed to. After that an event
+    only has the platforms that changed since the last one sent, so a client
+    that reads slowly gets their latest state rather than a backlog.
+    """
+    if not should_use_polling_mode():
+        raise HTTPException(
+            status_code=404, detail="Stream endpoint is only available in polling mode"
+        )
+
+    await ensure_fresh_data()
+    tram_graph, _ = get_graph()
+    snapshot = tram_graph.getSnapshot()
+
+    fields = split_fields(fields)
+
+    nodes = set()
+    for station_name in split_list(stations):
+        if station_name not in snapshot.stationNodes:
+            raise HTTPException(status_code=404, detail="Station not found")
+        nodes.update(snapshot.stationNodes[station_name])
+    if platforms:
+        # ATCO codes are unique across the network, not just within a station
+        platform_nodes = {
+            platform.platformID: node_id
+            for node_id, platform in snapshot.platforms.items()
+        }
+        for platform_id in split_list(platforms):
+            if platform_id not in platform_nodes:
+                raise HTTPException(status_code=404, detail="Platform not found")
+            nodes.add(platform_nodes[platform_id])
+    if not nodes:
+        nodes = snapshot.platforms.keys()
+
+    subscriber = streams.subscribe(nodes)
+
+    async def events():
+        try:
+            while True:
+                try:
+                    changed = await subscriber.next(STREAM_KEEPALIVE)
+                except TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield stream_event(tram_graph.getSnapshot(), changed, fields)
+        finally:
+            streams.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/station/{station_name}/", response_model=dict[str, Any])
 async def get_station_info(
     station_name: str,
     request: Request,
+    response: Response,
     include_predictions: bool = Query(True, description="Include tram predictions"),
     include_departed: bool = Query(
         False, description="Include recently departed trams"
@@ -476,14 +1231,18 @@ async def get_station_info(
     if not should_use_polling_mode():
         # Lambda mode: get data directly from TfGM API
         try:
-            api = TFGMMetrolinksAPI()
-            data = api.getData()
-            if data is None:
+            tfgm = await get_tfgm_cache().get()
+            if tfgm is None:
                 raise HTTPException(status_code=503, detail="TfGM API returned no data")
 
-            if station_name not in data:
+            station = tfgm.getStation(station_name)
+            if station is None:
                 raise HTTPException(status_code=404, detail="Station not found")
 
+            not_modified = check_etag(request, response, tfgm_cache_headers(tfgm))
+            if not_modified is not None:
+                return not_modified
+
             ret = {
                 "station": station_name,
                 "platforms": {},
@@ -491,56 +1250,32 @@ async def get_station_info(
                 "_links": {
                     "self": str(request.url),
                     "platforms": [
-                        f"/station/{station_name}/{platform}/"
-                        for platform in data[station_name].keys()
+                        f"/station/{station_name}/{platform}/" for platform in station
                     ],
                 },
             }
 
-            for platform_id, platform_data_list in data[station_name].items():
-                if platform_data_list:
-                    platform_info = platform_data_list[
-                        0
-                    ]  # Get first (and usually only) entry
-
-                    platform_data = {
-                        "platform": platform_id,
-                        "message": platform_info.get("MessageBoard", "").replace(
-                            "^$", ""
-                        )
-                        if platform_info.get("MessageBoard")
-                        not in ["^F0", "<no message>"]
-                        else None,
-                        "last_updated": platform_info.get("LastUpdated"),
-                        "_links": {"self": f"/station/{station_name}/{platform_id}/"},
-                    }
-
-                    if include_predictions:
-                        # Extract tram predictions from TfGM data
-                        trams = []
-                        for i in range(4):  # TfGM API provides up to 4 tram predictions
-                            dest = platform_info.get(f"Dest{i}", "")
-                            if dest:
-                                trams.append(
-                                    {
-                                        "destination": dest,
-                                        "carriages": platform_info.get(
-                                            f"Carriages{i}", ""
-                                        ),
-                                        "status": platform_info.get(f"Status{i}", ""),
-                                        "wait": platform_info.get(f"Wait{i}", ""),
-                                    }
-                                )
-                        platform_data["trams"] = trams
-
-                    # Note: departed trams not available in direct TfGM API mode
-                    if include_departed:
-                        platform_data["departed"] = []
-
-                    ret["platforms"][platform_id] = platform_data
+            for platform_id, pid in station.items():
+                platform_data = {
+                    "platform": platform_id,
+                    "message": pid.message,
+                    "last_updated": pid.lastUpdated,
+                    "_links": {"self": f"/station/{station_name}/{platform_id}/"},
+                }
+
+                if include_predictions:
+                    platform_data["trams"] = [tfgm_tram(tram) for tram in pid.pidTrams]
+
+                # Note: departed trams not available in direct TfGM API mode
+                if include_departed:
+                    platform_data["departed"] = []
+
+                ret["platforms"][platform_id] = platform_data
 
             return ret
 
+        except HTTPException:
+            raise
         except Exception as e:
             logging.error(f"Error fetching station data from TfGM API: {e}")
             raise HTTPException(
@@ -554,41 +1289,14 @@ async def get_station_info(
     if station_name not in tram_graph.getStations():
         raise HTTPException(status_code=404, detail="Station not found")
 
-    ret = {
-        "station": station_name,
-        "platforms": {},
-        "last_updated": tram_graph.getLocalUpdateTime().isoformat(),
-        "_links": {
-            "self": str(request.url),
-            "platforms": [
-                f"/station/{station_name}/{platform}/"
-                for platform in tram_graph.getStationPlatforms(station_name)
-            ],
-        },
-    }
-
-    for platID in tram_graph.getStationPlatforms(station_name):
-        nodeID = f"{station_name}_{platID}"
-        platform_data = {
-            "platform": platID,
-            "message": tram_graph.getMessage(nodeID),
-            "last_updated": (
-                tram_graph.getLastUpdateTime(nodeID).isoformat()
-                if tram_graph.getLastUpdateTime(nodeID)
-                else None
-            ),
-            "_links": {"self": f"/station/{station_name}/{platID}/"},
-        }
-
-        if include_predictions:
-            platform_data["trams"] = tram_graph.getTramsStarting()[nodeID]
-
-        if include_departed:
-            platform_data["departed"] = tram_graph.getTramsDeparteds()[nodeID]
-
-        ret["platforms"][platID] = platform_data
-
-    return ret
+    return cached_response(
+        request,
+        "station",
+        station_name,
+        include_predictions,
+        include_departed,
+        selfLink=str(request.url),
+    )
 
 
 @app.get("/station/{station_name}/{platform_id}/", response_model=dict[str, Any])
@@ -596,6 +1304,7 @@ async def get_platform_info(
     station_name: str,
     platform_id: str,
     request: Request,
+    response: Response,
     predictions: bool = Query(True, description="Include predictions"),
     tram_predictions: bool = Query(True, description="Include tram prediction details"),
     message: bool = Query(True, description="Include platform messages"),
@@ -606,58 +1315,43 @@ async def get_platform_info(
     if not should_use_polling_mode():
         # Lambda mode: get data directly from TfGM API
         try:
-            api = TFGMMetrolinksAPI()
-            data = api.getData()
-            if data is None:
+            tfgm = await get_tfgm_cache().get()
+            if tfgm is None:
                 raise HTTPException(status_code=503, detail="TfGM API returned no data")
 
-            if station_name not in data:
+            station = tfgm.getStation(station_name)
+            if station is None:
                 raise HTTPException(status_code=404, detail="Station not found")
 
-            if platform_id not in data[station_name]:
+            pid = station.get(platform_id)
+            if pid is None:
                 raise HTTPException(status_code=404, detail="Platform not found")
 
-            platform_data_list = data[station_name][platform_id]
-            if not platform_data_list:
-                raise HTTPException(
-                    status_code=404, detail="No data available for this platform"
-                )
-
-            platform_info = platform_data_list[0]  # Get first (and usually only) entry
+            not_modified = check_etag(request, response, tfgm_cache_headers(tfgm))
+            if not_modified is not None:
+                return not_modified
 
             ret = {
                 "platform": platform_id,
                 "station": station_name,
-                "last_updated": platform_info.get("LastUpdated"),
+                "last_updated": pid.lastUpdated,
                 "_links": {"self": str(request.url)},
             }
 
             if message:
-                ret["message"] = (
-                    platform_info.get("MessageBoard", "").replace("^$", "")
-                    if platform_info.get("MessageBoard") not in ["^F0", "<no message>"]
-                    else None
-                )
+                ret["message"] = pid.message
 
             if predictions:
-                # Extract tram predictions from TfGM data
                 trams = []
-                for i in range(4):  # TfGM API provides up to 4 tram predictions
-                    dest = platform_info.get(f"Dest{i}", "")
-                    if dest:
-                        tram_data = {
-                            "destination": dest,
-                            "carriages": platform_info.get(f"Carriages{i}", ""),
-                            "status": platform_info.get(f"Status{i}", ""),
-                            "wait": platform_info.get(f"Wait{i}", ""),
+                for tram in pid.pidTrams:
+                    tram_data = tfgm_tram(tram)
+                    if tram_predictions:
+                        # Add additional prediction details if requested
+                        tram_data["predictions"] = {
+                            "wait_time": tram.wait,
+                            "status": tram.status,
                         }
-                        if tram_predictions:
-                            # Add additional prediction details if requested
-                            tram_data["predictions"] = {
-                                "wait_time": platform_info.get(f"Wait{i}", ""),
-                                "status": platform_info.get(f"Status{i}", ""),
-                            }
-                        trams.append(tram_data)
+                    trams.append(tram_data)
                 ret["predictions"] = trams
                 ret["here"] = []  # Not available in direct API mode
 
@@ -673,6 +1367,8 @@ async def get_platform_info(
 
             return ret
 
+        except HTTPException:
+            raise
         except Exception as e:
             logging.error(f"Error fetching platform data from TfGM API: {e}")
             raise HTTPException(
@@ -686,52 +1382,16 @@ async def get_platform_info(
     if nodeID not in tram_graph.getNodes():
         raise HTTPException(status_code=404, detail="Platform not found")
 
-    ret = {"updateTime": tram_graph.getLastUpdateTime(nodeID)}
-
-    if predictions:
-        platform_predictions = tram_graph.getNodePredictions()[nodeID]
-        if not tram_predictions:
-            for tram in platform_predictions:
-                tram.pop("predictions", None)
-        ret["predictions"] = platform_predictions
-        ret["here"] = tram_graph.getTramsHeres()[nodeID]
-
-    if message:
-        ret["message"] = tram_graph.getMessage(nodeID)
-
-    if meta:
-        dwellTimes = tram_graph.getDwellTimes()[nodeID]
-        averageDwell = timedelta()
-        for dwellTime in dwellTimes:
-            averageDwell = averageDwell + dwellTime
-        if len(dwellTimes) > 0:
-            averageDwell = averageDwell / len(dwellTimes)
-        else:
-            averageDwell = None
-
-        pred = {}
-        for pNodeID in tram_graph.getNodePreds(nodeID):
-            pred[pNodeID] = {
-                "transitTimes": tram_graph.getTransit(pNodeID, nodeID),
-                "averageTransitTime": tram_graph.getAverageTransit(pNodeID, nodeID)[0],
-            }
-
-        ret.update(
-            {
-                "mapPos": {
-                    "x": tram_graph.getMapPos(nodeID)[0],
-                    "y": tram_graph.getMapPos(nodeID)[1],
-                },
-                "dwellTimes": dwellTimes,
-                "averageDwellTime": averageDwell,
-                "predecessors": pred,
-            }
-        )
-
-    if departed:
-        ret["departed"] = tram_graph.getTramsDeparteds()[nodeID]
-
-    return ret
+    return cached_response(
+        request,
+        "platform",
+        nodeID,
+        predictions,
+        tram_predictions,
+        message,
+        meta,
+        departed,
+    )
 
 
 # Home Assistant Integration Endpoints
@@ -750,25 +1410,30 @@ async def homeassistant_root():
 
 
 @app.get("/homeassistant/stations/")
-async def homeassistant_stations():
+async def homeassistant_stations(request: Request, response: Response):
     """Get all stations formatted for Home Assistant"""
     if not should_use_polling_mode():
         # Lambda mode: get stations from TfGM API directly
         try:
-            api = TFGMMetrolinksAPI()
-            data = api.getData()
-            if data is None:
+            tfgm = await get_tfgm_cache().get()
+            if tfgm is None:
                 raise HTTPException(status_code=503, detail="TfGM API returned no data")
 
+            not_modified = check_etag(request, response, tfgm_cache_headers(tfgm))
+            if not_modified is not None:
+                return not_modified
+
             return {
-                "state": len(data.keys()),
+                "state": len(tfgm.stations),
                 "attributes": {
-                    "stations": sorted(data.keys()),
+                    "stations": sorted(tfgm.stations),
                     "unit_of_measurement": "stations",
                     "friendly_name": "Metrolink Stations",
                     "icon": "mdi:train",
                 },
             }
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=503, detail=f"Unable to fetch data: {str(e)}"
@@ -777,6 +1442,10 @@ async def homeassistant_stations():
     # Polling mode
     await ensure_fresh_data()
     tram_graph, _ = get_graph()
+    headers = snapshot_cache_headers(tram_graph.getSnapshot())
+    not_modified = check_etag(request, response, headers)
+    if not_modified is not None:
+        return not_modified
     stations = list(tram_graph.getStations())
 
     return {
@@ -791,52 +1460,37 @@ async def homeassistant_stations():
 
 
 @app.get("/homeassistant/station/{station_name}/")
-async def homeassistant_station_summary(station_name: str):
+async def homeassistant_station_summary(
+    station_name: str, request: Request, response: Response
+):
     """Get station summary formatted for Home Assistant"""
     if not should_use_polling_mode():
         # Lambda mode
         try:
-            api = TFGMMetrolinksAPI()
-            data = api.getData()
-            if data is None or station_name not in data:
+            tfgm = await get_tfgm_cache().get()
+            station = tfgm.getStation(station_name) if tfgm is not None else None
+            if station is None:
                 raise HTTPException(status_code=404, detail="Station not found")
 
+            not_modified = check_etag(request, response, tfgm_cache_headers(tfgm))
+            if not_modified is not None:
+                return not_modified
+
             # Count total trams across all platforms
             total_trams = 0
             platforms = {}
             last_updated = None
 
-            for platform_id, platform_data_list in data[station_name].items():
-                if platform_data_list:
-                    platform_info = platform_data_list[0]
-                    platform_trams = []
-
-                    for i in range(4):
-                        dest = platform_info.get(f"Dest{i}", "")
-                        if dest:
-                            platform_trams.append(
-                                {
-                                    "destination": dest,
-                                    "wait": platform_info.get(f"Wait{i}", ""),
-                                    "status": platform_info.get(f"Status{i}", ""),
-                                    "carriages": platform_info.get(f"Carriages{i}", ""),
-                                }
-                            )
-                            total_trams += 1
-
-                    platforms[platform_id] = {
-                        "direction": platform_info.get("Direction", ""),
-                        "trams": platform_trams,
-                        "message": platform_info.get("MessageBoard", "").replace(
-                            "^$", ""
-                        )
-                        if platform_info.get("MessageBoard")
-                        not in ["^F0", "<no message>"]
-                        else None,
-                    }
-
-                    if not last_updated:
-                        last_updated = platform_info.get("LastUpdated")
+            for platform_id, pid in station.items():
+                platforms[platform_id] = {
+                    "direction": pid.direction,
+                    "trams": [tfgm_tram(tram) for tram in pid.pidTrams],
+                    "message": pid.message,
+                }
+                total_trams += len(pid.pidTrams)
+
+                if not last_updated:
+                    last_updated = pid.lastUpdated
 
             return {
                 "state": total_trams,
@@ -849,6 +1503,8 @@ async def homeassistant_station_summary(station_name: str):
                     "icon": "mdi:train",
                 },
             }
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=503, detail=f"Unable to fetch data: {str(e)}"
@@ -861,262 +1517,61 @@ async def homeassistant_station_summary(station_name: str):
     if station_name not in tram_graph.getStations():
         raise HTTPException(status_code=404, detail="Station not found")
 
-    platforms = {}
-    total_trams = 0
-
-    for platID in tram_graph.getStationPlatforms(station_name):
-        nodeID = f"{station_name}_{platID}"
-        trams = tram_graph.getTramsStarting()[nodeID]
-        total_trams += len(trams)
-
-        platforms[platID] = {
-            "trams": trams,
-            "message": tram_graph.getMessage(nodeID),
-            "last_updated": (
-                tram_graph.getLastUpdateTime(nodeID).isoformat()
-                if tram_graph.getLastUpdateTime(nodeID)
-                else None
-            ),
-        }
-
-    return {
-        "state": total_trams,
-        "attributes": {
-            "station_name": station_name,
-            "platforms": platforms,
-            "last_updated": tram_graph.getLocalUpdateTime().isoformat(),
-            "unit_of_measurement": "trams",
-            "friendly_name": f"Metrolink {station_name}",
-            "icon": "mdi:train",
-        },
-    }
+    return cached_response(request, "homeassistant_station", station_name)
 
 
-@app.get("/homeassistant/station/{station_name}/outgoing/")
-async def homeassistant_station_outgoing(station_name: str):
-    """Get outgoing trams for a station formatted for Home Assistant"""
+async def homeassistant_station_direction(station_name, direction, request, response):
+    """A station's trams one way, from whichever mode is serving"""
     if not should_use_polling_mode():
         # Lambda mode
         try:
-            api = TFGMMetrolinksAPI()
-            data = api.getData()
-            if data is None:
+            tfgm = await get_tfgm_cache().get()
+            if tfgm is None:
                 raise HTTPException(status_code=503, detail="TfGM API returned no data")
-            if station_name not in data:
-                available_stations = list(data.keys())[:5] if data else []
+            station = tfgm.getStation(station_name)
+            if station is None:
+                available_stations = list(tfgm.stations)[:5]
                 raise HTTPException(
                     status_code=404,
                     detail=f"Station '{station_name}' not found. Available: {available_stations}",
                 )
 
-            outgoing_trams = []
-            last_updated = None
-            message = None
-
-            for _platform_id, platform_data_list in data[station_name].items():
-                if platform_data_list:
-                    platform_info = platform_data_list[0]
-
-                    # For outgoing, we'll take all platforms since TfGM doesn't always provide explicit direction
-                    # In most cases, stations have separate platforms for different directions
-                    for i in range(4):
-                        dest = platform_info.get(f"Dest{i}", "")
-                        if dest:
-                            outgoing_trams.append(
-                                {
-                                    "dest": dest,
-                                    "status": platform_info.get(f"Status{i}", ""),
-                                    "wait": platform_info.get(f"Wait{i}", ""),
-                                    "carriages": platform_info.get(f"Carriages{i}", ""),
-                                }
-                            )
-
-                    if not last_updated:
-                        last_updated = platform_info.get("LastUpdated")
-
-                    # Check for message in both raw API format and processed format
-                    if not message:
-                        msg_board = platform_info.get("MessageBoard", "")
-                        msg_direct = platform_info.get("message", "")
-
-                        if msg_board and msg_board not in ["^F0", "<no message>"]:
-                            message = msg_board.replace("^$", "")
-                        elif msg_direct:
-                            message = msg_direct
-
-            # Flatten the tram data for Home Assistant attributes
-            attributes = {
-                "station_name": station_name,
-                "direction": "outgoing",
-                "last_updated": last_updated,
-                "message": message,
-                "friendly_name": f"Metrolink {station_name} Outgoing",
-                "icon": "mdi:train-variant",
-            }
-
-            # Add flattened tram data with proper indexing
-            for i, tram in enumerate(outgoing_trams[:4]):  # Limit to 4 trams
-                attributes[f"dest{i}"] = tram.get("dest", "")
-                attributes[f"status{i}"] = tram.get("status", "")
-                attributes[f"wait{i}"] = tram.get("wait", "")
-                attributes[f"carriages{i}"] = tram.get("carriages", "")
+            not_modified = check_etag(request, response, tfgm_cache_headers(tfgm))
+            if not_modified is not None:
+                return not_modified
 
-            return {"state": len(outgoing_trams), "attributes": attributes}
+            return render_tfgm_direction(station, station_name, direction)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(
                 status_code=503, detail=f"Unable to fetch data: {str(e)}"
             )
 
-    # Polling mode - this would need platform direction mapping
-    # For now, return all platforms (you'd need to add direction info to your graph)
     await ensure_fresh_data()
     tram_graph, _ = get_graph()
 
     if station_name not in tram_graph.getStations():
         raise HTTPException(status_code=404, detail="Station not found")
 
-    # In polling mode, we don't have direction info readily available
-    # This is a limitation of the current graph structure
-    all_trams = []
-    message = None
+    return cached_response(request, "homeassistant_direction", station_name, direction)
 
-    for platID in tram_graph.getStationPlatforms(station_name):
-        nodeID = f"{station_name}_{platID}"
-        trams = tram_graph.getTramsStarting()[nodeID]
-        all_trams.extend(trams)
-
-        # Extract message from any platform that has one
-        if not message:
-            platform_message = tram_graph.getMessage(nodeID)
-            if platform_message:
-                message = platform_message
 
-    # Format for Home Assistant
-    attributes = {
-        "station_name": station_name,
-        "direction": "outgoing",
-        "last_updated": tram_graph.getLocalUpdateTime().isoformat(),
-        "message": message,
-        "friendly_name": f"Metrolink {station_name} Outgoing",
-        "icon": "mdi:train-variant",
-    }
-
-    # Add first 4 trams as individual attributes
-    for i, tram in enumerate(all_trams[:4]):
-        attributes[f"dest{i}"] = tram.get("dest", "")
-        attributes[f"status{i}"] = tram.get("status", "")
-        attributes[f"wait{i}"] = tram.get("wait", "")
-        attributes[f"carriages{i}"] = tram.get("carriages", "")
-
-    return {"state": len(all_trams), "attributes": attributes}
+@app.get("/homeassistant/station/{station_name}/outgoing/")
+async def homeassistant_station_outgoing(
+    station_name: str, request: Request, response: Response
+):
+    """Get outgoing trams for a station formatted for Home Assistant"""
+    return await homeassistant_station_direction(
+        station_name, "outgoing", request, response
+    )
 
 
 @app.get("/homeassistant/station/{station_name}/incoming/")
-async def homeassistant_station_incoming(station_name: str):
+async def homeassistant_station_incoming(
+    station_name: str, request: Request, response: Response
+):
     """Get incoming trams for a station formatted for Home Assistant"""
-    if not should_use_polling_mode():
-        # Lambda mode
-        try:
-            api = TFGMMetrolinksAPI()
-            data = api.getData()
-            if data is None or station_name not in data:
-                raise HTTPException(status_code=404, detail="Station not found")
-
-            incoming_trams = []
-            last_updated = None
-            message = None
-
-            for _platform_id, platform_data_list in data[station_name].items():
-                if platform_data_list:
-                    platform_info = platform_data_list[0]
-
-                    # For incoming, we'll take all platforms since TfGM doesn't always provide explicit direction
-                    # In most cases, stations have separate platforms for different directions
-                    for i in range(4):
-                        dest = platform_info.get(f"Dest{i}", "")
-                        if dest:
-                            incoming_trams.append(
-                                {
-                                    "dest": dest,
-                                    "status": platform_info.get(f"Status{i}", ""),
-                                    "wait": platform_info.get(f"Wait{i}", ""),
-                                    "carriages": platform_info.get(f"Carriages{i}", ""),
-                                }
-                            )
-
-                    if not last_updated:
-                        last_updated = platform_info.get("LastUpdated")
-
-                    # Check for message in both raw API format and processed format
-                    if not message:
-                        msg_board = platform_info.get("MessageBoard", "")
-                        msg_direct = platform_info.get("message", "")
-
-                        if msg_board and msg_board not in ["^F0", "<no message>"]:
-                            message = msg_board.replace("^$", "")
-                        elif msg_direct:
-                            message = msg_direct
-
-            # Flatten the tram data for Home Assistant attributes
-            attributes = {
-                "station_name": station_name,
-                "direction": "incoming",
-                "last_updated": last_updated,
-                "message": message,
-                "friendly_name": f"Metrolink {station_name} Incoming",
-                "icon": "mdi:train-variant",
-            }
-
-            # Add flattened tram data with proper indexing
-            for i, tram in enumerate(incoming_trams[:4]):  # Limit to 4 trams
-                attributes[f"dest{i}"] = tram.get("dest", "")
-                attributes[f"status{i}"] = tram.get("status", "")
-                attributes[f"wait{i}"] = tram.get("wait", "")
-                attributes[f"carriages{i}"] = tram.get("carriages", "")
-
-            return {"state": len(incoming_trams), "attributes": attributes}
-        except Exception as e:
-            raise HTTPException(
-                status_code=503, detail=f"Unable to fetch data: {str(e)}"
-            )
-
-    # Polling mode - similar limitation as outgoing
-    await ensure_fresh_data()
-    tram_graph, _ = get_graph()
-
-    if station_name not in tram_graph.getStations():
-        raise HTTPException(status_code=404, detail="Station not found")
-
-    # In polling mode, we don't have direction info readily available
-    all_trams = []
-    message = None
-
-    for platID in tram_graph.getStationPlatforms(station_name):
-        nodeID = f"{station_name}_{platID}"
-        trams = tram_graph.getTramsStarting()[nodeID]
-        all_trams.extend(trams)
-
-        # Extract message from any platform that has one
-        if not message:
-            platform_message = tram_graph.getMessage(nodeID)
-            if platform_message:
-                message = platform_message
-
-    # Format for Home Assistant
-    attributes = {
-        "station_name": station_name,
-        "direction": "incoming",
-        "last_updated": tram_graph.getLocalUpdateTime().isoformat(),
-        "message": message,
-        "friendly_name": f"Metrolink {station_name} Incoming",
-        "icon": "mdi:train-variant",
-    }
-
-    # Add first 4 trams as individual attributes
-    for i, tram in enumerate(all_trams[:4]):
-        attributes[f"dest{i}"] = tram.get("dest", "")
-        attributes[f"status{i}"] = tram.get("status", "")
-        attributes[f"wait{i}"] = tram.get("wait", "")
-        attributes[f"carriages{i}"] = tram.get("carriages", "")
-
-    return {"state": len(all_trams), "attributes": attributes}
+    return await homeassistant_station_direction(
+        station_name, "incoming", request, response
+    )
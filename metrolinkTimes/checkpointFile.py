@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from metrolinkTimes.snapshotStore import FileSnapshotStore
+from metrolinkTimes.tramRecords import Tram, serialize
+
+# Changed whenever what TramGraph.getCheckpoint returns, or how it's saved,
+# does
+CHECKPOINT_FORMAT = 2
+
+# Tram fields that aren't plain JSON values
+DATETIME_FIELDS = ("arriveTime", "departTime")
+TIMEDELTA_FIELDS = ("dwellTime", "averageDwell")
+
+MICROSECOND = timedelta(microseconds=1)
+
+
+def encodeTram(tram):
+    fields = serialize(tram, ("predictions",))
+    for field in DATETIME_FIELDS:
+        if fields.get(field) is not None:
+            fields[field] = fields[field].isoformat()
+    for field in TIMEDELTA_FIELDS:
+        if fields.get(field) is not None:
+            fields[field] = fields[field] // MICROSECOND
+    return fields
+
+
+def decodeTram(fields):
+    for field in DATETIME_FIELDS:
+        if fields.get(field) is not None:
+            fields[field] = datetime.fromisoformat(fields[field])
+    for field in TIMEDELTA_FIELDS:
+        if fields.get(field) is not None:
+            fields[field] = timedelta(microseconds=fields[field])
+    return Tram(**fields)
+
+
+def encodeCheckpoint(checkpoint):
+    """A checkpoint as JSON values, with samples in microseconds"""
+    trams = checkpoint["trams"]
+    if trams is not None:
+        trams = {
+            node: {
+                field: [encodeTram(tram) for tram in fieldTrams]
+                for field, fieldTrams in platformTrams.items()
+            }
+            for node, platformTrams in trams.items()
+        }
+    return {
+        "dwellTimes": {
+            node: [sample // MICROSECOND for sample in samples]
+            for node, samples in checkpoint["dwellTimes"].items()
+        },
+        # Edges are pairs of nodes, which can't be JSON keys
+        "transitTimes": [
+            [*edge, [sample // MICROSECOND for sample in samples]]
+            for edge, samples in checkpoint["transitTimes"].items()
+        ],
+        "trams": trams,
+    }
+
+
+def decodeCheckpoint(saved):
+    trams = saved["trams"]
+    if trams is not None:
+        trams = {
+            node: {
+                field: [decodeTram(tram) for tram in fieldTrams]
+                for field, fieldTrams in platformTrams.items()
+            }
+            for node, platformTrams in trams.items()
+        }
+    return {
+        "dwellTimes": {
+            node: [timedelta(microseconds=sample) for sample in samples]
+            for node, samples in saved["dwellTimes"].items()
+        },
+        "transitTimes": {
+            (start, end): [timedelta(microseconds=sample) for sample in samples]
+            for start, end, samples in saved["transitTimes"]
+        },
+        "trams": trams,
+    }
+
+
+class CheckpointFile(FileSnapshotStore):
+    """Keeps what a graph has learned on disk, for when the process restarts
+
+    Written like snapshots, to a temporary file renamed over path, so a
+    crash while saving leaves the last whole checkpoint, and like them as
+    JSON. A checkpoint older than maxAge seconds is ignored, as its trams
+    will have long moved on.
+    """
+
+    def __init__(self, path, interval=30, maxAge=300):
+        super().__init__(path)
+        self.interval = interval
+        self.maxAge = maxAge
+        self.savedAt = None
+
+    @staticmethod
+    def dumps(saved):
+        return json.dumps(saved, separators=(",", ":")).encode()
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data)
+
+    def due(self):
+        """Whether interval seconds have passed since the last save"""
+        return (self.savedAt is None) or time.time() - self.savedAt >= self.interval
+
+    def save(self, checkpoint):
+        savedAt = time.time()
+        self.write(
+            {
+                "format": CHECKPOINT_FORMAT,
+                "savedAt": savedAt,
+                "checkpoint": encodeCheckpoint(checkpoint),
+            }
+        )
+        self.savedAt = savedAt
+
+    def load(self):
+        """The saved checkpoint, or None if there's none young enough"""
+        try:
+            saved = self.read()
+            if (saved is None) or saved.get("format") != CHECKPOINT_FORMAT:
+                return None
+
+            age = time.time() - saved["savedAt"]
+            if not 0 <= age <= self.maxAge:
+                logging.info(f"Ignoring checkpoint saved {age:.0f}s ago")
+                return None
+            return decodeCheckpoint(saved["checkpoint"])
+        except Exception as e:
+            logging.warning(f"Could not read checkpoint {self.path}: {e}")
+            return None
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Compiles data/stations.json into the topology TramGraph loads
+
+Run after changing stations.json, from the repository root:
+
+    python -m metrolinkTimes.compiledTopology
+
+and with --check to fail if the compiled topology is out of date.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+DATA_DIR = f"{os.path.dirname(__file__)}/data"
+STATIONS_FILE = f"{DATA_DIR}/stations.json"
+TOPOLOGY_FILE = f"{DATA_DIR}/topology.json"
+
+# Changed whenever the compiled topology's layout does
+TOPOLOGY_FORMAT = 1
+
+
+class TopologyError(ValueError):
+    """Raised when stations.json describes a network that can't be built"""
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("Invalid stations data:\n" + "\n".join(problems))
+
+
+def sourceDigest(raw):
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def validateStations(data):
+    """Everything wrong with the stations data, as messages"""
+    problems = []
+    owners = {}
+    for stationName, platforms in data.items():
+        for platformID, platform in platforms.items():
+            if platformID in owners:
+                problems.append(
+                    f"{platformID} is at both {owners[platformID]} and {stationName}"
+                )
+            owners.setdefault(platformID, stationName)
+
+            mapPos = platform.get("map", {})
+            if not all(isinstance(mapPos.get(axis), int | float) for axis in "xy"):
+                problems.append(f"{stationName} {platformID} has no map position")
+
+    for stationName, platforms in data.items():
+        for platformID, platform in platforms.items():
+            for before in platform.get("stationsBefore", ()):
+                if before not in owners:
+                    problems.append(
+                        f"{stationName} {platformID} follows unknown platform {before}"
+                    )
+                elif before == platformID:
+                    problems.append(f"{stationName} {platformID} follows itself")
+    return problems
+
+
+def compileTopology(data, source=None):
+    """The topology of the stations data, validated and resolved
+
+    Platforms are numbered, and edges refer to them by number, in the order
+    networkx saw them when building the graph straight from stations.json,
+    so the graph's node and edge order are unchanged. Each platform is its
+    station's number, platform ID, line and map position, and each edge its
+    platforms and weight. Raises TopologyError if the data isn't valid.
+    """
+    problems = validateStations(data)
+    if problems:
+        raise TopologyError(problems)
+
+    owners = {
+        platformID: stationName
+        for stationName, platforms in data.items()
+        for platformID in platforms
+    }
+    stationNumbers = {stationName: i for i, stationName in enumerate(data)}
+
+    platformNumbers = {}
+    edges = []
+    for stationName, platforms in data.items():
+        for platformID, platform in platforms.items():
+            to = platformNumbers.setdefault(
+                (stationName, platformID), len(platformNumbers)
+            )
+            # Trams stopping at a terminating platform don't pass through it
+            weight = 2 if platform.get("terminating", False) else 1
+            for before in platform.get("stationsBefore", ()):
+                start = platformNumbers.setdefault(
+                    (owners[before], before), len(platformNumbers)
+                )
+                edges.append([start, to, weight])
+
+    return {
+        "format": TOPOLOGY_FORMAT,
+        "source": source,
+        "stations": list(data),
+        "platforms": [
+            [
+                stationNumbers[stationName],
+                platformID,
+                data[stationName][platformID].get("line"),
+                data[stationName][platformID]["map"]["x"],
+                data[stationName][platformID]["map"]["y"],
+            ]
+            for stationName, platformID in platformNumbers
+        ],
+        "edges": edges,
+    }
+
+
+def compileStationsFile(path=STATIONS_FILE):
+    with open(path, "rb") as stationsFile:
+        raw = stationsFile.read()
+    return compileTopology(json.loads(raw), sourceDigest(raw))
+
+
+def loadTopology(path=TOPOLOGY_FILE):
+    with open(path) as topologyFile:
+        topology = json.load(topologyFile)
+    if topology.get("format") != TOPOLOGY_FORMAT:
+        raise TopologyError(
+            [f"{path} is from another version, recompile it from stations.json"]
+        )
+    return topology
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="fail if the compiled topology doesn't match stations.json",
+    )
+    args = parser.parse_args()
+
+    try:
+        topology = compileStationsFile()
+    except TopologyError as e:
+        sys.exit(str(e))
+
+    if args.check:
+        try:
+            current = loadTopology() == topology
+        except (OSError, ValueError):
+            current = False
+        if not current:
+            sys.exit(f"{TOPOLOGY_FILE} is out of date, recompile it")
+        return
+
+    with open(TOPOLOGY_FILE, "w") as topologyFile:
+        json.dump(topology, topologyFile, separators=(",", ":"))
+        topologyFile.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+from dataclasses import dataclass
+from types import MappingProxyType
+
+
+@dataclass(slots=True, frozen=True)
+class Topology:
+    """The parts of a TramGraph's static topology that readers need
+
+    A TramGraph publishes this along with its snapshots, so a process
+    serving them can answer topology questions without building the graph.
+    """
+
+    stations: tuple[str, ...]
+    stationNodes: MappingProxyType
+    stationPlatforms: MappingProxyType
+    platformNodes: MappingProxyType
+    predecessors: MappingProxyType
+    nodeLines: MappingProxyType
+    lineNodes: MappingProxyType
+    nodeOrder: MappingProxyType
+    pos: MappingProxyType
+
+
+class GraphReader:
+    """Everything readers ask a graph, answered from its topology indexes and
+    latest snapshot
+
+    Subclasses provide the indexes named in Topology and a snapshot.
+    """
+
+    def getSnapshot(self):
+        """The latest published snapshot
+
+        Readers that need more than one value should take the snapshot once
+        and read from it, so every value comes from the same cycle.
+        """
+        return self.snapshot
+
+    def getPIDs(self):
+        return self.snapshot.serializeColumn("pidTrams")
+
+    def getLastUpdateTime(self, nodeID):
+        return self.snapshot.platforms[nodeID].updateTime
+
+    def getLastUpdateTimes(self):
+        return self.snapshot.column("updateTime")
+
+    def getMessage(self, nodeID):
+        return self.snapshot.platforms[nodeID].message
+
+    def getTramsStarting(self):
+        return self.snapshot.serializeColumn("tramsApproaching")
+
+    def getTramsHeres(self):
+        return self.snapshot.serializeColumn("tramsHere", exclude=("wait",))
+
+    def getTramsDeparteds(self):
+        return self.snapshot.serializeColumn("tramsDeparted")
+
+    def getNodePredictions(self):
+        return self.snapshot.serializeColumn("predictedArrivals")
+
+    def getDwellTimes(self):
+        return {
+            node: list(times)
+            for node, times in self.snapshot.column("dwellTimes").items()
+        }
+
+    def getTramsStartingAt(self, nodeID):
+        return self.snapshot.getTramsStartingAt(nodeID)
+
+    def getTramsHereAt(self, nodeID):
+        return self.snapshot.getTramsHereAt(nodeID)
+
+    def getTramsDepartedAt(self, nodeID):
+        return self.snapshot.getTramsDepartedAt(nodeID)
+
+    def getPredictionsAt(self, nodeID, tramPredictions=True):
+        return self.snapshot.getPredictionsAt(nodeID, tramPredictions)
+
+    def getDwellTimesAt(self, nodeID):
+        return self.snapshot.getDwellTimesAt(nodeID)
+
+    def getStationTramsStarting(self, statName):
+        return self.snapshot.getStationTramsStarting(statName)
+
+    def getNodes(self):
+        return self.nodeOrder.keys()
+
+    def getStations(self):
+        return self.stations
+
+    def getStationPlatforms(self, statName):
+        return list(self.stationPlatforms.get(statName, ()))
+
+    def getNode(self, statName, platID):
+        return self.platformNodes.get((statName, platID))
+
+    def getLines(self):
+        return self.lineNodes.keys()
+
+    def getLine(self, node):
+        return self.nodeLines[node]
+
+    def getNodePreds(self, node):
+        return self.predecessors[node]
+
+    def getTransit(self, inNode, outNode):
+        return self.snapshot.getTransit(inNode, outNode)
+
+    def getMapPos(self, node):
+        return self.pos[node]
+
+    def nodesNoAvDwell(self):
+        return self.snapshot.nodesNoAvDwell()
+
+    def edgesNoAvTrans(self):
+        return self.snapshot.edgesNoAvTrans()
+
+    def getLocalUpdateTime(self):
+        return self.snapshot.localUpdateTime
+
+
+class PublishedGraph(GraphReader):
+    """A graph that only serves snapshots another process's TramGraph
+    published, so it doesn't need networkx or the prediction pipeline
+    """
+
+    def __init__(self, topology):
+        self.stations = topology.stations
+        self.stationNodes = topology.stationNodes
+        self.stationPlatforms = topology.stationPlatforms
+        self.platformNodes = topology.platformNodes
+        self.predecessors = topology.predecessors
+        self.nodeLines = topology.nodeLines
+        self.lineNodes = topology.lineNodes
+        self.nodeOrder = topology.nodeOrder
+        self.pos = topology.pos
+        self.snapshot = None
+
+    def setSnapshot(self, snapshot):
+        self.snapshot = snapshot
@@ -6,8 +6,9 @@ Uses Mangum to adapt FastAPI for Lambda execution.
 import json
 import logging
 import os
+import tempfile
+import time
 
-import boto3
 from mangum import Mangum
 
 # Configure logging for Lambda
@@ -16,55 +17,99 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Where the key from SSM is kept, so initializing again in the same execution
+# environment, as Lambda does after a timeout or crash, doesn't fetch it again
+SSM_KEY_CACHE = "/tmp/metrolinkTimes-tfgm-key.json"
+
+
+def fetch_tfgm_api_key():
+    """Fetch TfGM API key from SSM Parameter Store"""
+    # boto3 is slow to import, so only import it when SSM is needed
+    import boto3
+
+    param_name = os.environ.get("TFG_API_KEY_PARAM", "/metrolink-times/tfgm-api-key")
+    ssm = boto3.client("ssm")
+    response = ssm.get_parameter(Name=param_name, WithDecryption=True)
+    return response["Parameter"]["Value"]
+
 
 def load_tfgm_api_key():
-    """Load TfGM API key from SSM Parameter Store"""
+    """Load TfGM API key from the environment, the /tmp cache or SSM
+
+    A cached key is used for TFGM_API_KEY_CACHE_TTL seconds after it was
+    fetched.
+    """
+    if os.environ.get("TFGM_API_KEY"):
+        return os.environ["TFGM_API_KEY"]
+
+    ttl = int(os.environ.get("TFGM_API_KEY_CACHE_TTL", 300))
     try:
-        param_name = os.environ.get(
-            "TFG_API_KEY_PARAM", "/metrolink-times/tfgm-api-key"
-        )
-        ssm = boto3.client("ssm")
-        response = ssm.get_parameter(Name=param_name, WithDecryption=True)
-        return response["Parameter"]["Value"]
+        with open(SSM_KEY_CACHE) as cache_file:
+            cached = json.load(cache_file)
+        if time.time() - cached["fetched"] < ttl:
+            return cached["value"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    try:
+        api_key = fetch_tfgm_api_key()
     except Exception as e:
         logger.error(f"Failed to load TfGM API key from SSM: {e}")
         return None
 
+    try:
+        # Written under another name and renamed, so it's never read half written
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(SSM_KEY_CACHE))
+        with os.fdopen(fd, "w") as cache_file:
+            json.dump({"fetched": time.time(), "value": api_key}, cache_file)
+        os.replace(tmp_path, SSM_KEY_CACHE)
+    except OSError as e:
+        logger.warning(f"Failed to cache TfGM API key: {e}")
+    return api_key
+
 
 def create_lambda_config():
-    """Create configuration for Lambda environment"""
+    """Create configuration for Lambda environment
+
+    It's handed to the app in memory rather than written to a config file.
+    """
     tfgm_api_key = load_tfgm_api_key()
 
     if not tfgm_api_key or tfgm_api_key == "PLACEHOLDER_VALUE":
         logger.warning("TfGM API key not configured. API will not work properly.")
         tfgm_api_key = None
 
-    # Create a temporary config file for the Lambda environment
+    # Merged into the app's config once it's imported
     config = {
         "Ocp-Apim-Subscription-Key": tfgm_api_key,
         "Access-Control-Allow-Origin": "*",
         "polling_enabled": False,  # Force on-demand mode in Lambda
     }
 
-    # Write config to /tmp (only writable directory in Lambda)
-    config_path = "/tmp/metrolinkTimes.conf"
-    with open(config_path, "w") as f:
-        json.dump(config, f)
+    # Serve a poller's snapshots from a shared store instead of calling TfGM
+    if os.environ.get("SNAPSHOT_BACKEND"):
+        config["snapshot_backend"] = os.environ["SNAPSHOT_BACKEND"]
+        if os.environ.get("SNAPSHOT_FILE"):
+            config["snapshot_file"] = os.environ["SNAPSHOT_FILE"]
 
-    logger.info(f"Created Lambda config at {config_path}")
-    return config_path
+    return config
 
 
 # Initialize the FastAPI app
 try:
     # Set up configuration for Lambda
-    create_lambda_config()
+    lambda_config = create_lambda_config()
+
+    # Lambda is always on demand
+    os.environ.setdefault("METROLINK_MODE", "lambda")
 
     # Import the FastAPI app
-    from metrolinkTimes.api import app
+    from metrolinkTimes import api
+
+    api.config.update(lambda_config)
 
     # Create the Mangum handler
-    handler = Mangum(app, lifespan="off")
+    handler = Mangum(api.app, lifespan="off")
 
     logger.info("Lambda handler initialized successfully")
 
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from types import MappingProxyType
+from typing import NamedTuple
+
+from metrolinkTimes.tramRecords import FrozenTram, PIDTram, PredictedArrival
+
+
+def toDicts(records, **kwargs):
+    return [record.toDict(**kwargs) for record in records]
+
+
+class PlatformSnapshot(NamedTuple):
+    """One platform's outputs at the end of a cycle
+
+    A named tuple rather than a frozen dataclass, as one is built for every
+    platform every cycle and tuples are several times quicker to make.
+    """
+
+    stationName: str
+    platformID: str
+    updateTime: datetime
+    message: str | None
+    pidTrams: tuple[PIDTram, ...]
+    predictedArrivals: tuple[PredictedArrival, ...]
+    tramsHere: tuple[FrozenTram, ...]
+    tramsDeparted: tuple[FrozenTram, ...]
+    tramsApproaching: tuple[FrozenTram, ...]
+    dwellTimes: tuple[timedelta, ...]
+    averageDwell: tuple[timedelta | None, bool]
+
+    def sameContent(self, other):
+        """Whether other shows the same message, trams and predictions
+
+        updateTime and the rolling stats aren't compared, as they move on
+        without anything shown on the platform changing.
+        """
+        return (
+            self.message == other.message
+            and self.pidTrams == other.pidTrams
+            and self.predictedArrivals == other.predictedArrivals
+            and self.tramsHere == other.tramsHere
+            and self.tramsDeparted == other.tramsDeparted
+            and self.tramsApproaching == other.tramsApproaching
+        )
+
+
+@dataclass(slots=True, frozen=True)
+class NetworkSnapshot:
+    """Everything readers see of the network, as of one completed cycle
+
+    A snapshot is never changed once built. Each cycle builds a new one and
+    publishes it by swapping a single reference, so a reader holding a
+    snapshot gets a consistent view however long it holds on, and can hand
+    out its parts without copying them.
+
+    The At and Station accessors only serialize the platforms asked for.
+    changed holds the platforms whose content differs from the snapshot
+    before, and history the version and changed platforms of the last few
+    cycles, oldest first.
+    """
+
+    version: int
+    localUpdateTime: datetime | None
+    platforms: MappingProxyType
+    transitTimes: MappingProxyType
+    averageTransit: MappingProxyType
+    stationNodes: MappingProxyType
+    changed: frozenset
+    history: tuple[tuple[int, frozenset], ...]
+
+    def column(self, field):
+        return {nodeID: getattr(p, field) for nodeID, p in self.platforms.items()}
+
+    def serializeColumn(self, field, **kwargs):
+        return {
+            nodeID: toDicts(getattr(p, field), **kwargs)
+            for nodeID, p in self.platforms.items()
+        }
+
+    def changedSince(self, version):
+        """Platforms changed in the cycles after version
+
+        None if version is older than the history goes back, or newer than
+        this snapshot, so what changed can't be known. Versions start again
+        when the process does, so a version from before a restart can look
+        valid here: callers check it's from this run's epoch first.
+        """
+        if version > self.version or version < self.history[0][0] - 1:
+            return None
+        changed = set()
+        for cycle, nodes in reversed(self.history):
+            if cycle <= version:
+                break
+            changed.update(nodes)
+        return changed
+
+    def getStation(self, stationName):
+        """A station's platforms by platform ID, empty if there's no such station"""
+        platforms = {}
+        for nodeID in self.stationNodes.get(stationName, ()):
+            platform = self.platforms[nodeID]
+            platforms[platform.platformID] = platform
+        return platforms
+
+    def getTramsStartingAt(self, nodeID):
+        return toDicts(self.platforms[nodeID].tramsApproaching)
+
+    def getTramsHereAt(self, nodeID):
+        return toDicts(self.platforms[nodeID].tramsHere, exclude=("wait",))
+
+    def getTramsDepartedAt(self, nodeID):
+        return toDicts(self.platforms[nodeID].tramsDeparted)
+
+    def getPredictionsAt(self, nodeID, tramPredictions=True):
+        exclude = () if tramPredictions else ("predictions",)
+        return toDicts(self.platforms[nodeID].predictedArrivals, exclude=exclude)
+
+    def getDwellTimesAt(self, nodeID):
+        return list(self.platforms[nodeID].dwellTimes)
+
+    def getStationTramsStarting(self, stationName):
+        return {
+            platformID: toDicts(platform.tramsApproaching)
+            for platformID, platform in self.getStation(stationName).items()
+        }
+
+    def getTransit(self, start, end):
+        return list(self.transitTimes.get((start, end), ()))
+
+    def getAverageDwell(self, platform):
+        return self.platforms[platform].averageDwell
+
+    def getAverageTransit(self, start, end):
+        return self.averageTransit[(start, end)]
+
+    def nodesNoAvDwell(self):
+        return [nodeID for nodeID, p in self.platforms.items() if not p.dwellTimes]
+
+    def edgesNoAvTrans(self):
+        return [edge for edge, times in self.transitTimes.items() if not times]
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+from datetime import datetime
+
+import networkx as nx
+
+# Per-platform state, and how to make its initial value. stationName,
+# platformID and line are copied from the graph's node attributes
+PLATFORM_FIELDS = {
+    "stationName": None,
+    "platformID": None,
+    "line": None,
+    "pidTrams": list,
+    "message": lambda: None,
+    "updateTime": lambda: datetime.min,
+    "tramsDeparting": list,
+    "tramsArrived": list,
+    "tramsDue": list,
+    "tramsApproaching": list,
+    "tramsApproachingDeb": list,
+    "prevTramsHere": list,
+    "tramsHere": list,
+    "tramsHereDeb": list,
+    "tramsDeparted": list,
+    "predictedArrivals": list,
+}
+
+
+class GraphState(dict):
+    """Platform state kept as attributes on the networkx graph's nodes
+
+    Maps each node ID straight to the node's attribute dict, so reading
+    state doesn't go through a networkx view each time. It's the only
+    backend: almost all of a platform's state is lists of trams rather than
+    numbers an array could hold, and keeping it in columns indexed by
+    platform number measured slower than this.
+    """
+
+    def __init__(self, DG):
+        super().__init__()
+        for nodeID in nx.nodes(DG):
+            attributes = DG.nodes[nodeID]
+            for field, default in PLATFORM_FIELDS.items():
+                if default is not None:
+                    attributes[field] = default()
+            self[nodeID] = attributes
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+from pydantic_core import to_json
+
+# Stands in for a response's own URL, which differs from request to request
+# and so is spliced in when the response is served
+SELF_LINK = "\x00self\x00"
+ENCODED_SELF_LINK = to_json(SELF_LINK)
+
+
+def encode(content, timedeltaMode="iso8601"):
+    """Encode content as JSON the same way FastAPI would
+
+    Endpoints with a response model have timedeltas as ISO 8601 durations,
+    those without as seconds.
+    """
+    return to_json(content, timedelta_mode=timedeltaMode)
+
+
+class ResponseCache:
+    """Encoded JSON responses for the latest network snapshot
+
+    Responses only change when a new snapshot is published, so each one is
+    encoded the first time it's asked for and then served as bytes until the
+    next cycle. Renderers are registered by name, and a response is keyed by
+    the renderer's name and arguments, so responses asked for from one
+    snapshot can be rendered again for the next one by warm() before any
+    request comes in for them.
+
+    Only what was asked for since the last snapshot is warmed, so a variant
+    nobody asks for any more is dropped after one cycle. At most maxEntries
+    responses are kept, and warmed, per snapshot; past that they are rendered
+    for each request, so rare variants can't grow the cache, or the work of
+    warming it, without bound.
+    """
+
+    def __init__(self, maxEntries=1024):
+        # (snapshot version, {key: parts of the encoded response}, keys asked
+        # for from that version), replaced whole so it can be swapped from the
+        # updater's thread
+        self.current = (None, {}, set())
+        self.renderers = {}
+        self.maxEntries = maxEntries
+
+    def register(self, name, render, timedeltaMode="iso8601"):
+        """Add a renderer, called as render(snapshot, *args)"""
+        self.renderers[name] = (render, timedeltaMode)
+
+    def render(self, snapshot, key):
+        render, timedeltaMode = self.renderers[key[0]]
+        return encode(render(snapshot, *key[1:]), timedeltaMode).split(
+            ENCODED_SELF_LINK
+        )
+
+    def restart(self):
+        """Forget the snapshot version, for when versions start again
+
+        Which responses were asked for is kept, so warm() still renders them.
+        """
+        _, entries, requested = self.current
+        self.current = (None, entries, requested)
+
+    def get(self, snapshot, name, *args, selfLink=None):
+        """The encoded response for name(*args) from snapshot"""
+        version, entries, requested = self.current
+        if (version is None) or snapshot.version > version:
+            entries, requested = {}, set()
+            self.current = (snapshot.version, entries, requested)
+        elif snapshot.version < version:
+            # Taken before the last swap, so rendered but not kept
+            entries, requested = {}, set()
+
+        key = (name, *args)
+        if len(requested) < self.maxEntries:
+            requested.add(key)
+        parts = entries.get(key)
+        if parts is None:
+            parts = self.render(snapshot, key)
+            if len(entries) < self.maxEntries:
+                entries[key] = parts
+
+        if len(parts) == 1:
+            return parts[0]
+        return to_json(selfLink).join(parts)
+
+    def warm(self, snapshot):
+        """Render everything asked for from the last snapshot for snapshot"""
+        version, _, requested = self.current
+        if (version is not None) and snapshot.version <= version:
+            return
+        # Requests can still be adding to requested, so go through a copy
+        self.current = (
+            snapshot.version,
+            {key: self.render(snapshot, key) for key in tuple(requested)},
+            set(),
+        )
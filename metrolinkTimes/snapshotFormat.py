@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+from datetime import datetime, timedelta
+from types import MappingProxyType
+
+from metrolinkTimes.graphReader import Topology
+from metrolinkTimes.networkSnapshot import NetworkSnapshot, PlatformSnapshot
+from metrolinkTimes.tramRecords import FrozenTram, PIDTram, PredictedArrival, serialize
+
+# Changed whenever what a GraphUpdater publishes, or how it's encoded, does
+SNAPSHOT_FORMAT = 1
+
+# Record fields that aren't plain JSON values
+DATETIME_FIELDS = ("arriveTime", "departTime", "predictedArriveTime")
+TIMEDELTA_FIELDS = ("dwellTime", "averageDwell")
+
+MICROSECOND = timedelta(microseconds=1)
+
+# PlatformSnapshot's fields holding records, and the records they hold
+RECORD_FIELDS = {
+    "pidTrams": PIDTram,
+    "predictedArrivals": PredictedArrival,
+    "tramsHere": FrozenTram,
+    "tramsDeparted": FrozenTram,
+    "tramsApproaching": FrozenTram,
+}
+
+
+def encodeTime(value):
+    return None if value is None else value.isoformat()
+
+
+def decodeTime(value):
+    return None if value is None else datetime.fromisoformat(value)
+
+
+def encodeDuration(value):
+    return None if value is None else value // MICROSECOND
+
+
+def decodeDuration(value):
+    return None if value is None else timedelta(microseconds=value)
+
+
+def encodeRecord(record):
+    """A record's set fields as JSON values, leaving unset ones out"""
+    fields = serialize(record)
+    for field in DATETIME_FIELDS:
+        if field in fields:
+            fields[field] = encodeTime(fields[field])
+    for field in TIMEDELTA_FIELDS:
+        if field in fields:
+            fields[field] = encodeDuration(fields[field])
+    if fields.get("predictions") is not None:
+        fields["predictions"] = {
+            node: encodeTime(time) for node, time in fields["predictions"].items()
+        }
+    return fields
+
+
+def decodeRecord(recordType, fields):
+    """A record from encodeRecord's fields, those left out UNSET again"""
+    for field in DATETIME_FIELDS:
+        if field in fields:
+            fields[field] = decodeTime(fields[field])
+    for field in TIMEDELTA_FIELDS:
+        if field in fields:
+            fields[field] = decodeDuration(fields[field])
+    if fields.get("predictions") is not None:
+        fields["predictions"] = MappingProxyType(
+            {node: decodeTime(time) for node, time in fields["predictions"].items()}
+        )
+    return recordType(**fields)
+
+
+def encodePlatform(platform):
+    average, averaged = platform.averageDwell
+    encoded = platform._asdict()
+    encoded["updateTime"] = encodeTime(platform.updateTime)
+    for field in RECORD_FIELDS:
+        encoded[field] = [encodeRecord(record) for record in encoded[field]]
+    encoded["dwellTimes"] = [sample // MICROSECOND for sample in platform.dwellTimes]
+    encoded["averageDwell"] = [encodeDuration(average), averaged]
+    return encoded
+
+
+def decodePlatform(encoded):
+    average, averaged = encoded["averageDwell"]
+    encoded["updateTime"] = decodeTime(encoded["updateTime"])
+    for field, recordType in RECORD_FIELDS.items():
+        encoded[field] = tuple(
+            decodeRecord(recordType, fields) for fields in encoded[field]
+        )
+    encoded["dwellTimes"] = tuple(
+        timedelta(microseconds=sample) for sample in encoded["dwellTimes"]
+    )
+    encoded["averageDwell"] = (decodeDuration(average), averaged)
+    return PlatformSnapshot(**encoded)
+
+
+def encodeSnapshot(snapshot):
+    """A snapshot as JSON values, with durations in microseconds"""
+    return {
+        "version": snapshot.version,
+        "localUpdateTime": encodeTime(snapshot.localUpdateTime),
+        "platforms": {
+            node: encodePlatform(platform)
+            for node, platform in snapshot.platforms.items()
+        },
+        # Edges are pairs of nodes, which can't be JSON keys
+        "transitTimes": [
+            [*edge, [sample // MICROSECOND for sample in samples]]
+            for edge, samples in snapshot.transitTimes.items()
+        ],
+        "averageTransit": [
+            [*edge, encodeDuration(average), averaged]
+            for edge, (average, averaged) in snapshot.averageTransit.items()
+        ],
+        "stationNodes": dict(snapshot.stationNodes),
+        "changed": sorted(snapshot.changed),
+        "history": [[cycle, sorted(nodes)] for cycle, nodes in snapshot.history],
+    }
+
+
+def decodeSnapshot(encoded):
+    return NetworkSnapshot(
+        encoded["version"],
+        decodeTime(encoded["localUpdateTime"]),
+        MappingProxyType(
+            {
+                node: decodePlatform(platform)
+                for node, platform in encoded["platforms"].items()
+            }
+        ),
+        MappingProxyType(
+            {
+                (start, end): tuple(
+                    timedelta(microseconds=sample) for sample in samples
+                )
+                for start, end, samples in encoded["transitTimes"]
+            }
+        ),
+        MappingProxyType(
+            {
+                (start, end): (decodeDuration(average), averaged)
+                for start, end, average, averaged in encoded["averageTransit"]
+            }
+        ),
+        MappingProxyType(
+            {
+                station: tuple(nodes)
+                for station, nodes in encoded["stationNodes"].items()
+            }
+        ),
+        frozenset(encoded["changed"]),
+        tuple((cycle, frozenset(nodes)) for cycle, nodes in encoded["history"]),
+    )
+
+
+def encodeTopology(topology):
+    return {
+        "stations": list(topology.stations),
+        "stationNodes": dict(topology.stationNodes),
+        "stationPlatforms": dict(topology.stationPlatforms),
+        # Keyed by (station, platform) pairs, so kept as triples
+        "platformNodes": [
+            [station, platform, node]
+            for (station, platform), node in topology.platformNodes.items()
+        ],
+        "predecessors": dict(topology.predecessors),
+        "nodeLines": dict(topology.nodeLines),
+        "lineNodes": dict(topology.lineNodes),
+        "nodeOrder": dict(topology.nodeOrder),
+        "pos": dict(topology.pos),
+    }
+
+
+def decodeTopology(encoded):
+    def tuples(mapping):
+        return MappingProxyType({key: tuple(value) for key, value in mapping.items()})
+
+    return Topology(
+        tuple(encoded["stations"]),
+        tuples(encoded["stationNodes"]),
+        tuples(encoded["stationPlatforms"]),
+        MappingProxyType(
+            {
+                (station, platform): node
+                for station, platform, node in encoded["platformNodes"]
+            }
+        ),
+        tuples(encoded["predecessors"]),
+        MappingProxyType(encoded["nodeLines"]),
+        tuples(encoded["lineNodes"]),
+        MappingProxyType(encoded["nodeOrder"]),
+        tuples(encoded["pos"]),
+    )
+
+
+def encodePublished(published):
+    """What a GraphUpdater publishes, as JSON values"""
+    return {
+        "format": SNAPSHOT_FORMAT,
+        "epoch": published["epoch"],
+        "snapshot": encodeSnapshot(published["snapshot"]),
+        "cycleStats": published["cycleStats"],
+        "topology": encodeTopology(published["topology"]),
+    }
+
+
+def decodePublished(encoded):
+    if encoded.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(
+            f"Snapshot is format {encoded.get('format')}, expected {SNAPSHOT_FORMAT}"
+        )
+    return {
+        "epoch": encoded["epoch"],
+        "snapshot": decodeSnapshot(encoded["snapshot"]),
+        "cycleStats": encoded["cycleStats"],
+        "topology": decodeTopology(encoded["topology"]),
+    }
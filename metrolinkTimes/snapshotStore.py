@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from stat import S_ISDIR
+
+from metrolinkTimes.snapshotFormat import decodePublished, encodePublished
+
+
+def runtimeDir():
+    """A directory for this user's files, in memory if there's a tmpfs for it
+
+    $XDG_RUNTIME_DIR is already private to the user, while /dev/shm and the
+    temporary directory are shared, so the directory is named after the user
+    and makePrivateDir() refuses it if someone else got there first.
+    """
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return Path(os.environ["XDG_RUNTIME_DIR"]) / "metrolinkTimes"
+    shared = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return Path(shared) / f"metrolinkTimes-{os.getuid()}"
+
+
+DEFAULT_SNAPSHOT_DIR = runtimeDir()
+DEFAULT_SNAPSHOT_FILE = str(DEFAULT_SNAPSHOT_DIR / "snapshot")
+
+
+def checkOwned(stat, path):
+    """Raise PermissionError unless only this user can have written path
+
+    For the default directory, where someone else could otherwise publish
+    snapshots for us to serve.
+    """
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+        raise PermissionError(f"{path} must be owned by and only writable by us")
+
+
+def makePrivateDir(path):
+    """Create path for this user alone, or check it's still only theirs"""
+    path.mkdir(mode=0o700, exist_ok=True)
+    stat = os.lstat(path)
+    if not S_ISDIR(stat.st_mode):
+        raise PermissionError(f"{path} isn't a directory")
+    checkOwned(stat, path)
+
+
+def prepareStorePath(path):
+    """Check a store's path before use, making the default directory"""
+    path = Path(path)
+    if path.parent == DEFAULT_SNAPSHOT_DIR:
+        makePrivateDir(path.parent)
+    return path
+
+
+class SnapshotStore:
+    """Hands each cycle's snapshot from the poller to whatever serves it
+
+    The poller calls write() with what it publishes, and readers call read()
+    for the newest. Backends only have to store and return bytes, encoded as
+    JSON by dumps() and loads(), and must never let a reader see a partial
+    write. Being data alone, a store can be shared by processes running as
+    different users.
+    """
+
+    def write(self, published):
+        raise NotImplementedError
+
+    def read(self):
+        """What was last published, or None if it hasn't changed or there's none"""
+        raise NotImplementedError
+
+    @staticmethod
+    def dumps(published):
+        return json.dumps(encodePublished(published), separators=(",", ":")).encode()
+
+    @staticmethod
+    def loads(data):
+        return decodePublished(json.loads(data))
+
+
+class FileSnapshotStore(SnapshotStore):
+    """Publishes to a file, for processes on the same machine
+
+    Each snapshot is written to a temporary file that's renamed over path,
+    so readers only ever see whole snapshots. A reader only decodes the
+    file when it has been replaced since it last looked.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_FILE):
+        self.path = prepareStorePath(path)
+        self.stamp = None
+
+    def write(self, published):
+        data = self.dumps(published)
+        fd, tmpPath = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name)
+        try:
+            with os.fdopen(fd, "wb") as tmpFile:
+                tmpFile.write(data)
+            os.replace(tmpPath, self.path)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+
+    def read(self):
+        try:
+            snapshotFile = self.path.open("rb")
+        except FileNotFoundError:
+            return None
+        with snapshotFile:
+            # Stat what was opened, as the path may since have been replaced
+            stat = os.fstat(snapshotFile.fileno())
+            stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if stamp == self.stamp:
+                return None
+            published = self.loads(snapshotFile.read())
+        self.stamp = stamp
+        return published
+
+
+class SQLiteSnapshotStore(SnapshotStore):
+    """Publishes to an SQLite database, which can be on a shared filesystem
+
+    Each snapshot is a row, and only the newest few are kept. Readers check
+    the newest row's ID before fetching it, so an unchanged snapshot costs
+    one small query.
+    """
+
+    def __init__(self, path=DEFAULT_SNAPSHOT_FILE, keep=2):
+        path = prepareStorePath(path)
+        self.keep = keep
+        self.lastID = None
+        # Calls can come from the event loop and the updater's thread
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self.lock, self.db:
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots"
+                " (id INTEGER PRIMARY KEY AUTOINCREMENT, published BLOB NOT NULL)"
+            )
+
+    def write(self, published):
+        data = self.dumps(published)
+        with self.lock, self.db:
+            rowID = self.db.execute(
+                "INSERT INTO snapshots (published) VALUES (?)", (data,)
+            ).lastrowid
+            self.db.execute("DELETE FROM snapshots WHERE id <= ?", (rowID - self.keep,))
+
+    def read(self):
+        with self.lock:
+            (rowID,) = self.db.execute("SELECT max(id) FROM snapshots").fetchone()
+            if rowID is None or rowID == self.lastID:
+                return None
+            row = self.db.execute(
+                "SELECT published FROM snapshots WHERE id = ?", (rowID,)
+            ).fetchone()
+        if row is None:
+            return None
+        self.lastID = rowID
+        return self.loads(row[0])
+
+
+# Backends by the name config uses for them
+SNAPSHOT_STORES = {
+    "file": FileSnapshotStore,
+    "sqlite": SQLiteSnapshotStore,
+}
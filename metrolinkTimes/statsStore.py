@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+from datetime import timedelta
+
+
+class RollingSeries:
+    """The most recent samples of one series, in a fixed-size ring buffer
+
+    A running total is kept as samples are added and dropped, so the average
+    is ready without summing the window again. The samples are handed out as
+    a tuple, which is kept until the next sample lands.
+    """
+
+    __slots__ = ["samples", "head", "count", "total", "average", "frozen"]
+
+    def __init__(self, window):
+        self.samples = [None] * window
+        self.head = 0
+        self.count = 0
+        self.total = timedelta()
+        self.average = None
+        self.frozen = ()
+
+    def add(self, sample):
+        window = len(self.samples)
+        if self.count == window:
+            self.total = self.total - self.samples[self.head]
+        else:
+            self.count = self.count + 1
+        self.samples[self.head] = sample
+        self.head = (self.head + 1) % window
+        self.total = self.total + sample
+        self.average = self.total / self.count
+        self.frozen = None
+
+    def values(self):
+        """Samples from oldest to newest"""
+        if self.frozen is None:
+            window = len(self.samples)
+            start = (self.head - self.count) % window
+            self.frozen = tuple(
+                self.samples[(start + i) % window] for i in range(self.count)
+            )
+        return self.frozen
+
+
+class StatsStore:
+    """Rolling averages of timedelta samples, each with a fallback chain
+
+    Every key can be given an ordered list of other keys to fall back to when
+    it has no samples of its own. The resolved average for each key is
+    cached, and only dropped when a sample lands on one of the keys it could
+    have resolved to. version goes up with every sample, so a reader can tell
+    whether anything changed since it last looked.
+    """
+
+    def __init__(self, window=5):
+        if window < 1:
+            raise ValueError(f"Stats window must be at least 1, not {window}")
+        self.window = window
+        self.series = {}
+        self.fallbacks = {}
+        self.dependents = {}
+        self.resolved = {}
+        self.version = 0
+
+    def setFallbacks(self, key, fallbacks):
+        self.fallbacks[key] = tuple(fallbacks)
+        for fallback in (key,) + self.fallbacks[key]:
+            self.dependents.setdefault(fallback, set()).add(key)
+        self.resolved.pop(key, None)
+
+    def add(self, key, sample):
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = RollingSeries(self.window)
+        series.add(sample)
+
+        self.version = self.version + 1
+        self.resolved.pop(key, None)
+        for dependent in self.dependents.get(key, ()):
+            self.resolved.pop(dependent, None)
+
+    def getAllSamples(self):
+        """Samples of every key with any, from oldest to newest"""
+        return {key: series.values() for key, series in self.series.items()}
+
+    def getSamples(self, key):
+        """Samples of key from oldest to newest, as a tuple"""
+        series = self.series.get(key)
+        if series is None:
+            return ()
+        return series.values()
+
+    def getAverage(self, key):
+        """Average of key's own samples, or None if it has none"""
+        series = self.series.get(key)
+        if series is None:
+            return None
+        return series.average
+
+    def getResolvedAverage(self, key):
+        """Average of key, or of its first fallback with samples
+
+        Returns (average, isDirectAverage), or (None, False) if neither key
+        nor any of its fallbacks has samples.
+        """
+        resolved = self.resolved.get(key)
+        if resolved is None:
+            resolved = self.resolve(key)
+            self.resolved[key] = resolved
+        return resolved
+
+    def resolve(self, key):
+        average = self.getAverage(key)
+        if average is not None:
+            return average, True
+        for fallback in self.fallbacks.get(key, ()):
+            average = self.getAverage(fallback)
+            if average is not None:
+                return average, False
+        return None, False
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import asyncio
+
+
+class Subscriber:
+    """One streaming client and the platforms it wants to hear about
+
+    Only the set of platforms that changed since the client was last sent
+    anything is kept, never the changes themselves. A client that falls
+    behind is sent the latest state of those platforms when it catches up,
+    so it costs no more memory than the platforms it subscribed to.
+    """
+
+    __slots__ = ["nodes", "pending", "event"]
+
+    def __init__(self, nodes):
+        self.nodes = frozenset(nodes)
+        # New clients start with the current state of everything
+        self.pending = set(self.nodes)
+        self.event = asyncio.Event()
+        self.event.set()
+
+    def notify(self, changed):
+        changed = self.nodes.intersection(changed)
+        if changed:
+            self.pending.update(changed)
+            self.event.set()
+
+    async def next(self, timeout):
+        """Wait for platforms to change, returning them
+
+        Raises TimeoutError if nothing changes within timeout seconds.
+        """
+        await asyncio.wait_for(self.event.wait(), timeout)
+        self.event.clear()
+        pending, self.pending = self.pending, set()
+        return pending
+
+
+class StreamHub:
+    """Tells streaming clients which of their platforms each cycle changed
+
+    Must only be used from the event loop's thread.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.version = None
+
+    def subscribe(self, nodes):
+        subscriber = Subscriber(nodes)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def publish(self, snapshot):
+        changed = snapshot.changed
+        if (self.version is not None) and snapshot.version != self.version + 1:
+            # Cycles were missed, so what changed in them isn't known
+            changed = snapshot.platforms.keys()
+        self.version = snapshot.version
+
+        for subscriber in self.subscribers:
+            subscriber.notify(changed)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import asyncio
+import logging
+import time
+
+
+class TfGMCache:
+    """TfGM data shared by every on-demand request in the process
+
+    Data is served from memory for ttl seconds after it was fetched. For a
+    further staleWhileRevalidate seconds it's still served straight away,
+    while a fetch runs in the background to replace it. Older than that,
+    requests wait for a fetch. Only one fetch is made at a time, and every
+    request that needs one waits on it.
+
+    If given, prepare is called on each fetch's data, and what it returns is
+    cached instead.
+
+    If a fetch fails the data isn't replaced, so it goes on being served
+    until it's too stale, and then requests get None.
+    """
+
+    def __init__(
+        self, api, ttl=5, staleWhileRevalidate=15, prepare=None, clock=time.monotonic
+    ):
+        self.api = api
+        self.prepare = prepare
+        self.ttl = ttl
+        self.staleWhileRevalidate = staleWhileRevalidate
+        self.clock = clock
+        self.data = None
+        self.fetchedAt = None
+        self.inflight = None
+
+    async def get(self):
+        if self.data is not None:
+            age = self.clock() - self.fetchedAt
+            if age < self.ttl:
+                return self.data
+            if age < self.ttl + self.staleWhileRevalidate:
+                self.refresh()
+                return self.data
+
+        # Shielded so one request being cancelled doesn't cancel the fetch
+        # for all the others
+        return await asyncio.shield(self.refresh())
+
+    def refresh(self):
+        """The in-flight fetch, starting one if there isn't one"""
+        # A fetch started on another event loop, as can happen between
+        # invocations, can't be waited on from this one
+        if (self.inflight is None) or (
+            self.inflight.get_loop() is not asyncio.get_running_loop()
+        ):
+            self.inflight = asyncio.ensure_future(self.fetch())
+            self.inflight.add_done_callback(self.fetched)
+        return self.inflight
+
+    @staticmethod
+    def fetched(task):
+        # Background fetches have nobody waiting on them, so failures are
+        # logged here, and what's cached goes on being served
+        if not task.cancelled() and task.exception() is not None:
+            logging.error(f"Error refreshing TfGM data: {task.exception()!r}")
+
+    async def fetch(self):
+        try:
+            data = await self.api.getDataAsync()
+            if data is not None:
+                if self.prepare is not None:
+                    data = self.prepare(data)
+                self.data = data
+                self.fetchedAt = self.clock()
+            return data
+        finally:
+            if self.inflight is asyncio.current_task():
+                self.inflight = None
@@ -1,14 +1,141 @@
 #!/usr/bin/env python3
 
-import http.client
+import asyncio
+import gzip
 import json
 import logging
 import os
-from time import sleep
+import socket
+import weakref
+from time import perf_counter, sleep
+from typing import NamedTuple
 
+import httpcore
+
+API_HOST = "api.tfgm.com"
+METROLINKS_PATH = "/odata/Metrolinks"
+
+# Returned by conditional fetches when upstream reports nothing has changed
+NOT_MODIFIED = object()
+
+
+class Validators(NamedTuple):
+    """What TfGM identified a response by, to ask whether it has changed"""
+
+    etag: str | None
+    lastModified: str | None
+
+
+class Fetched(NamedTuple):
+    """A fetched /odata/Metrolinks body and its validators"""
+
+    body: bytes
+    validators: Validators
+
+
+class TimedNetworkBackend(httpcore.AsyncNetworkBackend):
+    """Opens connections as httpcore would, recording DNS and TCP connect times
+
+    httpcore's traces only time connecting as a whole, so the name is looked
+    up here and the connection made to the addresses it returned, trying
+    each in turn. The connect timeout bounds the lookup and every attempt
+    together, each attempt getting only what's left of it.
+    """
 
-class TFGMMetrolinksAPI:
     def __init__(self):
+        self.backend = httpcore.AnyIOBackend()
+        self.connectTimings = {}
+        self.streams = weakref.WeakSet()
+
+    async def connect_tcp(
+        self, host, port, timeout=None, local_address=None, socket_options=None
+    ):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        start = perf_counter()
+        try:
+            async with asyncio.timeout_at(deadline):
+                addrInfo = await loop.getaddrinfo(
+                    host, port, type=socket.SOCK_STREAM, proto=socket.IPPROTO_TCP
+                )
+        except TimeoutError as e:
+            raise httpcore.ConnectTimeout(f"Timed out resolving {host}") from e
+        except OSError as e:
+            raise httpcore.ConnectError(f"Could not resolve {host}: {e}") from e
+        resolved = perf_counter()
+
+        err = None
+        for *_, sockAddr in addrInfo:
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise httpcore.ConnectTimeout(f"Timed out connecting to {host}")
+            try:
+                stream = await self.backend.connect_tcp(
+                    sockAddr[0], port, remaining, local_address, socket_options
+                )
+                break
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                err = e
+        else:
+            raise err or httpcore.ConnectError(f"No addresses for {host}")
+
+        self.connectTimings = {
+            "dns": resolved - start,
+            "connect": perf_counter() - resolved,
+        }
+        self.streams.add(stream)
+        return stream
+
+    def abort(self):
+        """Shut down every connection opened, without the event loop
+
+        For when the loop the connections belong to has closed, and so can't
+        close them itself. Their sockets are freed once nothing refers to
+        them.
+        """
+        for stream in list(self.streams):
+            sock = stream.get_extra_info("socket")
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except (AttributeError, OSError):
+                pass
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self.backend.connect_unix_socket(path, timeout, socket_options)
+
+    async def sleep(self, seconds):
+        await self.backend.sleep(seconds)
+
+
+# What a kept-alive connection TfGM has since closed fails with when reused
+STALE_CONNECTION_ERRORS = (
+    httpcore.RemoteProtocolError,
+    httpcore.ReadError,
+    httpcore.WriteError,
+)
+
+# What fetching can fail with, short of a bug
+FETCH_ERRORS = (
+    httpcore.TimeoutException,
+    httpcore.NetworkError,
+    httpcore.ProtocolError,
+    httpcore.UnsupportedProtocol,
+)
+
+
+def responseHeader(response, name):
+    """The first value of a response's header, or None"""
+    name = name.lower().encode()
+    for key, value in response.headers:
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+class TFGMMetrolinksAPI:
+    def __init__(self, conf=None):
         # Look for config file in multiple locations (local first, then system)
         config_paths = [
             "config/metrolinkTimes.conf",  # Local to project
@@ -19,19 +146,25 @@ class TFGMMetrolinksAPI:
 
         self.conf = {"Ocp-Apim-Subscription-Key": None}
 
-        for config_path in config_paths:
-            try:
-                with open(config_path) as conf_file:
-                    self.conf = json.load(conf_file)
-                    logging.info(f"Loaded config from {config_path}")
-                    break
-            except FileNotFoundError:
-                continue
-            except json.JSONDecodeError as e:
-                logging.error(f"Invalid JSON in config file {config_path}: {e}")
-                continue
+        if conf is not None:
+            # Config already loaded, such as the app's, rather than the file
+            self.conf = dict(conf)
         else:
-            logging.warning("No config file found. Checked: " + ", ".join(config_paths))
+            for config_path in config_paths:
+                try:
+                    with open(config_path) as conf_file:
+                        self.conf = json.load(conf_file)
+                        logging.info(f"Loaded config from {config_path}")
+                        break
+                except FileNotFoundError:
+                    continue
+                except json.JSONDecodeError as e:
+                    logging.error(f"Invalid JSON in config file {config_path}: {e}")
+                    continue
+            else:
+                logging.warning(
+                    "No config file found. Checked: " + ", ".join(config_paths)
+                )
 
         # Check for API key in environment variable if not found in config
         if not self.conf.get("Ocp-Apim-Subscription-Key"):
@@ -44,47 +177,193 @@ class TFGMMetrolinksAPI:
                     "No TfGM API key found in config or environment variable TFGM_API_KEY"
                 )
 
+        # One kept-alive connection is shared by every fetch, so polling
+        # doesn't pay for a TLS handshake each second
+        self.baseURL = f"https://{API_HOST}"
+        self.connectTimeout = self.conf.get("connect_timeout", 5)
+        self.readTimeout = self.conf.get("read_timeout", 10)
+        self.pool = None
+        self.poolLoop = None
+        self.networkBackend = None
+        self.lastTiming = {}
+
     def getData(self):
+        """getDataAsync for scripts, which don't have an event loop running"""
+
+        async def fetch():
+            try:
+                return await self.getDataAsync()
+            finally:
+                await self.aclose()
+
+        return asyncio.run(fetch())
+
+    async def getDataAsync(self):
         if not self.conf.get("Ocp-Apim-Subscription-Key"):
             logging.warning("No TfGM API key configured, returning None")
             return None
 
         try:
-            logging.info("Fetching data from TfGM API at api.tfgm.com/odata/Metrolinks")
-            headers = {
-                # Request headers
-                "Ocp-Apim-Subscription-Key": self.conf["Ocp-Apim-Subscription-Key"],
-            }
-            conn = http.client.HTTPSConnection("api.tfgm.com")
-            conn.request("GET", "/odata/Metrolinks", "{body}", headers)
-            response = conn.getresponse()
-
-            logging.info(f"TfGM API response status: {response.status}")
-
-            data = json.loads(response.read().decode("utf-8"))
-            conn.close()
-
-            retData = {}
-            for platform in data["value"]:
-                sl = platform["StationLocation"]
-                if sl not in retData:
-                    retData[sl] = {}
-
-                ac = platform["AtcoCode"]
-                if platform["AtcoCode"] not in retData[sl]:
-                    retData[sl][ac] = []
-
-                retData[sl][ac].append(platform)
-
-            logging.info(
-                f"Successfully processed TfGM data: {len(retData)} stations, {len(data['value'])} platforms"
-            )
-            return retData
+            fetched = await self.fetchRawAsync()
+            if fetched is None:
+                return None
+            return self.parseData(fetched.body)
 
         except Exception as e:
             logging.error(f"Error fetching TfGM data: {e}")
             return None
 
+    async def fetchRawAsync(self, validators=None):
+        """Fetch the raw /odata/Metrolinks body without blocking the event loop
+
+        Returns it as Fetched, with its validators. Given the validators of
+        an earlier response, they're sent upstream and NOT_MODIFIED is
+        returned if TfGM answers 304. Which to send is left to the caller,
+        so it can keep sending the last ones it used until it has used newer.
+        """
+        if not self.conf.get("Ocp-Apim-Subscription-Key"):
+            logging.warning("No TfGM API key configured, returning None")
+            return None
+
+        # A pool's connections belong to the event loop that opened them
+        loop = asyncio.get_running_loop()
+        if self.poolLoop not in (None, loop):
+            await self.aclose()
+        self.poolLoop = loop
+        if self.pool is None:
+            self.networkBackend = TimedNetworkBackend()
+            self.pool = httpcore.AsyncConnectionPool(
+                max_connections=1,
+                max_keepalive_connections=1,
+                network_backend=self.networkBackend,
+            )
+
+        async def trace(event, info):
+            marks[event] = perf_counter()
+            if event == "connection.connect_tcp.started":
+                timing["reused"] = False
+
+        headers = {
+            "Ocp-Apim-Subscription-Key": self.conf["Ocp-Apim-Subscription-Key"],
+            "Accept-Encoding": "gzip",
+        }
+        if validators is not None:
+            if validators.etag is not None:
+                headers["If-None-Match"] = validators.etag
+            if validators.lastModified is not None:
+                headers["If-Modified-Since"] = validators.lastModified
+
+        logging.info("Fetching data from TfGM API at api.tfgm.com/odata/Metrolinks")
+        for attempt in range(2):
+            timing = {"reused": True}
+            marks = {}
+            start = perf_counter()
+            try:
+                response = await self.pool.request(
+                    "GET",
+                    self.baseURL + METROLINKS_PATH,
+                    headers=headers,
+                    extensions={
+                        "trace": trace,
+                        "timeout": {
+                            "connect": self.connectTimeout,
+                            "read": self.readTimeout,
+                            "write": self.readTimeout,
+                            "pool": self.readTimeout,
+                        },
+                    },
+                )
+                break
+            except STALE_CONNECTION_ERRORS as e:
+                # The pool drops the failed connection, so the retry opens a
+                # new one. Timeouts aren't retried, as that would only double
+                # the wait
+                if timing["reused"] and attempt == 0:
+                    logging.info("TfGM API connection went stale, reconnecting")
+                    continue
+                logging.error(f"Error fetching TfGM data: {e!r}")
+                return None
+            except FETCH_ERRORS as e:
+                logging.error(f"Error fetching TfGM data: {e!r}")
+                return None
+        end = perf_counter()
+
+        if not timing["reused"]:
+            timing.update(self.networkBackend.connectTimings)
+        for name, phase in [
+            ("tls", "connection.start_tls"),
+            ("body", "http11.receive_response_body"),
+        ]:
+            if f"{phase}.complete" in marks:
+                timing[name] = marks[f"{phase}.complete"] - marks[f"{phase}.started"]
+        if "http11.receive_response_headers.complete" in marks:
+            timing["ttfb"] = marks["http11.receive_response_headers.complete"] - start
+        timing["total"] = end - start
+        timing["bytes"] = len(response.content)
+        self.lastTiming = timing
+
+        logging.info(f"TfGM API response status: {response.status}")
+        logging.info(
+            "TfGM API timing: "
+            + ", ".join(
+                f"{k}={v * 1000:.1f}ms" if isinstance(v, float) else f"{k}={v}"
+                for k, v in timing.items()
+            )
+        )
+        if (validators is not None) and response.status == 304:
+            return NOT_MODIFIED
+        if response.status != 200:
+            logging.error(f"Unexpected TfGM API response status: {response.status}")
+            return None
+
+        body = response.content
+        if responseHeader(response, "Content-Encoding") == "gzip":
+            try:
+                body = gzip.decompress(body)
+            except (OSError, EOFError) as e:
+                logging.error(f"Error decompressing TfGM data: {e!r}")
+                return None
+
+        return Fetched(
+            body,
+            Validators(
+                responseHeader(response, "ETag"),
+                responseHeader(response, "Last-Modified"),
+            ),
+        )
+
+    async def aclose(self):
+        pool, self.pool = self.pool, None
+        if pool is None:
+            return
+        loop = self.poolLoop
+        if (loop is not None) and loop.is_closed() and self.networkBackend:
+            # Closing through the pool would need the loop that's gone
+            self.networkBackend.abort()
+            return
+        await pool.aclose()
+
+    @staticmethod
+    def parseData(body):
+        data = json.loads(body)
+
+        retData = {}
+        for platform in data["value"]:
+            sl = platform["StationLocation"]
+            if sl not in retData:
+                retData[sl] = {}
+
+            ac = platform["AtcoCode"]
+            if platform["AtcoCode"] not in retData[sl]:
+                retData[sl][ac] = []
+
+            retData[sl][ac].append(platform)
+
+        logging.info(
+            f"Successfully processed TfGM data: {len(retData)} stations, {len(data['value'])} platforms"
+        )
+        return retData
+
 
 def dataTest(api):
     data = api.getData()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import hashlib
+import logging
+from datetime import datetime
+from functools import cache
+from typing import NamedTuple
+
+from metrolinkTimes.compiledTopology import loadTopology
+from metrolinkTimes.tramRecords import PIDTram
+
+# Names TfGM shows on PIDs for stations we know by another name
+STATION_MAPPINGS = {
+    "Ashton-under-Lyne": "Ashton-Under-Lyne",
+    "Deansgate Castlefield": "Deansgate - Castlefield",
+    "Deansgate": "Deansgate - Castlefield",
+    "Ashton": "Ashton-Under-Lyne",
+    "MCUK": "MediaCityUK",
+    "Newton Heath": "Newton Heath and Moston",
+    "Victoria Millgate Siding": "Victoria",
+    "Rochdale Stn": "Rochdale Railway Station",
+    "Trafford Centre": "The Trafford Centre",
+    "intu Trafford Centre": "The Trafford Centre",
+    "Wythen. Town": "Wythenshawe Town Centre",
+}
+
+# Destinations shown on PIDs that aren't stations
+SPECIAL_DESTS = frozenset({"Terminates Here", "See Tram Front", "Not in Service"})
+
+
+@cache
+def loadStationNames():
+    """The stations in the compiled topology, for when there's no graph to ask"""
+    return frozenset(loadTopology()["stations"])
+
+
+def decodeMessage(messageBoard):
+    """A PID's message, or None if it isn't showing one"""
+    if (
+        not messageBoard
+        or messageBoard.startswith("^F0")
+        or messageBoard == "<no message>"
+    ):
+        return None
+    return messageBoard.replace("^$", "")
+
+
+def decodeTrams(apiPID, validDests):
+    """The trams on a PID, with destinations under the names we know them by
+
+    Trams going somewhere that isn't in validDests are left out, as are any
+    TfGM gives no usable wait for.
+    """
+    pidTrams = []
+    for i in range(4):
+        stationName = apiPID.get(f"Dest{i}", "")
+        if stationName == "":
+            continue
+        try:
+            wait = int(apiPID.get(f"Wait{i}"))
+        except (TypeError, ValueError):
+            logging.error(f"Bad wait {apiPID.get(f'Wait{i}')!r} for {stationName}")
+            continue
+        viaName = None
+
+        if " via " in stationName:
+            stationName, viaName = stationName.split(" via ", 1)
+
+        stationName = STATION_MAPPINGS.get(stationName, stationName)
+        if viaName is not None:
+            viaName = STATION_MAPPINGS.get(viaName, viaName)
+
+        if stationName not in validDests:
+            logging.error(f"Unknown station {stationName}")
+            continue
+        if (viaName is not None) and (viaName not in validDests):
+            logging.error(f"Unknown station {viaName}")
+            viaName = None
+
+        pidTrams.append(
+            PIDTram(
+                dest=stationName,
+                via=viaName,
+                carriages=apiPID.get(f"Carriages{i}", ""),
+                status=apiPID.get(f"Status{i}", ""),
+                wait=wait,
+            )
+        )
+    return tuple(pidTrams)
+
+
+class TfGMPlatform(NamedTuple):
+    """One platform's PID, decoded"""
+
+    platformID: str
+    direction: str
+    message: str | None
+    lastUpdated: str
+    updateTime: datetime
+    pidTrams: tuple[PIDTram, ...]
+
+
+class TfGMSnapshot:
+    """A TfGM payload decoded once, for everything that reads it
+
+    stations maps each station name to its platforms by platform ID. Only
+    the first record TfGM gives for a platform is used. digest identifies the
+    payload by when each platform was last updated.
+    """
+
+    __slots__ = ["stations", "digest"]
+
+    def __init__(self, data, stationNames=None):
+        if stationNames is None:
+            stationNames = loadStationNames()
+        validDests = frozenset(stationNames) | SPECIAL_DESTS
+
+        self.stations = {}
+        digest = hashlib.blake2b(digest_size=8)
+        for stationName in sorted(data):
+            platforms = self.stations[stationName] = {}
+            for platformID in sorted(data[stationName]):
+                records = data[stationName][platformID]
+                for record in records:
+                    digest.update(f"{record.get('LastUpdated')}\n".encode())
+                if not records:
+                    continue
+
+                apiPID = records[0]
+                lastUpdated = apiPID.get("LastUpdated")
+                try:
+                    updateTime = datetime.strptime(lastUpdated, "%Y-%m-%dT%H:%M:%SZ")
+                except (TypeError, ValueError):
+                    # Without it the PID can't be placed in time, so it's left
+                    # out rather than failing the whole payload
+                    logging.error(
+                        f"Bad LastUpdated {lastUpdated!r} for {stationName} {platformID}"
+                    )
+                    continue
+                platforms[platformID] = TfGMPlatform(
+                    platformID,
+                    apiPID.get("Direction", ""),
+                    decodeMessage(apiPID.get("MessageBoard")),
+                    lastUpdated,
+                    updateTime,
+                    decodeTrams(apiPID, validDests),
+                )
+        self.digest = digest.hexdigest()
+
+    def getStation(self, stationName):
+        """A station's platforms by platform ID, or None if there's no such station"""
+        return self.stations.get(stationName)
@@ -1,104 +1,354 @@
 #!/usr/bin/env python3
 
-import json
+import dataclasses
+import heapq
 import logging
 import operator
-import os
-from copy import deepcopy
 from datetime import datetime, timedelta
+from types import MappingProxyType
 
-import matplotlib.pyplot as plt
 import networkx as nx
 
-
-class TramGraph:
-    def __init__(self):
+from metrolinkTimes.compiledTopology import loadTopology
+from metrolinkTimes.graphReader import GraphReader, Topology
+from metrolinkTimes.networkSnapshot import NetworkSnapshot, PlatformSnapshot
+from metrolinkTimes.networkState import GraphState
+from metrolinkTimes.statsStore import StatsStore
+from metrolinkTimes.tramMatching import TramBuckets, tramKey
+from metrolinkTimes.tramRecords import UNSET, PredictedArrival, Tram
+
+# Per-platform tram state a restarted graph can't rebuild in a cycle
+CHECKPOINT_FIELDS = (
+    "tramsHere",
+    "tramsHereDeb",
+    "tramsApproachingDeb",
+    "tramsDeparted",
+)
+
+
+class TramGraph(GraphReader):
+    def __init__(self, incremental=True, statsWindow=5, changeHistory=60):
         self.DG = nx.DiGraph()
         self.pos = {}
         self.stations = []
         self.firstRun = True
         self.debounceCount = 2
-        self.localUpdateTime = None
-
-        data = json.load(open(f"{os.path.dirname(__file__)}/data/stations.json"))
-        self.stations = data.keys()
-        for s in data:
-            for p in data[s]:
-                nodeID = f"{s}_{p}"
-                self.DG.add_node(nodeID)
-                self.DG.nodes[nodeID]["stationName"] = s
-                self.DG.nodes[nodeID]["platformID"] = p
-                self.DG.nodes[nodeID]["pidTrams"] = []
-                self.DG.nodes[nodeID]["message"] = None
-                self.DG.nodes[nodeID]["updateTime"] = datetime.min
-
-                self.DG.nodes[nodeID]["tramsDeparting"] = []
-                self.DG.nodes[nodeID]["tramsArrived"] = []
-                self.DG.nodes[nodeID]["tramsDue"] = []
-
-                self.DG.nodes[nodeID]["tramsApproaching"] = []
-                self.DG.nodes[nodeID]["tramsApproachingDeb"] = []
-                self.DG.nodes[nodeID]["prevTramsHere"] = []
-                self.DG.nodes[nodeID]["tramsHere"] = []
-                self.DG.nodes[nodeID]["tramsHereDeb"] = []
-                self.DG.nodes[nodeID]["tramsDeparted"] = []
-
-                self.DG.nodes[nodeID]["fTramsHere"] = []
-                self.DG.nodes[nodeID]["fTramsDeparted"] = []
-                self.DG.nodes[nodeID]["fTramsApproaching"] = []
-
-                self.DG.nodes[nodeID]["predictedArrivals"] = []
-                self.DG.nodes[nodeID]["dwellTimes"] = []
-
-                self.pos[nodeID] = [data[s][p]["map"]["x"], data[s][p]["map"]["y"]]
-
-                for inSP in data[s][p]["stationsBefore"]:
-                    inS = None
-
-                    for thisInS in data:
-                        if inSP in data[thisInS]:
-                            inS = thisInS
-
-                    self.DG.add_edge(f"{inS}_{inSP}", nodeID)
-                    self.DG.edges[f"{inS}_{inSP}", nodeID]["transitTimes"] = []
-
-                    if data[s][p].get("terminating", False):
-                        self.DG.edges[f"{inS}_{inSP}", nodeID]["weight"] = 2
-                    else:
-                        self.DG.edges[f"{inS}_{inSP}", nodeID]["weight"] = 1
+
+        # Rolling dwell times by platform and transit times by edge
+        self.dwellStats = StatsStore(statsWindow)
+        self.transitStats = StatsStore(statsWindow)
+
+        # How many cycles of changed platforms snapshots remember
+        self.changeHistory = changeHistory
+
+        # Incremental processing state. Platforms whose PID record changed
+        # since the last cycle are dirty, and "versions" holds the cycle in
+        # which each input a prediction can depend on last changed
+        self.incremental = incremental
+        self.cycle = 0
+        self.dirtyNodes = set()
+        self.versions = {}
+        self.predictionCache = {}
+        self.usedPredictions = {}
+        self.predictionDeps = None
+
+        # Compiled from stations.json by compiledTopology, already validated
+        # and with every edge resolved
+        topology = loadTopology()
+        self.stations = topology["stations"]
+        nodeIDs = []
+        for stationNum, p, line, x, y in topology["platforms"]:
+            s = self.stations[stationNum]
+            nodeID = f"{s}_{p}"
+            nodeIDs.append(nodeID)
+            self.DG.add_node(nodeID, stationName=s, platformID=p, line=line)
+            self.pos[nodeID] = [x, y]
+        self.DG.add_edges_from(
+            (nodeIDs[start], nodeIDs[end], {"weight": weight})
+            for start, end, weight in topology["edges"]
+        )
+
+        # networkx is only used to build the topology, per platform state is
+        # reached straight through the nodes' attribute dicts
+        self.state = GraphState(self.DG)
+
+        self.buildIndexes()
+        self.buildRoutes()
+        self.buildStatsFallbacks()
+
+        # What readers see. Only ever replaced whole, never changed
+        self.snapshot = None
+        self.snapshotTransitVersion = None
+        self.snapshot = self.buildSnapshot(None)
+
+    def buildIndexes(self):
+        """Index the static topology so lookups don't scan every node
+
+        These never change after startup, so they are built read-only.
+        """
+        stationNodes = {}
+        for node in self.state:
+            stationName = self.state[node]["stationName"]
+            stationNodes.setdefault(stationName, []).append(node)
+
+        self.stationNodes = MappingProxyType(
+            {s: tuple(nodes) for s, nodes in stationNodes.items()}
+        )
+        self.stationPlatforms = MappingProxyType(
+            {
+                s: tuple(self.state[n]["platformID"] for n in nodes)
+                for s, nodes in stationNodes.items()
+            }
+        )
+        self.platformNodes = MappingProxyType(
+            {
+                (self.state[n]["stationName"], self.state[n]["platformID"]): n
+                for n in nx.nodes(self.DG)
+            }
+        )
+        self.predecessors = MappingProxyType(
+            {n: tuple(self.DG.pred[n]) for n in nx.nodes(self.DG)}
+        )
+        lineNodes = {}
+        for node in self.state:
+            line = self.state[node]["line"]
+            if line is not None:
+                lineNodes.setdefault(line, []).append(node)
+        self.lineNodes = MappingProxyType(
+            {line: tuple(nodes) for line, nodes in lineNodes.items()}
+        )
+        self.nodeLines = MappingProxyType(
+            {node: self.state[node]["line"] for node in self.state}
+        )
+        self.edgeList = tuple(self.DG.edges)
+        self.nodeOrder = MappingProxyType(
+            {n: i for i, n in enumerate(nx.nodes(self.DG))}
+        )
+        self.successorStations = MappingProxyType(
+            {
+                n: frozenset(
+                    self.state[succ]["stationName"] for succ in self.DG.succ[n]
+                )
+                for n in nx.nodes(self.DG)
+            }
+        )
+
+        # What processes serving this graph's snapshots need to know of it
+        self.topology = Topology(
+            tuple(self.stations),
+            self.stationNodes,
+            self.stationPlatforms,
+            self.platformNodes,
+            self.predecessors,
+            self.nodeLines,
+            self.lineNodes,
+            self.nodeOrder,
+            MappingProxyType({n: tuple(pos) for n, pos in self.pos.items()}),
+        )
+
+    def buildRoutes(self):
+        """Precompute the route between every pair of platforms
+
+        The topology never changes, so rather than searching for a path per
+        tram every cycle, run a search out from each platform once and keep
+        the paths and their lengths. Paths are chosen exactly as
+        nx.astar_path would, ties included.
+
+        The nearest platform of every station from every platform is kept
+        twice: once for trams passing through, where a terminating platform
+        costs 2 (its edge weight) to reach, and once for trams stopping
+        there, where it costs 1 like any other stop and wins ties.
+        """
+        self.routes = {}
+        self.routeLengths = {}
+        self.nearestPlatforms = {}
+        self.nearestStops = {}
+
+        for start in nx.nodes(self.DG):
+            parents, lengths = self.searchFrom(start)
+
+            routes = {}
+            for end in parents:
+                path = [end]
+                while parents[path[-1]] is not None:
+                    path.append(parents[path[-1]])
+                path.reverse()
+                routes[end] = path
+            self.routes[start] = routes
+            self.routeLengths[start] = lengths
+
+            for stationName, platforms in self.stationNodes.items():
+                reachable = [p for p in platforms if p in lengths]
+                if not reachable:
+                    self.nearestPlatforms[start, stationName] = None
+                    self.nearestStops[start, stationName] = None
+                    continue
+
+                # min keeps the first of equals, as the A* search did
+                self.nearestPlatforms[start, stationName] = min(
+                    reachable, key=lambda p: lengths[p]
+                )
+                self.nearestStops[start, stationName] = min(
+                    reachable, key=lambda p: self.getStopLength(start, p)
+                )
+
+    def getStopLength(self, start, end):
+        # Weight of the route to a stop, then False for a terminating
+        # platform so that it sorts first among equals
+        path = self.routes[start][end]
+        length = self.routeLengths[start][end]
+        if len(path) < 2:
+            return length, True
+        weight = self.DG.edges[path[-2], end]["weight"]
+        return length - weight + 1, weight == 1
+
+    def searchFrom(self, start):
+        # Dijkstra with the same queue ordering as nx.astar_path with no
+        # heuristic, run until every reachable platform has been settled
+        queue = [(0, 0, start, None)]
+        pushed = 1
+        enqueued = {}
+        parents = {}
+        lengths = {}
+
+        while queue:
+            dist, _, node, parent = heapq.heappop(queue)
+            if node in parents:
+                if parents[node] is None or enqueued[node] < dist:
+                    continue
+            parents[node] = parent
+            lengths[node] = dist
+
+            for neighbour, edge in self.DG.adj[node].items():
+                ndist = dist + edge["weight"]
+                if neighbour in enqueued and enqueued[neighbour] <= ndist:
+                    continue
+                enqueued[neighbour] = ndist
+                heapq.heappush(queue, (ndist, pushed, neighbour, node))
+                pushed = pushed + 1
+
+        return parents, lengths
+
+    def getRoute(self, start, end):
+        try:
+            return self.routes[start][end]
+        except KeyError:
+            raise nx.NetworkXNoPath(f"Node {end} not reachable from {start}")
+
+    def buildStatsFallbacks(self):
+        # A platform with no dwell times of its own uses the first sibling
+        # platform that has some
+        for node in self.state:
+            station = self.state[node]["stationName"]
+            self.dwellStats.setFallbacks(
+                node, [n for n in self.stationNodes[station] if n != node]
+            )
+
+        # An edge with no transit times of its own uses the first other edge
+        # between the same two stations that has some, preferring those in
+        # the same direction
+        for start, end in self.DG.edges:
+            startStation = self.state[start]["stationName"]
+            endStation = self.state[end]["stationName"]
+
+            startNodes = [
+                node
+                for node in self.stationNodes[startStation]
+                if node not in [start, end]
+            ]
+            endNodes = []
+            if endStation != startStation:
+                endNodes = [
+                    node
+                    for node in self.stationNodes[endStation]
+                    if node not in [start, end]
+                ]
+
+            fallbacks = []
+            for startNode in startNodes:
+                for endNode in endNodes + [end]:
+                    if self.DG.has_edge(startNode, endNode):
+                        fallbacks.append((startNode, endNode))
+            for endNode in endNodes + [end]:
+                for startNode in startNodes + [start]:
+                    if self.DG.has_edge(endNode, startNode):
+                        fallbacks.append((endNode, startNode))
+            self.transitStats.setFallbacks((start, end), fallbacks)
 
     def updatePlatformPID(self, nodeID, PIDTramData, message, updateTime):
-        self.DG.nodes[nodeID]["pidTrams"] = PIDTramData
-        self.DG.nodes[nodeID]["message"] = message
-        self.DG.nodes[nodeID]["updateTime"] = updateTime
+        node = self.state[nodeID]
+        if (
+            node["updateTime"] == updateTime
+            and node["message"] == message
+            and node["pidTrams"] == PIDTramData
+        ):
+            return False
+
+        node["pidTrams"] = PIDTramData
+        node["message"] = message
+        node["updateTime"] = updateTime
+        self.dirtyNodes.add(nodeID)
+        return True
+
+    def getAffectedNodes(self):
+        # Trams leaving one platform can be picked up by another at the same
+        # station, so a dirty platform's siblings have to be located again too.
+        # Keep them in graph order, as a full cycle would visit them
+        stations = {self.state[node]["stationName"] for node in self.dirtyNodes}
+        return sorted(
+            (node for station in stations for node in self.stationNodes[station]),
+            key=self.nodeOrder.__getitem__,
+        )
+
+    def bumpVersion(self, key):
+        self.versions[key] = self.cycle
+
+    def predictionStale(self, departTime, cycle, deps):
+        for key in deps:
+            if key[0] == "before":
+                if self.state[key[1]]["updateTime"] > departTime + key[2]:
+                    return True
+            elif self.versions.get(key, 0) > cycle:
+                return True
+        return False
+
+    def addPredictionDep(self, key):
+        if self.predictionDeps is not None:
+            self.predictionDeps.add(key)
 
     def decodePID(self, node):
         # Locate trams & seperate by PID state
-        self.DG.nodes[node]["tramsDeparting"] = []
-        self.DG.nodes[node]["tramsArrived"] = []
-        self.DG.nodes[node]["tramsApproaching"] = []
-        self.DG.nodes[node]["tramsDue"] = []
-        self.DG.nodes[node]["prevTramsHere"] = self.DG.nodes[node]["tramsHere"]
-        self.DG.nodes[node]["tramsHere"] = []
-
-        for tram in self.DG.nodes[node]["pidTrams"]:
-            if tram["dest"] in ["Terminates Here", "See Tram Front", "Not in Service"]:
+        self.state[node]["tramsDeparting"] = []
+        self.state[node]["tramsArrived"] = []
+        self.state[node]["tramsApproaching"] = []
+        self.state[node]["tramsDue"] = []
+        self.state[node]["prevTramsHere"] = self.state[node]["tramsHere"]
+        self.state[node]["tramsHere"] = []
+
+        for pidTram in self.state[node]["pidTrams"]:
+            if pidTram.dest in [
+                "Terminates Here",
+                "See Tram Front",
+                "Not in Service",
+            ]:
                 continue
 
-            status = tram["status"]
-            del tram["status"]
+            # PID records are left untouched so the platform can be decoded
+            # again when only a neighbour has changed
+            status = pidTram.status
+            tram = Tram.fromPID(pidTram)
             # We'll remove exact duplicates at the same time here
             # Can happen on stops with multiple PIDs or with bugs in the
             # data
             if status == "Departing":
-                if tram not in self.DG.nodes[node]["tramsDeparting"]:
-                    self.DG.nodes[node]["tramsDeparting"].append(tram)
+                if tram not in self.state[node]["tramsDeparting"]:
+                    self.state[node]["tramsDeparting"].append(tram)
             elif status == "Arrived":
-                if tram not in self.DG.nodes[node]["tramsArrived"]:
-                    self.DG.nodes[node]["tramsArrived"].append(tram)
+                if tram not in self.state[node]["tramsArrived"]:
+                    self.state[node]["tramsArrived"].append(tram)
             elif status == "Due":
-                if tram not in self.DG.nodes[node]["tramsDue"]:
-                    self.DG.nodes[node]["tramsDue"].append(tram)
+                if tram not in self.state[node]["tramsDue"]:
+                    self.state[node]["tramsDue"].append(tram)
             else:
                 logging.error(f"Unknown tram status: {status}")
 
@@ -106,131 +356,87 @@ class TramGraph:
         # Calculate dwell times for departed trams
         if tramsDeparted != []:
             for tram in tramsDeparted:
-                if "status" in tram:
-                    del tram["status"]
-                if "wait" in tram:
-                    del tram["wait"]
-                tram["departTime"] = self.DG.nodes[node]["updateTime"]
-
-                if tram["arriveTime"] is None:
-                    tram["dwellTime"] = None
+                tram.wait = UNSET
+                tram.departTime = self.state[node]["updateTime"]
+
+                if tram.arriveTime is None:
+                    tram.dwellTime = None
                 else:
-                    tram["dwellTime"] = tram["departTime"] - tram["arriveTime"]
-                    if tram["dwellTime"] != timedelta():
-                        self.DG.nodes[node]["dwellTimes"].append(tram["dwellTime"])
-                        # Only keep track of 5 most recent dwell times
-                        self.DG.nodes[node]["dwellTimes"] = self.DG.nodes[node][
-                            "dwellTimes"
-                        ][-5:]
+                    tram.dwellTime = tram.departTime - tram.arriveTime
+                    if tram.dwellTime != timedelta():
+                        self.bumpVersion(("dwell", self.state[node]["stationName"]))
+                        self.dwellStats.add(node, tram.dwellTime)
 
             averageDwell, isDirectAverage = self.getAverageDwell(node)
             for tram in tramsDeparted:
-                tram["averageDwell"] = averageDwell
+                tram.averageDwell = averageDwell
 
     def locateApproaching(self, node):
-        pTramsMatched = []  # Only match pTrams once
+        # Only match pTrams once
+        pTrams = TramBuckets(self.state[node]["predictedArrivals"])
 
-        for tram in self.DG.nodes[node]["tramsDue"]:
-            tramStartsHere = True
-            wait = tram["wait"] if "wait" in tram else 0
+        for tram in self.state[node]["tramsDue"]:
+            wait = tram.wait if tram.wait is not UNSET else 0
+            # Delta allows for variance between our predictions & TfGM's
+            tramTime = self.state[node]["updateTime"] + timedelta(minutes=wait)
 
-            for pTram in self.DG.nodes[node]["predictedArrivals"]:
-                if pTram in pTramsMatched:
-                    continue
-                # Delta allows for variance between our predictions & TfGM's
-                tramTime = self.DG.nodes[node]["updateTime"] + timedelta(minutes=wait)
-                tramDelta = abs(pTram["predictedArriveTime"] - tramTime)
-                if (
-                    (pTram["curLoc"]["platform"] != node)
-                    and (tram["dest"] == pTram["dest"])
-                    and (tram["carriages"] == pTram["carriages"])
-                    and tramDelta < timedelta(minutes=2)
-                ):
-                    tramStartsHere = False
-                    pTramsMatched.append(pTram)
-                    break
+            def isSameTram(pTram, tramTime=tramTime):
+                tramDelta = abs(pTram.predictedArriveTime - tramTime)
+                return (pTram.platform != node) and (tramDelta < timedelta(minutes=2))
+
+            tramStartsHere = pTrams.take(tram, isSameTram) is None
 
             if tramStartsHere:
-                tram["startsHere"] = tramStartsHere
-                self.DG.nodes[node]["tramsApproaching"].append(tram)
+                tram.startsHere = tramStartsHere
+                self.state[node]["tramsApproaching"].append(tram)
 
     def locateDeparting(self, node):
         # Locate departing trams
-        tramsAt = (
-            self.DG.nodes[node]["tramsDeparting"] + self.DG.nodes[node]["tramsArrived"]
+        tramsAt = TramBuckets(
+            self.state[node]["tramsDeparting"] + self.state[node]["tramsArrived"]
         )
         tramsDeparted = []
 
         # Reverse to make sure newer trams matched first
-        for prevTramHere in reversed(self.DG.nodes[node]["prevTramsHere"]):
-            tramFound = False
-            for tram in tramsAt:
-                if (
-                    (prevTramHere["dest"] == tram["dest"])
-                    and (prevTramHere["carriages"] == tram["carriages"])
-                    and "matched" not in tram
-                ):
-                    tramFound = True
-                    tram["matched"] = True
-                    break
-            if not tramFound:
+        for prevTramHere in reversed(self.state[node]["prevTramsHere"]):
+            if tramsAt.take(prevTramHere) is None:
                 # if in other platform at this station, copy to there
-                statName = self.DG.nodes[node]["stationName"]
-                platIDs = self.getStationPlatforms(statName)
-                nodeIDs = [f"{statName}_{p}" for p in platIDs]
-                nodeIDs.remove(node)
-                tramFound = False
-                for otherNode in nodeIDs:
-                    for state in ["tramsDeparting", "tramsArrived"]:
-                        for tram in self.DG.nodes[otherNode][state]:
-                            if (prevTramHere["dest"] == tram["dest"]) and (
-                                prevTramHere["carriages"] == tram["carriages"]
-                            ):
-                                tramFound = True
-                                self.DG.nodes[otherNode][state].remove(tram)
-                                self.DG.nodes[otherNode][state].append(prevTramHere)
-                                break
-                        if tramFound:
-                            break
-                    if tramFound:
-                        break
-
-                if not tramFound:
+                if not self.moveToSibling(node, prevTramHere):
                     tramsDeparted.append(prevTramHere)
 
         self.calcTramDwell(tramsDeparted, node)
 
-        for tram in tramsAt:
-            if "matched" in tram:
-                del tram["matched"]
-
         for tram in tramsDeparted:
-            destIsNext = False
-            for successor in self.DG.succ[node]:
-                if self.DG.nodes[successor]["stationName"] == tram["dest"]:
-                    destIsNext = True
-
-            if not destIsNext:
-                self.DG.nodes[node]["tramsDeparted"].append(tram)
+            if tram.dest not in self.successorStations[node]:
+                self.state[node]["tramsDeparted"].append(tram)
+
+    def moveToSibling(self, node, prevTramHere):
+        statName = self.state[node]["stationName"]
+        key = tramKey(prevTramHere)
+        for otherNode in self.stationNodes[statName]:
+            if otherNode == node:
+                continue
+            for state in ["tramsDeparting", "tramsArrived"]:
+                trams = self.state[otherNode][state]
+                for i, tram in enumerate(trams):
+                    if tramKey(tram) == key:
+                        del trams[i]
+                        trams.append(prevTramHere)
+                        return True
+        return False
 
     def calcTramTransit(self, node, tram):
-        for pNode in self.DG.pred[node]:
+        for pNode in self.predecessors[node]:
             foundPTram = None
-            for i in range(len(self.DG.nodes[pNode]["tramsDeparted"])):
-                pTram = self.DG.nodes[pNode]["tramsDeparted"][i]
-                if (pTram["dest"] == tram["dest"]) and (
-                    pTram["carriages"] == tram["carriages"]
-                ):
+            key = tramKey(tram)
+            for i, pTram in enumerate(self.state[pNode]["tramsDeparted"]):
+                if tramKey(pTram) == key:
                     foundPTram = i
 
-                    timeBetweenStops = tram["arriveTime"] - pTram["departTime"]
+                    timeBetweenStops = tram.arriveTime - pTram.departTime
                     if timeBetweenStops != timedelta():
-                        self.DG.edges[pNode, node]["transitTimes"].append(
-                            timeBetweenStops
-                        )
-                        self.DG.edges[pNode, node]["transitTimes"] = self.DG.edges[
-                            pNode, node
-                        ]["transitTimes"][-5:]
+                        self.bumpVersion(self.transitKey(pNode, node))
+                        self.transitStats.add((pNode, node), timeBetweenStops)
 
                         (averageTransitTime, isDirectAverage) = self.getAverageTransit(
                             pNode, node
@@ -248,7 +454,7 @@ class TramGraph:
                 # Delete found tram and any before it. Trams can't overtake so
                 # we'll assume it doesn't actually exist here
                 for i in range(foundPTram + 1):
-                    self.DG.nodes[pNode]["tramsDeparted"].pop(0)
+                    self.state[pNode]["tramsDeparted"].pop(0)
                     if i != foundPTram:
                         logging.warning(
                             f"Deleting overtaken tram from {pNode} departed trams"
@@ -261,133 +467,81 @@ class TramGraph:
 
     def locateAt(self, node):
         # Locate arriving trams & update "tramsHere" array and transit times
-        tramsAt = (
-            self.DG.nodes[node]["tramsDeparting"] + self.DG.nodes[node]["tramsArrived"]
-        )
+        tramsAt = self.state[node]["tramsDeparting"] + self.state[node]["tramsArrived"]
+        prevTramsHere = TramBuckets(self.state[node]["prevTramsHere"])
         newTramsHere = []
 
         for tram in tramsAt:
-            tramFound = False
-            for tramHere in self.DG.nodes[node]["prevTramsHere"]:
-                if (
-                    (tramHere["dest"] == tram["dest"])
-                    and (tramHere["carriages"] == tram["carriages"])
-                    and ("matched" not in tramHere)
-                ):
-                    tramFound = True
-                    newTramsHere.append(tramHere)
-                    tramHere["matched"] = True
-                    break
-            if not tramFound:
+            tramHere = prevTramsHere.take(tram)
+            if tramHere is not None:
+                newTramsHere.append(tramHere)
+            else:
                 # Check if tram was moved from another platform
-                if "arriveTime" not in tram:
+                if tram.arriveTime is UNSET:
                     if self.firstRun:
-                        tram["arriveTime"] = None
+                        tram.arriveTime = None
                     else:
-                        tram["arriveTime"] = self.DG.nodes[node]["updateTime"]
+                        tram.arriveTime = self.state[node]["updateTime"]
                         self.calcTramTransit(node, tram)
 
                 newTramsHere.append(tram)
 
-        for tram in newTramsHere:
-            if "matched" in tram:
-                del tram["matched"]
-
-        self.DG.nodes[node]["tramsHere"] = newTramsHere
+        self.state[node]["tramsHere"] = newTramsHere
 
-    def decodePIDs(self):
-        for node in nx.nodes(self.DG):
+    def decodePIDs(self, nodes=None):
+        for node in self.state if nodes is None else nodes:
             self.decodePID(node)
 
     def locateApproachingTrams(self):
-        for node in nx.nodes(self.DG):
-            self.DG.nodes[node]["tramsApproaching"].clear()
+        for node in self.state:
+            self.state[node]["tramsApproaching"].clear()
             self.locateApproaching(node)
 
-    def locateDepartingTrams(self):
-        for node in nx.nodes(self.DG):
+    def locateDepartingTrams(self, nodes=None):
+        for node in self.state if nodes is None else nodes:
             self.locateDeparting(node)
 
-    def locateTramsAt(self):
-        for node in nx.nodes(self.DG):
+    def locateTramsAt(self, nodes=None):
+        for node in self.state if nodes is None else nodes:
             self.locateAt(node)
         self.firstRun = False
 
     def getAverageDwell(self, platform):
-        dwellTimes = self.DG.nodes[platform]["dwellTimes"]
-        if len(dwellTimes) > 0:
-            return sum(dwellTimes, timedelta()) / len(dwellTimes), True
-        else:
-            station = self.DG.nodes[platform]["stationName"]
-            for node in nx.nodes(self.DG):
-                if node == platform:
-                    continue
-                if self.DG.nodes[node]["stationName"] == station:
-                    dwellTimes = self.DG.nodes[node]["dwellTimes"]
-                    if len(dwellTimes) > 0:
-                        return (sum(dwellTimes, timedelta()) / len(dwellTimes), False)
-        return None, False
+        self.addPredictionDep(("dwell", self.state[platform]["stationName"]))
+        return self.dwellStats.getResolvedAverage(platform)
+
+    def transitKey(self, start, end):
+        # Transit averages fall back to any edge between the two stations, in
+        # either direction, so they are versioned by the pair of stations
+        return (
+            "transit",
+            frozenset(
+                (self.state[start]["stationName"], self.state[end]["stationName"])
+            ),
+        )
 
     def getAverageTransit(self, start, end):
-        def getTransit(_start, _end):
-            transitTimes = self.DG.edges[_start, _end]["transitTimes"]
-            if len(transitTimes) > 0:
-                return sum(transitTimes, timedelta()) / len(transitTimes)
-            else:
-                return None
-
-        transitTime = getTransit(start, end)
-        if transitTime is not None:
-            return transitTime, True
-        else:
-            startStation = self.DG.nodes[start]["stationName"]
-            endStation = self.DG.nodes[end]["stationName"]
-
-            startNodes = []
-            endNodes = []
-            for node in nx.nodes(self.DG):
-                if node in [start, end]:
-                    continue
-                if self.DG.nodes[node]["stationName"] == startStation:
-                    startNodes.append(node)
-                elif self.DG.nodes[node]["stationName"] == endStation:
-                    endNodes.append(node)
-
-            for startNode in startNodes:
-                for endNode in endNodes + [end]:
-                    if self.DG.has_edge(startNode, endNode):
-                        transitTime = getTransit(startNode, endNode)
-                        if transitTime is not None:
-                            return transitTime, False
-
-            for endNode in endNodes + [end]:
-                for startNode in startNodes + [start]:
-                    if self.DG.has_edge(endNode, startNode):
-                        transitTime = getTransit(endNode, startNode)
-                        if transitTime is not None:
-                            return transitTime, False
-
-        return None, False
+        self.addPredictionDep(self.transitKey(start, end))
+        return self.transitStats.getResolvedAverage((start, end))
 
     def predictTram(self, start, end, startDepartTime):
         predictions = {}
-        # TODO: Use function to get weight accounting for terminating
-        # stop/pass through
-        path = nx.astar_path(self.DG, source=start, target=end)
+        path = self.getRoute(start, end)
 
         if len(path) < 2:
             return predictions, True
 
         if (
-            (self.DG.nodes[start]["stationName"] != "Exchange Square")
+            (self.state[start]["stationName"] != "Exchange Square")
             and (start != "St Peters Square_9400ZZMASTP2")
-            and (self.DG.nodes[end]["stationName"] != "Exchange Square")
+            and (self.state[end]["stationName"] != "Exchange Square")
             and (end != "St Peters Square_9400ZZMASTP3")
         ):
             for platform in path:
-                if self.DG.nodes[platform]["stationName"] == "Exchange Square":
-                    if (self.DG.nodes[start]["stationName"] == "Market Street") or (
-                        self.DG.nodes[end]["stationName"] == "Market Street"
+                if self.state[platform]["stationName"] == "Exchange Square":
+                    self.addPredictionDep(("node", platform))
+                    if (self.state[start]["stationName"] == "Market Street") or (
+                        self.state[end]["stationName"] == "Market Street"
                     ):
                         logging.error(
                             f"When finding shortest path start was {start}"
@@ -396,9 +550,9 @@ class TramGraph:
                         )
                         return {}, False
                     destFound = False
-                    endStaName = self.DG.nodes[end]["stationName"]
-                    for tram in self.DG.nodes[platform]["pidTrams"]:
-                        if tram["dest"] == endStaName:
+                    endStaName = self.state[end]["stationName"]
+                    for tram in self.state[platform]["pidTrams"]:
+                        if tram.dest == endStaName:
                             destFound = True
 
                     if not destFound:
@@ -442,9 +596,17 @@ class TramGraph:
             # If next stop's predicted arrival is < now, base later "
             # predictions off of now
             if (platformNum == 0) and (
-                workingTramTime < self.DG.nodes[curPlat]["updateTime"]
+                workingTramTime < self.state[curPlat]["updateTime"]
             ):
-                workingTramTime = self.DG.nodes[curPlat]["updateTime"]
+                # Based off the platform's update time rather than the depart
+                # time, so this can't be shifted to another depart time
+                self.addPredictionDep(("node", curPlat))
+                self.addPredictionDep(("floor",))
+                workingTramTime = self.state[curPlat]["updateTime"]
+            elif platformNum == 0:
+                # Still valid for as long as the platform's update time
+                # doesn't pass this prediction
+                self.addPredictionDep(("before", curPlat, workingTramTime))
             predictions[curPlat] = workingTramTime
 
             averageDwell, isDirectAverage = self.getAverageDwell(curPlat)
@@ -454,36 +616,60 @@ class TramGraph:
             workingTramTime = workingTramTime + averageDwell
         return predictions, True
 
-    def getDestPlatform(self, startPlatform, dest):
-        closestPlatform = None
-        distance = None
-        destPlatforms = []
-
-        for node in nx.nodes(self.DG):
-            if self.DG.nodes[node]["stationName"] == dest:
-                destPlatforms.append(node)
-
-        for platformID in destPlatforms:
-            try:
-                # TODO: Use function to get weight accounting for terminating "
-                # stop/pass through
-                length = nx.astar_path_length(
-                    self.DG, source=startPlatform, target=platformID
-                )
-                if (distance is None) or length < distance:
-                    closestPlatform = platformID
-                    distance = length
-            except nx.NetworkXNoPath:
-                pass
-
-        return closestPlatform
+    def getDestPlatform(self, startPlatform, dest, stopping=False):
+        if stopping:
+            return self.nearestStops.get((startPlatform, dest))
+        return self.nearestPlatforms.get((startPlatform, dest))
 
     def predictTramTimes(self, statuses):
         def getTramPredictions(startPlatform, departTime, tram):
-            destPlatform = self.getDestPlatform(startPlatform, tram["dest"])
+            if not self.incremental:
+                return predictTramFrom(startPlatform, departTime, tram)
+
+            # A prediction only depends on where the tram sets off from and
+            # where it's going, and is otherwise just offsets from its depart
+            # time. So reuse the last one for the same journey, shifted to this
+            # depart time, unless something it was derived from has changed
+            # since. Trams starting here have their start added to their
+            # predictions, so they don't share with the others
+            key = (
+                "tramsApproaching" in statuses,
+                startPlatform,
+                tram.dest,
+                tram.via,
+            )
+            cached = self.predictionCache.get(key)
+            if cached is not None and not self.predictionStale(departTime, *cached[:2]):
+                cachedDepartTime, predicted = cached[2:]
+                if departTime == cachedDepartTime:
+                    self.usedPredictions.setdefault(key, cached)
+                    return predicted
+                if ("floor",) not in cached[1] and predicted is not None:
+                    self.usedPredictions.setdefault(key, cached)
+                    return {
+                        plat: departTime + (time - cachedDepartTime)
+                        for plat, time in predicted.items()
+                    }
+
+            self.predictionDeps = set()
+            try:
+                predicted = predictTramFrom(startPlatform, departTime, tram)
+            finally:
+                deps = {
+                    ("before", dep[1], dep[2] - departTime)
+                    if dep[0] == "before"
+                    else dep
+                    for dep in self.predictionDeps
+                }
+                self.predictionDeps = None
+            self.usedPredictions[key] = (self.cycle, deps, departTime, predicted)
+            return predicted
+
+        def predictTramFrom(startPlatform, departTime, tram):
+            destPlatform = self.getDestPlatform(startPlatform, tram.dest, stopping=True)
             predicted = None
-            if tram["via"] is not None:
-                viaPlatform = self.getDestPlatform(startPlatform, tram["via"])
+            if tram.via is not None:
+                viaPlatform = self.getDestPlatform(startPlatform, tram.via)
                 predicted, cont = self.predictTram(
                     startPlatform, viaPlatform, departTime
                 )
@@ -509,114 +695,90 @@ class TramGraph:
 
             return predicted
 
-        for node in nx.nodes(self.DG):
+        for node in self.state:
             if "tramsHere" in statuses:
                 averageDwell, isDirectAverage = self.getAverageDwell(node)
                 if averageDwell is not None:
-                    for tram in self.DG.nodes[node]["tramsHere"]:
-                        if tram["arriveTime"] is not None:
-                            tram["predictions"] = getTramPredictions(
-                                node, tram["arriveTime"] + averageDwell, tram
+                    for tram in self.state[node]["tramsHere"]:
+                        if tram.arriveTime is not None:
+                            tram.predictions = getTramPredictions(
+                                node, tram.arriveTime + averageDwell, tram
                             )
 
             if "tramsDeparted" in statuses:
-                for tram in self.DG.nodes[node]["tramsDeparted"]:
-                    tram["predictions"] = getTramPredictions(
-                        node, tram["departTime"], tram
-                    )
+                for tram in self.state[node]["tramsDeparted"]:
+                    tram.predictions = getTramPredictions(node, tram.departTime, tram)
 
             if "tramsApproaching" in statuses:
-                for tram in self.DG.nodes[node]["tramsApproaching"]:
-                    departTime = self.DG.nodes[node]["updateTime"] + timedelta(
-                        minutes=tram["wait"]
+                for tram in self.state[node]["tramsApproaching"]:
+                    departTime = self.state[node]["updateTime"] + timedelta(
+                        minutes=tram.wait
                     )
-                    tram["predictions"] = getTramPredictions(node, departTime, tram)
-                    tram["predictions"][node] = departTime
+                    # Copied, as the predictions may be shared with the cache
+                    predictions = getTramPredictions(node, departTime, tram)
+                    tram.predictions = {**predictions, node: departTime}
 
     def debounceNewApproaching(self, node):
         newDeb = []
         newAppr = []
 
-        self.DG.nodes[node]["tramsApproaching"].sort(key=lambda x: x["wait"])
-        self.DG.nodes[node]["tramsApproachingDeb"].sort(key=lambda x: x["wait"])
-
-        for tram in self.DG.nodes[node]["tramsApproaching"]:
-            found = False
-            for dTram in self.DG.nodes[node]["tramsApproachingDeb"]:
-                if (
-                    (tram["dest"] == dTram["dest"])
-                    and (tram["carriages"] == dTram["carriages"])
-                    and (tram["wait"] <= dTram["wait"])
-                    and (not dTram.get("matched", False))
-                ):
-                    found = True
-                    dTram["matched"] = True
-
-                    if dTram["debCount"] >= self.debounceCount:
-                        newAppr.append(tram)
-
-                    tram["debCount"] = dTram["debCount"] + 1
-                    newDeb.append(tram)
+        self.state[node]["tramsApproaching"].sort(key=lambda x: x.wait)
+        self.state[node]["tramsApproachingDeb"].sort(key=lambda x: x.wait)
 
-                    break
+        dTrams = TramBuckets(self.state[node]["tramsApproachingDeb"])
+        for tram in self.state[node]["tramsApproaching"]:
+            dTram = dTrams.take(tram, lambda dTram, wait=tram.wait: wait <= dTram.wait)
+            if dTram is not None:
+                if dTram.debCount >= self.debounceCount:
+                    newAppr.append(tram)
 
-            if not found:
-                tram["debCount"] = 1
+                tram.debCount = dTram.debCount + 1
+                newDeb.append(tram)
+            else:
+                tram.debCount = 1
                 newDeb.append(tram)
 
-        for tram in self.DG.nodes[node]["tramsApproachingDeb"]:
-            if not tram.get("matched", False):
-                logging.info(f"Dropping debounced tram approaching {node}")
+        for _ in dTrams.remaining():
+            logging.info(f"Dropping debounced tram approaching {node}")
 
-        self.DG.nodes[node]["tramsApproaching"] = newAppr
-        self.DG.nodes[node]["tramsApproachingDeb"] = newDeb
+        self.state[node]["tramsApproaching"] = newAppr
+        self.state[node]["tramsApproachingDeb"] = newDeb
 
     def debounceNewHere(self, node):
         newDeb = []
         newHere = []
 
-        for tram in self.DG.nodes[node]["tramsHere"]:
-            if tram.get("startsHere", False):
-                found = False
-                for dTram in self.DG.nodes[node]["tramsHereDeb"]:
-                    if (
-                        (tram["dest"] == dTram["dest"])
-                        and (tram["carriages"] == dTram["carriages"])
-                        and (not dTram.get("matched", False))
-                    ):
-                        found = True
-                        dTram["matched"] = True
-
-                        if dTram["debCount"] >= self.debounceCount:
-                            newHere.append(tram)
-
-                        tram["debCount"] = dTram["debCount"] + 1
-                        newDeb.append(tram)
-
-                        break
+        dTrams = TramBuckets(self.state[node]["tramsHereDeb"])
+        for tram in self.state[node]["tramsHere"]:
+            if tram.startsHere:
+                dTram = dTrams.take(tram)
+                if dTram is not None:
+                    if dTram.debCount >= self.debounceCount:
+                        newHere.append(tram)
 
-                if not found:
-                    tram["debCount"] = 1
+                    tram.debCount = dTram.debCount + 1
+                    newDeb.append(tram)
+                else:
+                    tram.debCount = 1
                     newDeb.append(tram)
             else:
                 newHere.append(tram)
 
-        for tram in self.DG.nodes[node]["tramsHereDeb"]:
-            if not tram.get("matched", False):
-                logging.info(f"Dropping debounced tram at {node}")
+        for _ in dTrams.remaining():
+            logging.info(f"Dropping debounced tram at {node}")
 
-        self.DG.nodes[node]["tramsHere"] = newHere
-        self.DG.nodes[node]["tramsHereDeb"] = newDeb
+        self.state[node]["tramsHere"] = newHere
+        self.state[node]["tramsHereDeb"] = newDeb
 
-    def debounceNew(self):
-        for node in nx.nodes(self.DG):
+    def debounceNew(self, nodes=None):
+        for node in self.state if nodes is None else nodes:
             self.debounceNewApproaching(node)
             self.debounceNewHere(node)
 
     def gatherTramPredictions(self, statuses):
-        for node in nx.nodes(self.DG):
+        for node in self.state:
             for status in statuses:
-                trams = self.DG.nodes[node][status]
+                trams = self.state[node][status]
 
                 shortStatus = "here"
                 if status == "tramsDeparted":
@@ -625,148 +787,208 @@ class TramGraph:
                     shortStatus = "dueStartsHere"
 
                 for tram in trams:
-                    if "predictions" not in tram:
+                    if tram.predictions is UNSET:
                         continue
+                    predictions = MappingProxyType(tram.predictions)
                     seenVia = False
                     for plat, time in sorted(
-                        tram["predictions"].items(), key=operator.itemgetter(1)
+                        predictions.items(), key=operator.itemgetter(1)
                     ):
-                        if tram["via"] == self.DG.nodes[plat]["stationName"]:
+                        if tram.via == self.state[plat]["stationName"]:
                             seenVia = True
-                        via = tram["via"]
+                        via = tram.via
                         if seenVia:
                             via = None
-                        if tram["dest"] != self.DG.nodes[plat]["stationName"]:
-                            predTram = {
-                                "dest": tram["dest"],
-                                "via": via,
-                                "carriages": tram["carriages"],
-                                "curLoc": {"platform": node, "status": shortStatus},
-                                "predictedArriveTime": time,
-                                "predictions": tram["predictions"],
-                            }
-
-                            if "wait" in tram:
-                                predTram["curLoc"]["pidWait"] = tram["wait"]
-                            self.DG.nodes[plat]["predictedArrivals"].append(predTram)
-
-    def clearOldDeparted(self):
+                        if tram.dest != self.state[plat]["stationName"]:
+                            predTram = PredictedArrival(
+                                tram.dest,
+                                via,
+                                tram.carriages,
+                                node,
+                                shortStatus,
+                                time,
+                                predictions,
+                                pidWait=tram.wait,
+                            )
+                            self.state[plat]["predictedArrivals"].append(predTram)
+
+    def clearOldDeparted(self, nodes=None):
         # Attempt at fixing ghost trams hanging around in departed lists
-        for node in nx.nodes(self.DG):
+        for node in self.state if nodes is None else nodes:
             delTrams = []
-            for i in range(len(self.DG.nodes[node]["tramsDeparted"])):
-                tram = self.DG.nodes[node]["tramsDeparted"][i]
+            for i in range(len(self.state[node]["tramsDeparted"])):
+                tram = self.state[node]["tramsDeparted"][i]
                 maxTransit = timedelta(minutes=6)
-                if (tram["departTime"] + maxTransit) < self.DG.nodes[node][
-                    "updateTime"
-                ]:
+                if (tram.departTime + maxTransit) < self.state[node]["updateTime"]:
                     delTrams.append(i)
 
             offset = 0
             for delTram in delTrams:
                 logging.warning(f"Deleting stale tram from {node} departed trams")
-                del self.DG.nodes[node]["tramsDeparted"][delTram - offset]
+                del self.state[node]["tramsDeparted"][delTram - offset]
                 offset = offset + 1
 
-    def finalisePredictions(self):
-        for node in nx.nodes(self.DG):
-            self.DG.nodes[node]["fPredictedArrivals"] = deepcopy(
-                self.DG.nodes[node]["predictedArrivals"]
+    def buildSnapshot(self, localUpdateTime):
+        """Freeze the outputs of the cycle just run for readers"""
+        previous = self.snapshot
+        platforms = {}
+        changed = set()
+        for node, row in self.state.items():
+            platform = platforms[node] = PlatformSnapshot(
+                row["stationName"],
+                row["platformID"],
+                row["updateTime"],
+                row["message"],
+                tuple(row["pidTrams"]),
+                tuple(row["predictedArrivals"]),
+                tuple(tram.freeze() for tram in row["tramsHere"]),
+                tuple(tram.freeze() for tram in row["tramsDeparted"]),
+                tuple(tram.freeze() for tram in row["tramsApproaching"]),
+                self.dwellStats.getSamples(node),
+                self.getAverageDwell(node),
             )
-            self.DG.nodes[node]["fTramsHere"] = deepcopy(
-                self.DG.nodes[node]["tramsHere"]
+            if (previous is None) or not platform.sameContent(previous.platforms[node]):
+                changed.add(node)
+
+        # Transit times only change when a tram reaches a platform, so most
+        # cycles share the last snapshot's
+        version = self.transitStats.version
+        if (previous is None) or version != self.snapshotTransitVersion:
+            transitTimes = MappingProxyType(
+                {edge: self.transitStats.getSamples(edge) for edge in self.edgeList}
             )
-            self.DG.nodes[node]["fTramsDeparted"] = deepcopy(
-                self.DG.nodes[node]["tramsDeparted"]
+            averageTransit = MappingProxyType(
+                {edge: self.getAverageTransit(*edge) for edge in self.edgeList}
             )
-            self.DG.nodes[node]["fTramsApproaching"] = deepcopy(
-                self.DG.nodes[node]["tramsApproaching"]
-            )
-
-    def clearNodePredictions(self):
-        for node in nx.nodes(self.DG):
-            self.DG.nodes[node]["predictedArrivals"].clear()
-
-    def getPIDs(self):
-        return nx.get_node_attributes(self.DG, "pidTrams")
-
-    def getLastUpdateTime(self, nodeID):
-        return self.DG.nodes[nodeID].get("updateTime", datetime.min)
-
-    def getLastUpdateTimes(self):
-        return nx.get_node_attributes(self.DG, "updateTime")
-
-    def getMessage(self, nodeID):
-        return self.DG.nodes[nodeID].get("message")
-
-    def getTramsStarting(self):
-        tramsApproachings = deepcopy(
-            nx.get_node_attributes(self.DG, "fTramsApproaching")
+            self.snapshotTransitVersion = version
+        else:
+            transitTimes = previous.transitTimes
+            averageTransit = previous.averageTransit
+
+        changed = frozenset(changed)
+        history = ((self.cycle, changed),)
+        if previous is not None:
+            history = (previous.history + history)[-self.changeHistory :]
+
+        return NetworkSnapshot(
+            self.cycle,
+            localUpdateTime,
+            MappingProxyType(platforms),
+            transitTimes,
+            averageTransit,
+            self.stationNodes,
+            changed,
+            history,
         )
 
-        return tramsApproachings
-
-    def getTramsHeres(self):
-        tramsHere = deepcopy(nx.get_node_attributes(self.DG, "fTramsHere"))
-        for node in tramsHere:
-            for tram in tramsHere[node]:
-                if "wait" in tram:
-                    del tram["wait"]
-        return tramsHere
-
-    def getTramsDeparteds(self):
-        return nx.get_node_attributes(self.DG, "fTramsDeparted")
-
-    def getNodePredictions(self):
-        return nx.get_node_attributes(self.DG, "fPredictedArrivals")
-
-    def getDwellTimes(self):
-        return nx.get_node_attributes(self.DG, "dwellTimes")
-
-    def getNodes(self):
-        return nx.nodes(self.DG)
-
-    def getStations(self):
-        return self.stations
-
-    def getStationPlatforms(self, statName):
-        platIDs = []
-        for node in nx.nodes(self.DG):
-            if self.DG.nodes[node]["stationName"] == statName:
-                platIDs.append(self.DG.nodes[node]["platformID"])
-        return platIDs
+    def processCycle(self):
+        """Run the prediction pipeline over the latest PID data
+
+        In incremental mode only dirty platforms and their siblings are
+        decoded and located again, and only trams whose predictions depend on
+        something that changed are predicted again.
+        """
+        self.cycle = self.cycle + 1
+        for node in self.dirtyNodes:
+            self.bumpVersion(("node", node))
+
+        nodes = None
+        if self.incremental and not self.firstRun:
+            nodes = self.getAffectedNodes()
+
+            # Untouched platforms keep their decoded trams, so drop what the
+            # last cycle attached to those due to make them match a fresh
+            # decode
+            affected = set(nodes)
+            for node in self.state:
+                if node not in affected:
+                    for tram in self.state[node]["tramsDue"]:
+                        tram.startsHere = UNSET
+                        tram.predictions = UNSET
+        self.dirtyNodes = set()
+
+        self.decodePIDs(nodes)
+        self.clearOldDeparted(nodes)
+        self.locateDepartingTrams(nodes)
+        self.locateTramsAt(nodes)
+        self.clearNodePredictions()
+
+        self.predictTramTimes(["tramsHere", "tramsDeparted"])
+        self.debounceNew(nodes)
+        self.gatherTramPredictions(["tramsHere", "tramsDeparted"])
+        self.locateApproachingTrams()
+        self.predictTramTimes(["tramsApproaching"])
+        self.gatherTramPredictions(["tramsApproaching"])
+        self.locateApproachingTrams()
+        self.clearNodePredictions()
+        self.gatherTramPredictions(["tramsHere", "tramsDeparted", "tramsApproaching"])
+
+        # Predictions of trams that have gone are dropped with the cache
+        self.predictionCache = self.usedPredictions
+        self.usedPredictions = {}
+
+        # Readers pick up the whole cycle at once, as the reference swap is
+        # atomic
+        self.snapshot = self.buildSnapshot(datetime.now())
 
-    def getNodePreds(self, node):
-        return self.DG.pred[node]
-
-    def getTransit(self, inNode, outNode):
-        return self.DG.edges[inNode, outNode]["transitTimes"]
-
-    def getMapPos(self, node):
-        return self.pos[node]
-
-    def nodesNoAvDwell(self):
-        nodes = []
-        for node in nx.nodes(self.DG):
-            if len(self.DG.nodes[node]["dwellTimes"]) == 0:
-                nodes.append(node)
-        return nodes
-
-    def edgesNoAvTrans(self):
-        edges = []
-        for edge in self.DG.edges:
-            if len(self.DG.edges[edge]["transitTimes"]) == 0:
-                edges.append(edge)
-        return edges
-
-    def setLocalUpdateTime(self, time):
-        self.localUpdateTime = time
-
-    def getLocalUpdateTime(self):
-        return self.localUpdateTime
+    def clearNodePredictions(self):
+        for node in self.state:
+            self.state[node]["predictedArrivals"].clear()
+
+    def getCheckpoint(self):
+        """What the graph has learned, for a restarted graph to carry on from
+
+        That's the dwell and transit time samples, and the trams being
+        tracked at each platform. Trams' predictions are left out, as every
+        cycle makes them again.
+        """
+        trams = {}
+        for node, row in self.state.items():
+            platformTrams = {
+                field: [
+                    dataclasses.replace(tram, predictions=UNSET) for tram in row[field]
+                ]
+                for field in CHECKPOINT_FIELDS
+                if row[field]
+            }
+            if platformTrams:
+                trams[node] = platformTrams
+
+        return {
+            "dwellTimes": self.dwellStats.getAllSamples(),
+            "transitTimes": self.transitStats.getAllSamples(),
+            "trams": None if self.firstRun else trams,
+        }
+
+    def restoreCheckpoint(self, checkpoint):
+        """Carry on from a checkpoint, before the first cycle
+
+        Anything for platforms or edges the graph no longer has is dropped.
+        """
+        for node, samples in checkpoint["dwellTimes"].items():
+            if node in self.state:
+                for sample in samples:
+                    self.dwellStats.add(node, sample)
+        for edge, samples in checkpoint["transitTimes"].items():
+            if self.DG.has_edge(*edge):
+                for sample in samples:
+                    self.transitStats.add(edge, sample)
+
+        # Trams that came or went while the graph was down are picked up by
+        # the first cycle, as if it had missed a few polls
+        if checkpoint["trams"] is not None:
+            for node, platformTrams in checkpoint["trams"].items():
+                if node in self.state:
+                    for field, fieldTrams in platformTrams.items():
+                        self.state[node][field] = fieldTrams
+            self.firstRun = False
 
 
 def main():
+    # Only plotting needs matplotlib, which is slower to import than the rest
+    # of the app put together
+    import matplotlib.pyplot as plt
+
     graph = TramGraph()
     plt.figure(3, figsize=(100, 12))
     # plt.subplot(121)
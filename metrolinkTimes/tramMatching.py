@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+
+def tramKey(tram):
+    """What identifies a tram between PID snapshots"""
+    return tram.dest, tram.carriages
+
+
+class TramBuckets:
+    """Trams to match against, bucketed by tramKey
+
+    Each bucket keeps the trams in the order they were given, so taking the
+    first acceptable tram from a bucket picks the same one a scan of the whole
+    list would have. A tram can only be taken once.
+    """
+
+    __slots__ = ["buckets"]
+
+    def __init__(self, trams=()):
+        self.buckets = {}
+        for tram in trams:
+            self.add(tram)
+
+    def add(self, tram):
+        key = tramKey(tram)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [tram]
+        else:
+            bucket.append(tram)
+
+    def take(self, tram, accept=None):
+        """Remove and return the first tram matching tram, or None
+
+        If given, accept is called with each candidate and only those it
+        returns True for can be taken.
+        """
+        bucket = self.buckets.get(tramKey(tram))
+        if not bucket:
+            return None
+        if accept is None:
+            return bucket.pop(0)
+        for i, candidate in enumerate(bucket):
+            if accept(candidate):
+                del bucket[i]
+                return candidate
+        return None
+
+    def remaining(self):
+        """The trams that haven't been taken"""
+        return [tram for bucket in self.buckets.values() for tram in bucket]
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+from dataclasses import dataclass, fields
+from datetime import datetime, timedelta
+from types import MappingProxyType
+
+
+class Unset:
+    """Marks a field whose stage of the pipeline hasn't been reached yet"""
+
+    __slots__ = []
+
+    def __repr__(self):
+        return "UNSET"
+
+    def __bool__(self):
+        return False
+
+    def __reduce__(self):
+        # Unpickle as the one UNSET, so "is UNSET" still holds
+        return "UNSET"
+
+
+UNSET = Unset()
+
+
+def serialize(record, exclude=()):
+    """A record as a dict of its set fields, for the API to return"""
+    return {
+        field.name: getattr(record, field.name)
+        for field in fields(record)
+        if field.name not in exclude and getattr(record, field.name) is not UNSET
+    }
+
+
+@dataclass(slots=True, frozen=True)
+class PIDTram:
+    """A tram shown on a platform's PID, as read from TfGM"""
+
+    dest: str
+    via: str | None
+    carriages: str
+    status: str
+    wait: int
+
+    def toDict(self):
+        return serialize(self)
+
+
+@dataclass(slots=True, eq=True)
+class Tram:
+    """A tram being tracked at a platform
+
+    Fields start UNSET and are filled in as the tram is located:
+    arriveTime once it's here (None if it was here when we started),
+    departTime, dwellTime and averageDwell once it has left, and wait is
+    cleared then. debCount and startsHere are set while a tram that first
+    appeared here is being debounced, and predictions once its onward
+    arrivals have been predicted.
+    """
+
+    dest: str
+    via: str | None
+    carriages: str
+    wait: int | Unset = UNSET
+    arriveTime: datetime | None | Unset = UNSET
+    departTime: datetime | Unset = UNSET
+    dwellTime: timedelta | None | Unset = UNSET
+    averageDwell: timedelta | None | Unset = UNSET
+    debCount: int | Unset = UNSET
+    startsHere: bool | Unset = UNSET
+    predictions: dict[str, datetime] | None | Unset = UNSET
+
+    @classmethod
+    def fromPID(cls, pidTram):
+        return cls(pidTram.dest, pidTram.via, pidTram.carriages, wait=pidTram.wait)
+
+    def freeze(self):
+        """A read-only copy of the tram as it is now"""
+        predictions = self.predictions
+        if isinstance(predictions, dict):
+            predictions = MappingProxyType(predictions)
+        return FrozenTram(
+            self.dest,
+            self.via,
+            self.carriages,
+            self.wait,
+            self.arriveTime,
+            self.departTime,
+            self.dwellTime,
+            self.averageDwell,
+            self.debCount,
+            self.startsHere,
+            predictions,
+        )
+
+    def toDict(self, exclude=()):
+        return serialize(self, exclude)
+
+
+@dataclass(slots=True, frozen=True)
+class FrozenTram:
+    """A Tram as it was at the end of a cycle, for readers"""
+
+    dest: str
+    via: str | None
+    carriages: str
+    wait: int | Unset = UNSET
+    arriveTime: datetime | None | Unset = UNSET
+    departTime: datetime | Unset = UNSET
+    dwellTime: timedelta | None | Unset = UNSET
+    averageDwell: timedelta | None | Unset = UNSET
+    debCount: int | Unset = UNSET
+    startsHere: bool | Unset = UNSET
+    predictions: MappingProxyType | None | Unset = UNSET
+
+    def toDict(self, exclude=()):
+        tram = serialize(self, exclude)
+        if tram.get("predictions") is not None:
+            tram["predictions"] = dict(tram["predictions"])
+        return tram
+
+
+@dataclass(slots=True, frozen=True)
+class PredictedArrival:
+    """A tram predicted to arrive at a platform, and where it is now"""
+
+    dest: str
+    via: str | None
+    carriages: str
+    platform: str
+    status: str
+    predictedArriveTime: datetime
+    predictions: dict[str, datetime] | None
+    pidWait: int | Unset = UNSET
+
+    def toDict(self, exclude=()):
+        curLoc = {"platform": self.platform, "status": self.status}
+        if self.pidWait is not UNSET:
+            curLoc["pidWait"] = self.pidWait
+        arrival = {
+            "dest": self.dest,
+            "via": self.via,
+            "carriages": self.carriages,
+            "curLoc": curLoc,
+            "predictedArriveTime": self.predictedArriveTime,
+        }
+        if "predictions" not in exclude:
+            arrival["predictions"] = (
+                dict(self.predictions) if self.predictions is not None else None
+            )
+        return arrival
@@ -0,0 +1,181 @@
+"""Synthetic TfGM /odata/Metrolinks payloads for replaying through the pipeline
+
+Trams are driven along shortest paths of the real topology with fixed per-edge
+transit and per-platform dwell times, and each platform's PID shows the trams
+at it and those due within the next 15 minutes. Platforms refresh their PID in
+staggered waves, as TfGM's do, so consecutive snapshots share most records.
+"""
+
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import networkx as nx
+
+import metrolinkTimes
+
+STATIONS_FILE = f"{os.path.dirname(metrolinkTimes.__file__)}/data/stations.json"
+
+
+class SimTram:
+    def __init__(self, path, dest, carriages, startTime):
+        self.path = path
+        self.dest = dest
+        self.carriages = carriages
+        # (platform, arrive, depart) for every stop left on the path
+        self.stops = []
+        self.startTime = startTime
+
+
+class NetworkSimulator:
+    def __init__(
+        self,
+        seed=0,
+        start=datetime(2024, 1, 1, 7, 0, 0),
+        interval=10,
+        waves=3,
+        trams=40,
+    ):
+        self.random = random.Random(seed)
+        self.now = start
+        self.interval = timedelta(seconds=interval)
+        self.waves = waves
+        self.targetTrams = trams
+        self.tick = 0
+
+        with open(STATIONS_FILE) as stationsFile:
+            self.data = json.load(stationsFile)
+
+        owner = {p: s for s in self.data for p in self.data[s]}
+        self.DG = nx.DiGraph()
+        for s in self.data:
+            for p in self.data[s]:
+                nodeID = f"{s}_{p}"
+                self.DG.add_node(nodeID, station=s, platform=p)
+                weight = 2 if self.data[s][p].get("terminating", False) else 1
+                for inP in self.data[s][p]["stationsBefore"]:
+                    self.DG.add_edge(f"{owner[inP]}_{inP}", nodeID, weight=weight)
+
+        self.nodes = sorted(self.DG.nodes)
+        self.transit = {
+            edge: timedelta(seconds=self.random.randrange(60, 150))
+            for edge in self.DG.edges
+        }
+        self.dwell = {
+            node: timedelta(seconds=self.random.randrange(20, 50))
+            for node in self.nodes
+        }
+        self.phase = {node: self.random.randrange(waves) for node in self.nodes}
+        self.records = {}
+        self.trams = []
+
+        for _ in range(trams):
+            self._spawn(self.now - timedelta(minutes=self.random.randrange(30)))
+
+    def _spawn(self, startTime):
+        while True:
+            start = self.random.choice(self.nodes)
+            lengths, paths = nx.single_source_dijkstra(self.DG, start)
+            dests = sorted(
+                {
+                    self.DG.nodes[n]["station"]
+                    for n in lengths
+                    if 4 <= len(paths[n]) <= 25
+                    and self.DG.nodes[n]["station"] != self.DG.nodes[start]["station"]
+                }
+            )
+            if dests:
+                break
+
+        dest = self.random.choice(dests)
+        end = min(
+            (n for n in lengths if self.DG.nodes[n]["station"] == dest),
+            key=lambda n: lengths[n],
+        )
+        tram = SimTram(
+            paths[end], dest, self.random.choice(["Single", "Double"]), startTime
+        )
+
+        time = startTime
+        for i, node in enumerate(tram.path):
+            if i > 0:
+                time = time + self.transit[tram.path[i - 1], node]
+            arrive = time
+            time = time + self.dwell[node]
+            tram.stops.append((node, arrive, time))
+        self.trams.append(tram)
+
+    def _pid(self, node):
+        atPlatform = []
+        due = []
+        for tram in self.trams:
+            for platform, arrive, depart in tram.stops:
+                if platform != node:
+                    continue
+                if arrive <= self.now < depart:
+                    if platform == tram.path[-1]:
+                        atPlatform.append(("Terminates Here", tram, "Arrived", 0))
+                    elif depart - self.now <= timedelta(seconds=10):
+                        atPlatform.append((tram.dest, tram, "Departing", 0))
+                    else:
+                        atPlatform.append((tram.dest, tram, "Arrived", 0))
+                elif self.now < arrive <= self.now + timedelta(minutes=15):
+                    if platform != tram.path[-1]:
+                        wait = int((arrive - self.now).total_seconds() // 60)
+                        due.append((tram.dest, tram, "Due", wait))
+        due.sort(key=lambda entry: entry[3])
+        return (atPlatform + due)[:4]
+
+    def _record(self, node):
+        station = self.DG.nodes[node]["station"]
+        platform = self.DG.nodes[node]["platform"]
+        meta = self.data[station][platform]
+        record = {
+            "Id": self.nodes.index(node),
+            "Line": meta["line"],
+            "TLAREF": meta["tla"],
+            "PIDREF": f"{meta['tla']}-TPID0{self.nodes.index(node) % 9}",
+            "StationLocation": station,
+            "AtcoCode": platform,
+            "Direction": meta["direction"],
+            "MessageBoard": "<no message>",
+            "LastUpdated": self.now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        entries = self._pid(node)
+        for i in range(4):
+            if i < len(entries):
+                dest, tram, status, wait = entries[i]
+                record.update(
+                    {
+                        f"Dest{i}": dest,
+                        f"Carriages{i}": tram.carriages,
+                        f"Status{i}": status,
+                        f"Wait{i}": str(wait),
+                    }
+                )
+            else:
+                record.update(
+                    {f"Dest{i}": "", f"Carriages{i}": "", f"Status{i}": "", f"Wait{i}": ""}
+                )
+        return record
+
+    def step(self):
+        """Advance by one interval and return the next payload as a dict"""
+        if self.tick > 0:
+            self.now = self.now + self.interval
+        self.trams = [tram for tram in self.trams if tram.stops[-1][2] > self.now]
+        while len(self.trams) < self.targetTrams:
+            self._spawn(self.now)
+
+        for node in self.nodes:
+            if node not in self.records or (self.tick + self.phase[node]) % self.waves == 0:
+                self.records[node] = self._record(node)
+        self.tick = self.tick + 1
+
+        return {"value": [self.records[node] for node in self.nodes]}
+
+    def payloads(self, count):
+        """Yield count consecutive payloads as raw JSON bodies"""
+        for _ in range(count):
+            yield json.dumps(self.step()).encode()
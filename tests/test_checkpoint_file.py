@@ -0,0 +1,60 @@
+"""Tests for checkpointing what the graph has learned across restarts"""
+
+import json
+
+from metrolinkTimes.api import GraphUpdater, TramGraph
+from metrolinkTimes.checkpointFile import CheckpointFile
+from tests.replay import NetworkSimulator
+
+
+def test_restored_graph_predicts_in_one_cycle(tmp_path):
+    """A restarted graph's first cycle shows what the original's does"""
+    original = GraphUpdater(TramGraph())
+    payloads = list(NetworkSimulator(waves=1).payloads(40))
+    for body in payloads[:-1]:
+        original.process_raw(body)
+    CheckpointFile(tmp_path / "checkpoint").save(original.graph.getCheckpoint())
+
+    restarted = GraphUpdater(TramGraph())
+    restarted.checkpoints = CheckpointFile(tmp_path / "checkpoint")
+    restarted.restoreCheckpoint()
+    cold = GraphUpdater(TramGraph())
+    for updater in (original, restarted, cold):
+        updater.process_raw(payloads[-1])
+
+    missing = restarted.graph.getSnapshot().nodesNoAvDwell()
+    assert restarted.graph.getNodePredictions() == original.graph.getNodePredictions()
+    assert missing == original.graph.getSnapshot().nodesNoAvDwell()
+    assert len(missing) < len(cold.graph.getSnapshot().nodesNoAvDwell())
+    for updater in (original, restarted, cold):
+        updater.executor.shutdown()
+
+
+def test_old_checkpoint_ignored(tmp_path):
+    """Checkpoints older than maxAge aren't restored"""
+    empty = {"dwellTimes": {}, "transitTimes": {}, "trams": None}
+    CheckpointFile(tmp_path / "checkpoint").save(empty)
+    assert CheckpointFile(tmp_path / "checkpoint").load() == empty
+    assert CheckpointFile(tmp_path / "checkpoint", maxAge=0).load() is None
+    assert CheckpointFile(tmp_path / "missing").load() is None
+
+
+def test_checkpoint_is_data_only(tmp_path):
+    """Checkpoints are saved as JSON, and restored as they were"""
+    updater = GraphUpdater(TramGraph())
+    for body in NetworkSimulator(waves=1).payloads(20):
+        updater.process_raw(body)
+    updater.executor.shutdown()
+    checkpoint = updater.graph.getCheckpoint()
+    CheckpointFile(tmp_path / "checkpoint").save(checkpoint)
+
+    saved = json.loads((tmp_path / "checkpoint").read_bytes())
+    assert saved["checkpoint"]["trams"]
+    restored = CheckpointFile(tmp_path / "checkpoint").load()
+    assert restored["trams"] == checkpoint["trams"]
+    assert restored["dwellTimes"] == {
+        node: list(samples) for node, samples in checkpoint["dwellTimes"].items()
+    }
+    assert restored["transitTimes"] == {
+        edge: list(samples) for edge, samples in checkpoint["transitTimes"].items()
+    }
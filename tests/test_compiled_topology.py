@@ -0,0 +1,42 @@
+"""Tests for compiling stations.json into the topology TramGraph loads"""
+
+import copy
+import json
+
+import pytest
+
+from metrolinkTimes.compiledTopology import (
+    STATIONS_FILE,
+    TopologyError,
+    compileStationsFile,
+    compileTopology,
+    loadTopology,
+)
+
+
+def test_compiled_topology_is_current():
+    """The shipped topology is what stations.json compiles to"""
+    topology = loadTopology()
+    assert topology == compileStationsFile()
+
+    # Every edge is between platforms that exist
+    platforms = range(len(topology["platforms"]))
+    assert all(
+        start in platforms and end in platforms for start, end, _ in topology["edges"]
+    )
+
+
+def test_dangling_reference_fails_compile():
+    """Platforms following unknown ATCO codes are reported, not made up"""
+    with open(STATIONS_FILE) as stationsFile:
+        data = json.load(stationsFile)
+    compileTopology(data)
+
+    broken = copy.deepcopy(data)
+    platform = next(iter(broken["Piccadilly"].values()))
+    platform["stationsBefore"].append("9400ZZMANOPE1")
+    del platform["map"]
+    with pytest.raises(TopologyError) as excinfo:
+        compileTopology(broken)
+    assert len(excinfo.value.problems) == 2
+    assert "9400ZZMANOPE1" in str(excinfo.value)
@@ -0,0 +1,366 @@
+"""Tests for the polling-mode GraphUpdater"""
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from metrolinkTimes import api as api_module
+from metrolinkTimes.tfgmMetrolinksAPI import Fetched, Validators
+from tests.replay import NetworkSimulator
+
+
+@pytest.fixture
+def polling(monkeypatch):
+    """A polling-mode app whose graph has processed one replayed snapshot"""
+    monkeypatch.setenv("METROLINK_MODE", "polling")
+    graph = api_module.TramGraph()
+    updater = api_module.GraphUpdater(graph)
+    monkeypatch.setattr(api_module, "graph", graph)
+    monkeypatch.setattr(api_module, "graph_updater", updater)
+    # Versions start again with the new graph
+    api_module.responses.restart()
+
+    payloads = NetworkSimulator(waves=1).payloads(3)
+    updater.process_raw(next(payloads))
+    yield graph, updater, payloads
+    updater.executor.shutdown()
+
+
+async def test_unchanged_snapshot_skips_cycle(polling, monkeypatch):
+    """A repeated payload is recorded as a no-op without touching the graph"""
+    graph, updater, payloads = polling
+    bodies = [next(payloads)] * 2 + [next(payloads)]
+
+    async def fetch(validators=None):
+        return Fetched(bodies.pop(0), Validators(None, None))
+
+    monkeypatch.setattr(updater.api, "fetchRawAsync", fetch)
+    for _ in range(3):
+        await updater.update_async()
+        if updater.cycleStats["processed"] == 1:
+            updateTime = graph.getLocalUpdateTime()
+
+    assert updater.cycleStats["polls"] == 3
+    assert updater.cycleStats["processed"] == 2
+    assert updater.cycleStats["unchanged"] == 1
+    assert graph.getLocalUpdateTime() > updateTime
+
+
+async def test_failed_cycle_refetches_in_full(polling, monkeypatch):
+    """Validators are only sent again once the graph has processed their body"""
+    graph, updater, payloads = polling
+    body = next(payloads)
+    sent = []
+
+    async def fetch(validators=None):
+        sent.append(validators)
+        return Fetched(body, Validators('"v2"', None))
+
+    processRaw = updater.process_raw
+    failures = [ValueError("cycle failed")]
+
+    def failOnce(body):
+        if failures:
+            raise failures.pop()
+        processRaw(body)
+
+    monkeypatch.setattr(updater.api, "fetchRawAsync", fetch)
+    monkeypatch.setattr(updater, "process_raw", failOnce)
+    with pytest.raises(ValueError):
+        await updater.update_async()
+    assert updater.cycleStats["failed"] == 1
+    assert graph.dirtyNodes == set(graph.state)
+    await updater.update_async()
+    await updater.update_async()
+
+    assert sent == [None, None, ('"v2"', None)]
+    assert updater.cycleStats["processed"] == 1
+
+
+async def test_station_latency_flat_during_slow_cycle(polling, monkeypatch):
+    """Requests are served promptly while a slow cycle is being processed"""
+    graph, updater, payloads = polling
+    body = next(payloads)
+
+    async def slowFetch(validators=None):
+        await asyncio.sleep(0.3)
+        return Fetched(body, Validators(None, None))
+
+    decodePIDs = graph.decodePIDs
+
+    def slowDecode(*args, **kwargs):
+        time.sleep(0.5)
+        return decodePIDs(*args, **kwargs)
+
+    monkeypatch.setattr(updater.api, "fetchRawAsync", slowFetch)
+    monkeypatch.setattr(graph, "decodePIDs", slowDecode)
+
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+
+        async def timedGets(until):
+            # Issue a request every 10ms and time it from when it was due, so
+            # any stall of the event loop shows up as request latency
+            latencies = []
+            finished = time.perf_counter()
+            while not until():
+                await asyncio.sleep(0.01)
+                response = await client.get("/station/Piccadilly/")
+                assert response.status_code == 200, response.text
+                due = finished + 0.01
+                finished = time.perf_counter()
+                latencies.append(finished - due)
+            return latencies
+
+        idleStart = time.perf_counter()
+        idle = await timedGets(lambda: time.perf_counter() - idleStart > 0.2)
+
+        cycleStart = time.perf_counter()
+        cycle = asyncio.create_task(updater.update_async())
+        busy = await timedGets(cycle.done)
+        await cycle
+        cycleTime = time.perf_counter() - cycleStart
+
+    assert cycleTime > 0.8
+    assert len(busy) > 10
+    assert max(busy) < max(0.25, 10 * max(idle))
+
+
+async def test_platform_request_leaves_snapshot_intact(polling):
+    """Dropping tram predictions from one response doesn't affect the next"""
+    graph, updater, payloads = polling
+    updater.process_raw(next(payloads))
+    nodeID = next(
+        n for n, p in graph.getSnapshot().platforms.items() if p.predictedArrivals
+    )
+    url = "/station/{}/{}/".format(*nodeID.rsplit("_", 1))
+
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        trimmed = await client.get(url, params={"tram_predictions": "false"})
+        full = await client.get(url)
+
+    assert all("predictions" not in tram for tram in trimmed.json()["predictions"])
+    assert all("predictions" in tram for tram in full.json()["predictions"])
+
+
+async def test_cached_station_response_follows_cycles(polling):
+    """Station responses are served from the cache until the next cycle"""
+    graph, updater, payloads = polling
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = await client.get("/station/Piccadilly/?include_departed=true")
+        again = await client.get("/station/Piccadilly/?include_departed=true")
+        updater.process_raw(next(payloads))
+        after = await client.get("/station/Piccadilly/")
+
+    assert first.content == again.content
+    assert first.json()["_links"]["self"].endswith("?include_departed=true")
+    assert after.json()["_links"]["self"] == "http://test/station/Piccadilly/"
+    assert after.json()["last_updated"] == graph.getLocalUpdateTime().isoformat()
+    assert after.json()["last_updated"] != first.json()["last_updated"]
+
+
+async def test_etag_not_modified_until_next_cycle(polling):
+    """Repeat requests get a 304 until a new cycle is published"""
+    graph, updater, payloads = polling
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = await client.get("/homeassistant/station/Piccadilly/")
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"].startswith("max-age=")
+
+        repeat = await client.get(
+            "/homeassistant/station/Piccadilly/", headers={"If-None-Match": etag}
+        )
+        assert repeat.status_code == 304
+        assert repeat.content == b""
+        assert repeat.headers["etag"] == etag
+
+        updater.process_raw(next(payloads))
+        changed = await client.get(
+            "/homeassistant/station/Piccadilly/", headers={"If-None-Match": etag}
+        )
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+
+
+async def test_etag_from_tfgm_in_on_demand_mode(monkeypatch):
+    """On-demand responses are tagged from TfGM's LastUpdated times"""
+    monkeypatch.setenv("METROLINK_MODE", "lambda")
+    bodies = NetworkSimulator(waves=1).payloads(2)
+    data = api_module.TFGMMetrolinksAPI.parseData(next(bodies))
+
+    async def getDataAsync():
+        return data
+
+    # Fetch for every request, so the change of data is seen
+    tfgmCache = api_module.TfGMCache(
+        SimpleNamespace(getDataAsync=getDataAsync),
+        ttl=0,
+        staleWhileRevalidate=0,
+        prepare=api_module.TfGMSnapshot,
+    )
+    monkeypatch.setattr(api_module, "tfgm_cache", tfgmCache)
+
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        first = await client.get("/station/Piccadilly/")
+        assert first.headers["etag"].startswith('W/"')
+
+        repeat = await client.get(
+            "/station/Piccadilly/", headers={"If-None-Match": first.headers["etag"]}
+        )
+        assert repeat.status_code == 304
+
+        data = api_module.TFGMMetrolinksAPI.parseData(next(bodies))
+        changed = await client.get(
+            "/station/Piccadilly/", headers={"If-None-Match": first.headers["etag"]}
+        )
+        assert changed.status_code == 200
+
+
+async def test_on_demand_directions_share_renderer(monkeypatch):
+    """On-demand outgoing and incoming sensors differ only in direction"""
+    monkeypatch.setenv("METROLINK_MODE", "lambda")
+    data = api_module.TFGMMetrolinksAPI.parseData(
+        next(NetworkSimulator(waves=1).payloads(1))
+    )
+
+    async def getDataAsync():
+        return data
+
+    tfgmCache = api_module.TfGMCache(
+        SimpleNamespace(getDataAsync=getDataAsync), prepare=api_module.TfGMSnapshot
+    )
+    monkeypatch.setattr(api_module, "tfgm_cache", tfgmCache)
+
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        base = "/homeassistant/station/Piccadilly"
+        outgoing = (await client.get(f"{base}/outgoing/")).json()
+        incoming = (await client.get(f"{base}/incoming/")).json()
+        missing = await client.get("/homeassistant/station/Atlantis/incoming/")
+
+    assert outgoing["state"] == incoming["state"] > 0
+    assert outgoing["attributes"]["friendly_name"] == "Metrolink Piccadilly Outgoing"
+    assert incoming["attributes"]["direction"] == "incoming"
+    assert {k: v for k, v in outgoing["attributes"].items() if k[-1].isdigit()} == {
+        k: v for k, v in incoming["attributes"].items() if k[-1].isdigit()
+    }
+    assert missing.status_code == 404
+
+
+async def test_network_filters_and_projects(polling):
+    """/network/ returns only the requested platforms and fields"""
+    graph, updater, payloads = polling
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        everything = (await client.get("/network/")).json()
+        eccles = (await client.get("/network/?lines=Eccles&fields=message")).json()
+        stations = await client.get("/network/?stations=Bury,Piccadilly&fields=here")
+        bad = await client.get("/network/?fields=message,wait")
+
+    assert sum(len(p) for p in everything["stations"].values()) == len(graph.getNodes())
+    piccadilly = everything["stations"]["Piccadilly"]
+    for platID, platform in piccadilly.items():
+        nodeID = f"Piccadilly_{platID}"
+        assert len(platform["predictions"]) == len(graph.getPredictionsAt(nodeID))
+        assert set(platform) == {"line", "updateTime", "message", "predictions", "here"}
+
+    for station in eccles["stations"].values():
+        for platform in station.values():
+            assert platform.keys() == {"line", "message"}
+            assert platform["line"] == "Eccles"
+
+    assert set(stations.json()["stations"]) == {"Bury", "Piccadilly"}
+    assert bad.status_code == 400
+
+
+async def test_stream_sends_changed_platforms(polling, monkeypatch):
+    """/stream/ sends the subscribed platforms, then those a cycle changes"""
+    graph, updater, payloads = polling
+    body = next(payloads)
+
+    async def fetch(validators=None):
+        return Fetched(body, Validators(None, None))
+
+    monkeypatch.setattr(updater.api, "fetchRawAsync", fetch)
+    response = await api_module.stream_platforms(
+        fields="message", stations="Piccadilly", platforms=None
+    )
+    events = response.body_iterator
+    try:
+        first = await anext(events)
+        assert first.startswith(b"id: %d\n" % graph.getSnapshot().version)
+        stations = json.loads(first.split(b"data: ")[1])["stations"]
+        assert set(stations) == {"Piccadilly"}
+
+        await updater.update_async()
+        assert "Piccadilly_9400ZZMAPIC1" in graph.getSnapshot().changed
+        second = await anext(events)
+        assert second.startswith(b"id: %d\n" % graph.getSnapshot().version)
+    finally:
+        await events.aclose()
+
+    assert not api_module.streams.subscribers
+
+
+async def test_changes_since_version(polling):
+    """/changes/ returns what changed after a version, or everything to resync"""
+    graph, updater, payloads = polling
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        network = (await client.get("/network/")).json()
+        version, epoch = network["version"], network["epoch"]
+        updater.process_raw(next(payloads))
+        changes = (await client.get(f"/changes/?since={version}&epoch={epoch}")).json()
+        current = (
+            await client.get(f"/changes/?since={changes['version']}&epoch={epoch}")
+        ).json()
+        future = (
+            await client.get(f"/changes/?since={version + 5}&epoch={epoch}")
+        ).json()
+
+    changed = graph.getSnapshot().changed
+    assert changes["version"] == version + 1
+    assert not changes["resync"]
+    assert sum(len(p) for p in changes["stations"].values()) == len(changed)
+    assert changes["stations"]["Piccadilly"].keys() == {"9400ZZMAPIC1", "9400ZZMAPIC2"}
+
+    assert not current["resync"] and current["stations"] == {}
+    assert future["resync"] and future["since"] is None
+    assert sum(len(p) for p in future["stations"].values()) == len(graph.getNodes())
+
+    # Only the resync response is cached, not one per version polled with
+    cached = [key for key in api_module.responses.current[1] if key[0] == "changes"]
+    assert [key[1] for key in cached] == [None]
+
+
+async def test_changes_after_restart_resync(polling, monkeypatch):
+    """A version from before a restart resyncs, however far the new run has got"""
+    graph, updater, payloads = polling
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        before = (await client.get("/network/")).json()
+
+        # The restarted poller has counted back past the client's version
+        restarted = api_module.GraphUpdater(api_module.TramGraph())
+        restarted.epoch = "restarted"
+        for body in NetworkSimulator(waves=1).payloads(3):
+            restarted.process_raw(body)
+        monkeypatch.setattr(api_module, "graph", restarted.graph)
+        monkeypatch.setattr(api_module, "graph_updater", restarted)
+        api_module.responses.restart()
+        assert restarted.graph.getSnapshot().changedSince(before["version"]) is not None
+
+        query = f"since={before['version']}&epoch={before['epoch']}"
+        changes = (await client.get(f"/changes/?{query}")).json()
+    restarted.executor.shutdown()
+
+    assert changes["epoch"] == "restarted" and changes["resync"]
+    assert sum(len(p) for p in changes["stations"].values()) == len(graph.getNodes())
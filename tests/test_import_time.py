@@ -0,0 +1,52 @@
+"""Tests that importing the app stays quick, for fast restarts"""
+
+import os
+import re
+import subprocess
+import sys
+
+# Microseconds importing metrolinkTimes.api may take. It measures around
+# 0.7s on a development machine, with fastapi the bulk of it
+API_IMPORT_BUDGET = 1_500_000
+
+# Only needed by extras, and slow to import
+OPTIONAL_MODULES = ("matplotlib", "boto3", "mangum")
+
+
+def import_api(**environ):
+    """The modules importing the app loads, and how long it took"""
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            "import sys, metrolinkTimes.api; print(' '.join(sys.modules))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, **environ},
+    )
+    (took,) = re.findall(r"\|\s*(\d+) \| metrolinkTimes\.api$", result.stderr, re.M)
+    return set(result.stdout.split()), int(took)
+
+
+def test_api_import_skips_optional_dependencies():
+    """Extras aren't imported unless they're used"""
+    modules, _ = import_api()
+    assert not modules.intersection(OPTIONAL_MODULES)
+
+
+def test_worker_import_skips_graph():
+    """Workers serve the poller's snapshots, so don't import networkx"""
+    modules, _ = import_api(METROLINK_MODE="worker")
+    assert "networkx" not in modules
+    assert "metrolinkTimes.tramGraph" not in modules
+
+
+def test_api_import_within_budget():
+    """Importing the app stays within its budget"""
+    # The best of a few, so a busy machine doesn't fail it
+    took = min(import_api()[1] for _ in range(3))
+    assert took < API_IMPORT_BUDGET, f"Importing took {took / 1e6:.2f}s"
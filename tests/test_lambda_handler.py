@@ -0,0 +1,62 @@
+"""Tests for the Lambda handler's start up
+
+Each runs in a fresh interpreter, as importing the handler sets up the app
+for Lambda and what it imports is the point.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+
+def run_in_lambda(script, tmp_path):
+    subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=tmp_path,
+        env={
+            **os.environ,
+            "PYTHONPATH": str(ROOT),
+            "TFGM_API_KEY": "test-key",
+            "AWS_LAMBDA_FUNCTION_NAME": "metrolink-times",
+        },
+        check=True,
+    )
+
+
+def test_lambda_skips_graph_and_aws_imports(tmp_path):
+    """The handler imports neither the graph nor boto3, and passes the key on"""
+    run_in_lambda(
+        """
+import sys
+import metrolinkTimes.lambda_handler as handler
+assert not {"networkx", "matplotlib", "boto3"} & sys.modules.keys()
+assert handler.api.TramGraph is None
+assert handler.api.config["Ocp-Apim-Subscription-Key"] == "test-key"
+assert not handler.api.should_use_polling_mode()
+""",
+        tmp_path,
+    )
+
+
+def test_ssm_key_cached_until_ttl(tmp_path):
+    """The key from SSM is fetched once, then read from /tmp until it expires"""
+    run_in_lambda(
+        f"""
+import os
+import metrolinkTimes.lambda_handler as handler
+del os.environ["TFGM_API_KEY"]
+handler.SSM_KEY_CACHE = {str(tmp_path / "key.json")!r}
+fetches = []
+handler.fetch_tfgm_api_key = lambda: fetches.append(1) or f"key{{len(fetches)}}"
+
+assert handler.load_tfgm_api_key() == "key1"
+assert handler.load_tfgm_api_key() == "key1"
+assert len(fetches) == 1
+os.environ["TFGM_API_KEY_CACHE_TTL"] = "0"
+assert handler.load_tfgm_api_key() == "key2"
+""",
+        tmp_path,
+    )
@@ -0,0 +1,78 @@
+"""Tests for the per-cycle response cache"""
+
+from datetime import timedelta
+from types import SimpleNamespace
+
+from metrolinkTimes.responseCache import SELF_LINK, ResponseCache
+
+
+def snapshot(version):
+    return SimpleNamespace(version=version)
+
+
+def test_rendered_once_per_version():
+    """A response is only rendered again once a newer snapshot is published"""
+    renders = []
+
+    def render(snapshot, name):
+        renders.append((snapshot.version, name))
+        return {"name": name, "version": snapshot.version, "self": SELF_LINK}
+
+    cache = ResponseCache()
+    cache.register("test", render)
+
+    first = cache.get(snapshot(1), "test", "a", selfLink="/a?x=1")
+    assert first == b'{"name":"a","version":1,"self":"/a?x=1"}'
+    assert cache.get(snapshot(1), "test", "a", selfLink="/a") == (
+        b'{"name":"a","version":1,"self":"/a"}'
+    )
+    assert renders == [(1, "a")]
+
+    # Requests still holding an older snapshot don't throw away the newer
+    cache.get(snapshot(2), "test", "a", selfLink="/a")
+    cache.get(snapshot(1), "test", "a", selfLink="/a")
+    cache.get(snapshot(2), "test", "a", selfLink="/a")
+    assert renders == [(1, "a"), (2, "a"), (1, "a")]
+
+
+def test_warm_renders_what_was_served():
+    """warm() renders the last snapshot's responses for the next one"""
+    cache = ResponseCache()
+    cache.register("dwell", lambda snapshot: {"dwell": timedelta(seconds=30)})
+    cache.register(
+        "seconds", lambda snapshot: {"dwell": timedelta(seconds=30)}, "float"
+    )
+    assert cache.get(snapshot(1), "dwell") == b'{"dwell":"PT30S"}'
+    assert cache.get(snapshot(1), "seconds") == b'{"dwell":30.0}'
+
+    cache.warm(snapshot(2))
+    version, entries, _ = cache.current
+    assert version == 2
+    assert set(entries) == {("dwell",), ("seconds",)}
+
+
+def test_warm_drops_what_is_no_longer_asked_for():
+    """Responses nobody asked for since the last snapshot aren't warmed again"""
+    renders = []
+
+    def render(snapshot, since):
+        renders.append((snapshot.version, since))
+        return {"since": since}
+
+    cache = ResponseCache(maxEntries=2)
+    cache.register("changes", render)
+    for since in range(3):
+        cache.get(snapshot(1), "changes", since)
+    assert len(cache.current[1]) == 2
+
+    cache.warm(snapshot(2))
+    assert set(cache.current[1]) == {("changes", 0), ("changes", 1)}
+    # Full of what was warmed, so this isn't kept, but is warmed next time
+    cache.get(snapshot(2), "changes", 3)
+    assert ("changes", 3) not in cache.current[1]
+
+    # Only what was asked for from version 2 is rendered for version 3
+    renders.clear()
+    cache.warm(snapshot(3))
+    assert renders == [(3, 3)]
+    assert set(cache.current[1]) == {("changes", 3)}
@@ -0,0 +1,117 @@
+"""Tests for handing snapshots from the poller to what serves them"""
+
+import json
+
+import httpx
+import pytest
+
+from metrolinkTimes import api as api_module
+from metrolinkTimes.api import GraphUpdater, SnapshotFollower, TramGraph
+from metrolinkTimes.snapshotFormat import SNAPSHOT_FORMAT
+from metrolinkTimes.snapshotStore import (
+    FileSnapshotStore,
+    SnapshotStore,
+    SQLiteSnapshotStore,
+)
+from metrolinkTimes.tramRecords import UNSET
+from tests.replay import NetworkSimulator
+
+
+@pytest.mark.parametrize("store", [FileSnapshotStore, SQLiteSnapshotStore])
+def test_snapshot_round_trips(tmp_path, store):
+    """A published snapshot reads back equal, and only once per write"""
+    poller = GraphUpdater(TramGraph())
+    poller.store = store(tmp_path / "snapshot")
+    for body in NetworkSimulator(waves=1).payloads(4):
+        poller.process_raw(body)
+    snapshot = poller.graph.getSnapshot()
+
+    reader = store(tmp_path / "snapshot")
+    assert reader.read() is None
+    poller.publish()
+    published = reader.read()
+    assert reader.read() is None
+
+    assert published["epoch"] == poller.epoch
+    assert published["snapshot"].version == snapshot.version
+    assert published["snapshot"].platforms == snapshot.platforms
+    assert published["snapshot"] == snapshot
+    assert published["topology"] == poller.graph.topology
+    # Unset fields are still UNSET after decoding
+    assert any(
+        tram.departTime is UNSET
+        for platform in published["snapshot"].platforms.values()
+        for tram in platform.tramsHere
+    )
+
+    poller.publish()
+    assert reader.read() is not None
+    poller.executor.shutdown()
+
+
+def test_store_is_data_only():
+    """Snapshots are stored as JSON, and other formats are refused"""
+    poller = GraphUpdater(TramGraph())
+    poller.process_raw(next(NetworkSimulator(waves=1).payloads(1)))
+    poller.executor.shutdown()
+    published = {
+        "epoch": poller.epoch,
+        "snapshot": poller.graph.getSnapshot(),
+        "cycleStats": dict(poller.cycleStats),
+        "topology": poller.graph.topology,
+    }
+
+    encoded = json.loads(SnapshotStore.dumps(published))
+    assert encoded["format"] == SNAPSHOT_FORMAT
+
+    encoded["format"] = SNAPSHOT_FORMAT + 1
+    with pytest.raises(ValueError):
+        SnapshotStore.loads(json.dumps(encoded).encode())
+
+
+def test_follower_serves_poller_snapshot(tmp_path):
+    """A follower's graph serves what the poller's graph published"""
+    poller = GraphUpdater(TramGraph())
+    poller.store = SQLiteSnapshotStore(tmp_path / "snapshots.db")
+    follower = SnapshotFollower(SQLiteSnapshotStore(tmp_path / "snapshots.db"))
+    assert follower.follow() is None
+
+    for body in NetworkSimulator(waves=1).payloads(3):
+        poller.process_raw(body)
+        poller.publish()
+        assert follower.follow() is not None
+    assert follower.follow() is None
+
+    assert follower.epoch == poller.epoch
+    assert follower.graph.getNodes() == poller.graph.getNodes()
+    assert follower.graph.getLocalUpdateTime() == poller.graph.getLocalUpdateTime()
+    assert follower.graph.getNodePredictions() == poller.graph.getNodePredictions()
+    assert follower.maxAge(follower.graph.getSnapshot()) >= 0
+    poller.executor.shutdown()
+
+
+async def test_on_demand_serves_from_store(tmp_path, monkeypatch):
+    """On-demand instances with a store serve its predictions, not TfGM's"""
+    poller = GraphUpdater(TramGraph())
+    poller.store = SQLiteSnapshotStore(tmp_path / "snapshots.db")
+    for body in NetworkSimulator(waves=1).payloads(3):
+        poller.process_raw(body)
+    poller.publish()
+    poller.executor.shutdown()
+
+    monkeypatch.setenv("METROLINK_MODE", "lambda")
+    monkeypatch.setitem(api_module.config, "snapshot_backend", "sqlite")
+    monkeypatch.setitem(
+        api_module.config, "snapshot_file", str(tmp_path / "snapshots.db")
+    )
+    monkeypatch.setattr(api_module, "graph", None)
+    monkeypatch.setattr(api_module, "graph_updater", None)
+    monkeypatch.setattr(api_module, "tfgm_cache", None)
+
+    transport = httpx.ASGITransport(app=api_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/station/Piccadilly/")
+    assert response.status_code == 200
+    platforms = response.json()["platforms"]
+    # Predictions only come from the graph, never straight from TfGM
+    assert any("predictions" in tram for tram in platforms["9400ZZMAPIC1"]["trams"])
@@ -0,0 +1,54 @@
+"""Tests for the rolling statistics store"""
+
+from datetime import timedelta
+
+import pytest
+
+from metrolinkTimes.statsStore import StatsStore
+
+
+def seconds(*values):
+    return tuple(timedelta(seconds=value) for value in values)
+
+
+def test_window_keeps_most_recent_samples():
+    """Only the last window samples are kept and averaged"""
+    store = StatsStore(window=3)
+    for sample in seconds(10, 20, 30, 40, 50):
+        store.add("a", sample)
+
+    assert store.getSamples("a") == seconds(30, 40, 50)
+    assert store.getAverage("a") == timedelta(seconds=40)
+    assert store.getAverage("b") is None
+    assert store.getSamples("b") == ()
+
+
+def test_average_matches_summing_window():
+    """The running total gives the same average as summing the window"""
+    store = StatsStore()
+    samples = [timedelta(microseconds=value * 7919 % 100003) for value in range(50)]
+    for i, sample in enumerate(samples):
+        store.add("a", sample)
+        window = samples[max(0, i - 4) : i + 1]
+        assert store.getAverage("a") == sum(window, timedelta()) / len(window)
+
+
+def test_fallback_resolved_until_sample_lands():
+    """A key falls back in order, and picks up its own samples once it has any"""
+    store = StatsStore()
+    store.setFallbacks("a", ["b", "c"])
+    assert store.getResolvedAverage("a") == (None, False)
+
+    store.add("c", timedelta(seconds=30))
+    assert store.getResolvedAverage("a") == (timedelta(seconds=30), False)
+
+    store.add("b", timedelta(seconds=20))
+    assert store.getResolvedAverage("a") == (timedelta(seconds=20), False)
+
+    store.add("a", timedelta(seconds=10))
+    assert store.getResolvedAverage("a") == (timedelta(seconds=10), True)
+
+
+def test_invalid_window():
+    with pytest.raises(ValueError):
+        StatsStore(window=0)
@@ -0,0 +1,49 @@
+"""Tests for the per-client coalescing of streamed platform changes"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from metrolinkTimes.streamHub import StreamHub
+
+
+def snapshot(version, changed, platforms=("A", "B", "C")):
+    return SimpleNamespace(
+        version=version,
+        changed=frozenset(changed),
+        platforms=dict.fromkeys(platforms),
+    )
+
+
+async def test_slow_subscriber_gets_changes_coalesced():
+    """Changes published while a client isn't reading merge into one wakeup"""
+    hub = StreamHub()
+    subscriber = hub.subscribe({"A", "B"})
+    assert await subscriber.next(1) == {"A", "B"}
+
+    hub.publish(snapshot(1, {"A"}))
+    hub.publish(snapshot(2, {"C"}))
+    hub.publish(snapshot(3, {"B", "C"}))
+    assert await subscriber.next(1) == {"A", "B"}
+
+    # Nothing it subscribed to changed, so it isn't woken
+    hub.publish(snapshot(4, {"C"}))
+    with pytest.raises(asyncio.TimeoutError):
+        await subscriber.next(0.01)
+
+    hub.unsubscribe(subscriber)
+    hub.publish(snapshot(5, {"A"}))
+    assert not subscriber.pending
+
+
+async def test_missed_cycle_sends_everything():
+    """A gap in snapshot versions marks every subscribed platform changed"""
+    hub = StreamHub()
+    subscriber = hub.subscribe({"A", "B"})
+    await subscriber.next(1)
+
+    hub.publish(snapshot(1, {"A"}))
+    await subscriber.next(1)
+    hub.publish(snapshot(3, ()))
+    assert await subscriber.next(1) == {"A", "B"}
@@ -0,0 +1,204 @@
+"""Tests for the TfGM API client"""
+
+import asyncio
+import gzip
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpcore
+import pytest
+
+from metrolinkTimes.tfgmMetrolinksAPI import (
+    NOT_MODIFIED,
+    TFGMMetrolinksAPI,
+    TimedNetworkBackend,
+    Validators,
+)
+
+PLATFORM = {
+    "StationLocation": "Piccadilly",
+    "AtcoCode": "9400ZZMAPIC1",
+    "Dest0": "Bury",
+}
+ETAG = '"v1"'
+LAST_MODIFIED = "Mon, 01 Jan 2024 07:00:00 GMT"
+
+
+class MetrolinksHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delay = 0
+
+    def do_GET(self):
+        self.server.requests.append((self.client_address, dict(self.headers)))
+        if self.server.drops:
+            # Hang up without answering, as a server timing out a kept-alive
+            # connection would
+            self.server.drops -= 1
+            self.close_connection = True
+            return
+        time.sleep(self.delay)
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps({"value": [PLATFORM]}).encode()
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+        else:
+            self.send_response(200)
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def finish(self):
+        super().finish()
+        self.server.closed.append(self.client_address)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), MetrolinksHandler)
+    httpd.requests = []
+    httpd.closed = []
+    httpd.drops = 0
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def api(server, monkeypatch):
+    monkeypatch.setenv("TFGM_API_KEY", "test-key")
+    api = TFGMMetrolinksAPI()
+    api.conf["Ocp-Apim-Subscription-Key"] = "test-key"
+    api.baseURL = f"http://localhost:{server.server_address[1]}"
+    return api
+
+
+async def test_get_data_reuses_connection(api, server):
+    """Consecutive fetches share one kept-alive, gzip-compressed connection"""
+    for _ in range(3):
+        data = await api.getDataAsync()
+        assert data == {"Piccadilly": {"9400ZZMAPIC1": [PLATFORM]}}
+    await api.aclose()
+
+    clients = {client for client, _ in server.requests}
+    assert len(server.requests) == 3
+    assert len(clients) == 1
+    assert server.requests[0][1]["Accept-Encoding"] == "gzip"
+    assert server.requests[0][1]["Ocp-Apim-Subscription-Key"] == "test-key"
+
+
+async def test_get_data_records_timing(api):
+    """The first fetch reports connection phases, later ones reuse it"""
+    await api.getDataAsync()
+    assert not api.lastTiming["reused"]
+    # Plain HTTP, so there's no TLS handshake to time
+    for phase in ["dns", "connect", "ttfb", "body", "total"]:
+        assert api.lastTiming[phase] >= 0
+
+    await api.getDataAsync()
+    assert api.lastTiming["reused"]
+    assert "dns" not in api.lastTiming
+    await api.aclose()
+
+
+def test_get_data_from_script(api, server):
+    """Scripts without an event loop fetch through the same client"""
+    assert api.getData() == {"Piccadilly": {"9400ZZMAPIC1": [PLATFORM]}}
+    assert api.pool is None
+    assert len(server.requests) == 1
+
+
+def test_client_closed_on_loop_change(api, server):
+    """The client left behind by a finished event loop is shut down"""
+    asyncio.run(api.fetchRawAsync())
+    first = server.requests[0][0]
+    asyncio.run(api.fetchRawAsync())
+    asyncio.run(api.aclose())
+
+    deadline = time.monotonic() + 2
+    while len(server.closed) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert server.closed[0] == first
+    assert len(server.closed) == 2
+
+
+async def test_stale_connection_retried(api, server):
+    """A kept-alive connection dropped upstream is retried once on a new one"""
+    await api.getDataAsync()
+    server.drops = 1
+    assert await api.getDataAsync() == {"Piccadilly": {"9400ZZMAPIC1": [PLATFORM]}}
+    assert not api.lastTiming["reused"]
+    await api.aclose()
+
+    clients = [client for client, _ in server.requests]
+    assert len(clients) == 3
+    assert clients[0] == clients[1] != clients[2]
+
+
+async def test_get_data_timeout_not_retried(api, server, monkeypatch):
+    """A stalled upstream is abandoned after the read timeout, not retried"""
+    api.readTimeout = 0.2
+    await api.getDataAsync()
+    monkeypatch.setattr(MetrolinksHandler, "delay", 1)
+
+    start = time.monotonic()
+    assert await api.getDataAsync() is None
+    assert time.monotonic() - start < 0.9
+    assert len(server.requests) == 2
+    await api.aclose()
+
+
+async def test_connect_timeout_shared_across_addresses(monkeypatch):
+    """Every address tried shares one connect timeout, rather than each its own"""
+    backend = TimedNetworkBackend()
+    addresses = [f"192.0.2.{i}" for i in range(1, 4)]
+
+    async def getaddrinfo(host, port, **kwargs):
+        return [
+            (socket.AF_INET, socket.SOCK_STREAM, 0, "", (address, port))
+            for address in addresses
+        ]
+
+    async def stalledConnect(host, port, timeout=None, *args):
+        await asyncio.sleep(timeout)
+        raise httpcore.ConnectTimeout(f"Timed out connecting to {host}")
+
+    monkeypatch.setattr(asyncio.get_running_loop(), "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(backend.backend, "connect_tcp", stalledConnect)
+
+    start = time.monotonic()
+    with pytest.raises(httpcore.ConnectTimeout):
+        await backend.connect_tcp("api.tfgm.com", 443, timeout=0.3)
+    assert time.monotonic() - start < 0.6
+
+
+async def test_fetch_raw_async_conditional(api, server):
+    """Conditional fetches send the last validators and report a 304"""
+    body = json.dumps({"value": [PLATFORM]}).encode()
+
+    fetched = await api.fetchRawAsync(Validators(None, None))
+    assert fetched.body == body
+    assert fetched.validators == (ETAG, LAST_MODIFIED)
+    assert await api.fetchRawAsync(fetched.validators) is NOT_MODIFIED
+    assert (await api.fetchRawAsync()).body == body
+    await api.aclose()
+
+    sent = [headers for _, headers in server.requests]
+    assert "If-None-Match" not in sent[0]
+    assert sent[1]["If-Modified-Since"] == LAST_MODIFIED
+    assert "If-None-Match" not in sent[2]
@@ -0,0 +1,84 @@
+"""Tests for the on-demand TfGM data cache"""
+
+import asyncio
+
+from metrolinkTimes.tfgmCache import TfGMCache
+
+
+class FakeAPI:
+    """Returns a new dict per fetch, once release is set"""
+
+    def __init__(self):
+        self.fetches = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def getDataAsync(self):
+        self.fetches += 1
+        await self.release.wait()
+        return {"fetch": self.fetches}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def test_concurrent_requests_share_one_fetch():
+    """Requests arriving while a fetch is in flight wait on it, not upstream"""
+    api = FakeAPI()
+    api.release.clear()
+    cache = TfGMCache(api, clock=Clock())
+
+    waiting = [asyncio.create_task(cache.get()) for _ in range(10)]
+    await asyncio.sleep(0)
+    api.release.set()
+    results = await asyncio.gather(*waiting)
+
+    assert api.fetches == 1
+    assert all(result is results[0] for result in results)
+
+
+async def test_ttl_and_stale_while_revalidate():
+    """Fresh data is served as is, stale data while it's refreshed behind"""
+    api = FakeAPI()
+    clock = Clock()
+    cache = TfGMCache(api, ttl=5, staleWhileRevalidate=10, clock=clock)
+
+    first = await cache.get()
+    clock.now = 4
+    assert await cache.get() is first
+    assert api.fetches == 1
+
+    clock.now = 6
+    assert await cache.get() is first
+    await cache.inflight
+    assert api.fetches == 2
+    assert await cache.get() == {"fetch": 2}
+
+    # Too stale to serve, so the request waits for a fetch
+    clock.now = 30
+    assert await cache.get() == {"fetch": 3}
+
+
+async def test_failed_background_refresh_logged(caplog):
+    """A background refresh that fails is logged, and stale data still served"""
+    api = FakeAPI()
+    clock = Clock()
+    cache = TfGMCache(api, ttl=5, staleWhileRevalidate=10, clock=clock)
+    first = await cache.get()
+
+    async def failing():
+        raise ValueError("upstream broke")
+
+    api.getDataAsync = failing
+    clock.now = 6
+    assert await cache.get() is first
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+    assert "upstream broke" in caplog.text
+    assert await cache.get() is first
@@ -0,0 +1,76 @@
+"""Tests for decoding TfGM payloads once for every reader"""
+
+from metrolinkTimes.api import GraphUpdater, TramGraph
+from metrolinkTimes.tfgmMetrolinksAPI import TFGMMetrolinksAPI
+from metrolinkTimes.tfgmSnapshot import TfGMSnapshot, decodeMessage
+from tests.replay import NetworkSimulator
+
+
+def record(**fields):
+    pid = {
+        "Direction": "Incoming",
+        "MessageBoard": "<no message>",
+        "LastUpdated": "2024-01-01T07:00:00Z",
+    }
+    for i in range(4):
+        pid.update(
+            {f"Dest{i}": "", f"Carriages{i}": "", f"Status{i}": "", f"Wait{i}": ""}
+        )
+    pid.update(fields)
+    return pid
+
+
+def test_messages_and_destinations_normalized():
+    """Messages are cleaned up and destinations mapped as the updater does"""
+    assert decodeMessage("<no message>") is None
+    assert decodeMessage("^F0Next tram") is None
+    assert decodeMessage("Delays^$ expected") == "Delays expected"
+
+    pid = record(
+        Dest0="MCUK via Trafford Bar",
+        Carriages0="Single",
+        Status0="Due",
+        Wait0="3",
+        Dest1="Atlantis",
+        Carriages1="Double",
+        Status1="Due",
+        Wait1="9",
+    )
+    tfgm = TfGMSnapshot({"Cornbrook": {"9400ZZMACRN1": [pid]}})
+    platform = tfgm.getStation("Cornbrook")["9400ZZMACRN1"]
+
+    assert platform.message is None
+    assert platform.direction == "Incoming"
+    assert [(t.dest, t.via, t.wait) for t in platform.pidTrams] == [
+        ("MediaCityUK", "Trafford Bar", 3)
+    ]
+    assert tfgm.getStation("Atlantis") is None
+
+
+def test_malformed_records_skipped():
+    """A bad field drops its tram or platform, not the whole payload"""
+    badWait = record(Dest0="Bury", Wait0="soon", Dest1="Altrincham", Wait1="4")
+    del badWait["MessageBoard"]
+    noTime = record(LastUpdated=None)
+    tfgm = TfGMSnapshot(
+        {"Piccadilly": {"9400ZZMAPIC1": [badWait], "9400ZZMAPIC2": [noTime]}}
+    )
+    platforms = tfgm.getStation("Piccadilly")
+
+    assert platforms.keys() == {"9400ZZMAPIC1"}
+    assert platforms["9400ZZMAPIC1"].message is None
+    assert [t.dest for t in platforms["9400ZZMAPIC1"].pidTrams] == ["Altrincham"]
+
+
+def test_on_demand_matches_polling_pids():
+    """Both modes see the same trams on every platform of a payload"""
+    body = next(NetworkSimulator(waves=1).payloads(1))
+    updater = GraphUpdater(TramGraph())
+    updater.process_raw(body)
+    updater.executor.shutdown()
+
+    tfgm = TfGMSnapshot(TFGMMetrolinksAPI.parseData(body))
+    pids = updater.graph.getSnapshot().column("pidTrams")
+    for station, platforms in tfgm.stations.items():
+        for platformID, platform in platforms.items():
+            assert platform.pidTrams == pids[f"{station}_{platformID}"]
@@ -0,0 +1,161 @@
+"""Tests for the TramGraph pipeline"""
+
+import networkx as nx
+import pytest
+
+from metrolinkTimes.api import GraphUpdater, TramGraph
+from tests.replay import NetworkSimulator
+
+OUTPUTS = [
+    "predictedArrivals",
+    "tramsHere",
+    "tramsDeparted",
+    "tramsApproaching",
+]
+
+
+def graphState(graph):
+    snapshot = graph.getSnapshot()
+    nodes = {
+        n: {k: getattr(snapshot.platforms[n], k) for k in OUTPUTS}
+        for n in graph.getNodes()
+    }
+    edges = {e: graph.getTransit(*e) for e in graph.DG.edges}
+    return nodes, graph.getDwellTimes(), edges
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_incremental_matches_full(seed):
+    """Only reprocessing what changed gives the same outputs as a full cycle"""
+    incremental = GraphUpdater(TramGraph())
+    full = GraphUpdater(TramGraph(incremental=False))
+
+    for body in NetworkSimulator(seed=seed, waves=3).payloads(15):
+        incremental.process_raw(body)
+        full.process_raw(body)
+        assert graphState(incremental.graph) == graphState(full.graph)
+
+    incremental.executor.shutdown()
+    full.executor.shutdown()
+
+
+def test_unchanged_record_not_dirty():
+    """Re-reading an identical PID record doesn't mark its platform dirty"""
+    graph = TramGraph()
+    updater = GraphUpdater(graph)
+    updater.process_raw(next(NetworkSimulator().payloads(1)))
+    assert not graph.dirtyNodes
+
+    nodeID = next(iter(graph.getNodes()))
+    node = graph.state[nodeID]
+    pidTrams = list(node["pidTrams"])
+    assert not graph.updatePlatformPID(
+        nodeID, pidTrams, node["message"], node["updateTime"]
+    )
+    assert not graph.dirtyNodes
+
+    assert graph.updatePlatformPID(
+        nodeID, pidTrams, "Engineering works", node["updateTime"]
+    )
+    assert graph.dirtyNodes == {nodeID}
+    updater.executor.shutdown()
+
+
+def test_routes_match_astar():
+    """The routing table holds the same paths nx.astar_path finds"""
+    graph = TramGraph()
+    nodes = list(graph.getNodes())
+    for start in nodes[::7]:
+        for end in nodes[::5]:
+            try:
+                path = nx.astar_path(graph.DG, source=start, target=end)
+            except nx.NetworkXNoPath:
+                with pytest.raises(nx.NetworkXNoPath):
+                    graph.getRoute(start, end)
+                continue
+            assert graph.getRoute(start, end) == path
+
+
+def test_dest_platform_prefers_terminating_stop():
+    """Trams terminating at a station stop at its terminating platform"""
+    graph = TramGraph()
+    start = "Abraham Moss_9400ZZMAABM1"
+    assert graph.getDestPlatform(start, "Crumpsall") == "Crumpsall_9400ZZMACRU1"
+    assert (
+        graph.getDestPlatform(start, "Crumpsall", stopping=True)
+        == "Crumpsall_9400ZZMACRU3"
+    )
+
+
+def test_topology_indexes():
+    """The static indexes agree with the graph and can't be modified"""
+    graph = TramGraph()
+    for node in graph.getNodes():
+        station = graph.DG.nodes[node]["stationName"]
+        platform = graph.DG.nodes[node]["platformID"]
+        assert node in graph.stationNodes[station]
+        assert platform in graph.getStationPlatforms(station)
+        assert graph.getNode(station, platform) == node
+        assert graph.successorStations[node] == {
+            graph.DG.nodes[succ]["stationName"] for succ in graph.DG.succ[node]
+        }
+
+    assert graph.getNode("Piccadilly", "9400ZZMAUNKNOWN") is None
+    with pytest.raises(TypeError):
+        graph.stationNodes["Piccadilly"] = ()
+
+
+def test_snapshot_published_per_cycle():
+    """Each cycle publishes a new snapshot and leaves older ones as they were"""
+    updater = GraphUpdater(TramGraph())
+    payloads = NetworkSimulator(waves=3).payloads(4)
+    for body in [next(payloads), next(payloads)]:
+        updater.process_raw(body)
+
+    held = updater.graph.getSnapshot()
+    heldPredictions = {
+        n: [t.toDict() for t in p.predictedArrivals] for n, p in held.platforms.items()
+    }
+    for body in payloads:
+        updater.process_raw(body)
+    updater.executor.shutdown()
+
+    assert updater.graph.getSnapshot().version == held.version + 2
+    assert heldPredictions == {
+        n: [t.toDict() for t in p.predictedArrivals] for n, p in held.platforms.items()
+    }
+
+    platform = next(p for p in held.platforms.values() if p.tramsHere)
+    with pytest.raises(AttributeError):
+        platform.tramsHere[0].dest = "Bury"
+    with pytest.raises(TypeError):
+        platform.tramsHere[0].predictions["Bury_A"] = None
+
+
+def test_scoped_accessors_match_network():
+    """Node and station accessors return the same as the network-wide getters"""
+    updater = GraphUpdater(TramGraph())
+    for body in NetworkSimulator(waves=3).payloads(6):
+        updater.process_raw(body)
+    updater.executor.shutdown()
+    graph = updater.graph
+
+    starting = graph.getTramsStarting()
+    predictions = graph.getNodePredictions()
+    for node in graph.getNodes():
+        assert graph.getTramsStartingAt(node) == starting[node]
+        assert graph.getTramsHereAt(node) == graph.getTramsHeres()[node]
+        assert graph.getTramsDepartedAt(node) == graph.getTramsDeparteds()[node]
+        assert graph.getPredictionsAt(node) == predictions[node]
+        assert graph.getPredictionsAt(node, tramPredictions=False) == [
+            {k: v for k, v in tram.items() if k != "predictions"}
+            for tram in predictions[node]
+        ]
+        assert graph.getDwellTimesAt(node) == graph.getDwellTimes()[node]
+
+    for station in graph.getStations():
+        assert graph.getStationTramsStarting(station) == {
+            platID: starting[f"{station}_{platID}"]
+            for platID in graph.getStationPlatforms(station)
+        }
+    assert graph.getStationTramsStarting("Nowhere") == {}
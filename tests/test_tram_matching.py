@@ -0,0 +1,40 @@
+"""Tests for matching trams between snapshots"""
+
+from metrolinkTimes.tramMatching import TramBuckets
+from metrolinkTimes.tramRecords import Tram
+
+
+def tram(dest, carriages="Single", wait=0):
+    return Tram(dest, None, carriages, wait=wait)
+
+
+def test_take_first_in_order():
+    """Trams are taken in the order given, so none overtakes another"""
+    first = tram("Bury", wait=2)
+    second = tram("Bury", wait=5)
+    buckets = TramBuckets([tram("Altrincham"), first, tram("Bury", "Double"), second])
+
+    assert buckets.take(tram("Bury")) is first
+    assert buckets.take(tram("Bury")) is second
+    assert buckets.take(tram("Bury")) is None
+    assert buckets.take(tram("Eccles")) is None
+
+
+def test_take_accepted_only():
+    """Candidates the predicate rejects are skipped but stay available"""
+    early = tram("Bury", wait=2)
+    late = tram("Bury", wait=5)
+    buckets = TramBuckets([early, late])
+
+    assert buckets.take(tram("Bury"), lambda t: t.wait > 3) is late
+    assert buckets.take(tram("Bury"), lambda t: t.wait > 3) is None
+    assert buckets.remaining() == [early]
+
+
+def test_trams_left_unmarked():
+    """Matching doesn't write anything into the trams"""
+    trams = [tram("Bury"), tram("Bury")]
+    buckets = TramBuckets(trams)
+    buckets.take(tram("Bury"))
+
+    assert trams == [tram("Bury"), tram("Bury")]
@@ -0,0 +1,70 @@
+"""Tests for the tram record types"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from metrolinkTimes.tramGraph import TramGraph
+from metrolinkTimes.tramRecords import UNSET, PIDTram, PredictedArrival, Tram
+
+START = datetime(2024, 1, 1, 7, 0, 0)
+PLATFORM = "Piccadilly_9400ZZMAPIC1"
+
+
+def test_records_are_slotted():
+    """Records have fixed fields rather than a per-instance dict"""
+    tram = Tram("Bury", None, "Single")
+    with pytest.raises(AttributeError):
+        tram.matched = True
+    with pytest.raises(AttributeError):
+        PIDTram("Bury", None, "Single", "Due", 3).wait = 4
+
+
+def test_serialize_omits_unset_fields():
+    """Only fields a tram has reached are returned by the API"""
+    tram = Tram("Bury", "Market Street", "Double", wait=3)
+    assert tram.toDict() == {
+        "dest": "Bury",
+        "via": "Market Street",
+        "carriages": "Double",
+        "wait": 3,
+    }
+    assert tram.toDict(exclude=("wait",)) == {
+        "dest": "Bury",
+        "via": "Market Street",
+        "carriages": "Double",
+    }
+
+    predictions = {PLATFORM: START}
+    arrival = PredictedArrival(
+        "Bury", None, "Double", PLATFORM, "here", START, predictions
+    )
+    serialized = arrival.toDict()
+    assert serialized["curLoc"] == {"platform": PLATFORM, "status": "here"}
+    assert serialized["predictions"] == predictions
+    assert serialized["predictions"] is not predictions
+
+
+def test_tram_state_transitions():
+    """A tram gains its arrive, depart and dwell times as it passes through"""
+    graph = TramGraph()
+
+    def cycle(time, pidTrams):
+        for offset, node in enumerate(graph.getNodes()):
+            trams = pidTrams if node == PLATFORM else []
+            graph.updatePlatformPID(node, trams, None, time + timedelta(seconds=offset))
+        graph.processCycle()
+
+    due = PIDTram("Bury", None, "Single", "Due", 1)
+    arrived = PIDTram("Bury", None, "Single", "Arrived", 0)
+
+    cycle(START, [due])
+    cycle(START + timedelta(minutes=1), [arrived])
+    (tram,) = graph.state[PLATFORM]["tramsHere"]
+    assert tram.arriveTime is not UNSET
+    assert tram.departTime is UNSET
+
+    cycle(START + timedelta(minutes=2), [])
+    assert graph.state[PLATFORM]["tramsHere"] == []
+    assert tram.departTime - tram.arriveTime == tram.dwellTime == timedelta(minutes=1)
+    assert tram.wait is UNSET